@@ -0,0 +1,80 @@
+import sys
+import logging
+import argparse
+
+from benchmarks.suite import BASELINES_FILE, BENCHMARKS, DEFAULT_TOLERANCE, compare, read_baselines, \
+    run_benchmarks, write_baselines
+
+REGRESSION_ERROR = 104
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup and restore throughput benchmarks against generated rows')
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=1000000,
+        help='Number of generated rows every benchmark processes'
+    )
+    parser.add_argument(
+        '--benchmark',
+        choices=list(BENCHMARKS),
+        action='append',
+        default=None,
+        help='Benchmark to run, can be repeated, all benchmarks run by default'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of timed runs, the fastest one is reported'
+    )
+    parser.add_argument(
+        '--baselines',
+        default=BASELINES_FILE,
+        help='File with stored baselines'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help='Allowed share of throughput drop and peak memory growth against baseline'
+    )
+    parser.add_argument(
+        '--save-baselines',
+        action='store_true',
+        help='Store results as new baselines instead of comparing with them'
+    )
+    parser.add_argument(
+        '--log-level',
+        default='INFO',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+        help='Set the logging level'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Progress of benchmarked code would drown results
+    logging.getLogger('src').setLevel(logging.WARNING)
+
+    results = run_benchmarks(rows=args.rows, names=args.benchmark, repeat=args.repeat)
+    print(f'{"benchmark":<20}{"rows/s":>14}{"MB/s":>10}{"peak MB":>10}')
+    for name, result in results.items():
+        print(f'{name:<20}{result["rows_per_second"]:>14}{result["megabytes_per_second"]:>10}'
+              f'{result["peak_memory_mb"]:>10}')
+
+    if args.save_baselines:
+        write_baselines(results, path=args.baselines)
+        logger.info(f'Baselines saved into {args.baselines}')
+        return
+
+    regressions = compare(results, read_baselines(path=args.baselines), tolerance=args.tolerance)
+    for regression in regressions:
+        logger.error(regression)
+    if regressions:
+        sys.exit(REGRESSION_ERROR)
+
+
+if __name__ == '__main__':
+    main()
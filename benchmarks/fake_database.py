@@ -0,0 +1,143 @@
+import datetime
+import itertools
+import logging
+import re
+from typing import Iterator
+
+import pymysql
+from pymysql.constants import FIELD_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Columns of generated tables with their mysql type codes, reported in cursor description like a real server does
+COLUMNS = [
+    ('id', FIELD_TYPE.LONG),
+    ('name', FIELD_TYPE.VAR_STRING),
+    ('description', FIELD_TYPE.VAR_STRING),
+    ('picture', FIELD_TYPE.BLOB),
+    ('price', FIELD_TYPE.DOUBLE),
+    ('last_update', FIELD_TYPE.DATETIME),
+]
+NAMES = ['PENELOPE', 'NICK', "O'NEIL", 'JENNIFER', 'JOHNNY', 'BETTE', 'GRACE', 'Мирослава', 'ZERO\\CAGE']
+EPOCH = datetime.datetime(2006, 2, 15, 4, 34, 33)
+MAX_ALLOWED_PACKET = 64 * 1024 * 1024
+
+
+def generate_rows(rows: int, seed: int = 0) -> Iterator[tuple]:
+    """
+    Generates deterministic typed rows of benchmark table, every column has some NULL values
+    :param rows: number of rows
+    :param seed: offset making rows of different tables differ
+    :return: iterator of rows matching COLUMNS
+    """
+    for index in range(seed, seed + rows):
+        name = NAMES[index % len(NAMES)]
+        yield (
+            index + 1,
+            name,
+            None if index % 7 == 0 else f'{name} {index} with a longer description of the row',
+            None if index % 5 == 0 else index.to_bytes(8, 'little') * 4,
+            None if index % 11 == 0 else index * 0.25,
+            None if index % 13 == 0 else EPOCH + datetime.timedelta(seconds=index),
+        )
+
+
+def table_ddl(table: str) -> str:
+    """
+    Returns create table statement of generated table
+    :param table: table name
+    :return: sql code
+    """
+    return f"""CREATE TABLE `{table}` (
+  `id` int NOT NULL,
+  `name` varchar(45) NOT NULL,
+  `description` text,
+  `picture` blob,
+  `price` double DEFAULT NULL,
+  `last_update` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+
+class FakeCursor:
+    def __init__(self, connection: 'FakeConnection') -> None:
+        """
+        In-process cursor answering queries issued by mysql engine, table selects stream generated rows
+        :param connection: connection the cursor belongs to
+        """
+        self.connection = connection
+        self.description = None
+        self.rows = iter(())
+
+    def execute(self, query: str, args=None) -> int:
+        self.connection.executed_bytes += len(query)
+        self.connection.executed_queries += 1
+        self.description = None
+        self.rows = iter(())
+        select = re.match(r'\s*SELECT \* FROM `?(\w+)`?', query)
+        if select:
+            table = select.group(1)
+            self.description = [(name, type_code) for name, type_code in COLUMNS]
+            self.rows = generate_rows(rows=self.connection.tables[table], seed=list(self.connection.tables).index(table))
+        elif 'TABLE_ROWS' in query:
+            self.rows = iter([(table, rows, rows * 100) for table, rows in self.connection.tables.items()])
+        elif 'information_schema.TABLES' in query or query.startswith('SHOW FULL TABLES'):
+            self.rows = iter([(table,) for table in self.connection.tables])
+        elif query.startswith('SHOW CREATE TABLE'):
+            table = query.split('`')[1]
+            self.rows = iter([(table, table_ddl(table))])
+        elif query == 'SELECT @@max_allowed_packet':
+            self.rows = iter([(MAX_ALLOWED_PACKET,)])
+        return 0
+
+    def executemany(self, query: str, args) -> int:
+        count = 0
+        for _ in args:
+            count += 1
+        self.execute(query)
+        return count
+
+    def fetchone(self):
+        return next(self.rows, None)
+
+    def fetchmany(self, size: int) -> list:
+        return list(itertools.islice(self.rows, size))
+
+    def fetchall(self) -> list:
+        return list(self.rows)
+
+    def nextset(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        self.rows = iter(())
+
+
+class FakeConnection:
+    def __init__(self, tables: dict) -> None:
+        """
+        In-process stand-in for pymysql connection serving generated tables, counts executed sql
+        so restore throughput can be measured without a server
+        :param tables: number of generated rows by table name
+        """
+        self.tables = tables
+        self.executed_bytes = 0
+        self.executed_queries = 0
+
+    def cursor(self, cursor_class=None) -> FakeCursor:
+        return FakeCursor(self)
+
+    def literal(self, value) -> str:
+        return pymysql.converters.escape_item(value, 'utf8mb4')
+
+    def begin(self) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
@@ -4,9 +4,11 @@ import argparse
 
 import src.backup as backup
 import src.restore as restore
+import src.prune as prune
 
 BACKUP_ERROR = 101
 RESTORATION_ERROR = 102
+PRUNE_ERROR = 103
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +17,15 @@ def backup_controller(args):
     logger.debug(f'Parsed arguments: {args}')
     bk = backup.Backup(db_type=args.db_type, database_name=args.db, connection_string=args.connection_string,
                        table_name=args.table, op_type=args.type,
-                       is_save_multiple=args.save_multi, save_into=args.save_into)
+                       is_save_multiple=args.save_multi, save_into=args.save_into,
+                       batch_size=args.batch_size, data_format=args.format, jobs=args.jobs,
+                       rows_per_statement=args.rows_per_statement, bytes_per_statement=args.bytes_per_statement,
+                       incremental=args.incremental, watermark_column=args.watermark_column,
+                       decremental=args.decremental, chunked=args.chunked, skip_unchanged=args.skip_unchanged,
+                       compression=args.compress, compression_level=args.compress_level,
+                       compress_threads=args.compress_threads, metrics_into=args.metrics_into,
+                       pipeline_depth=args.pipeline_depth, format_threads=args.format_threads,
+                       split_rows=args.split_rows, page_rows=args.page_rows, resume=args.resume)
 
     return bk.backup_database()
 
@@ -24,10 +34,17 @@ def restore_controller(args):
     logger.debug(f'Parsed arguments: {args}')
     rs = restore.Restore(db_type=args.db_type, database_name=args.db, connection_string=args.connection_string,
                          file=args.file, backup_version=args.backup_version, restore_type=args.type,
-                         table_name=args.table)
+                         table_name=args.table, jobs=args.jobs, statements_per_batch=args.statements_per_batch,
+                         statements_per_commit=args.commit_every, resume=args.resume)
     return rs.restore_database()
 
 
+def prune_controller(args):
+    logger.debug(f'Parsed arguments: {args}')
+    pr = prune.Prune(db_type=args.db_type, database_name=args.db, file=args.file, keep=args.keep)
+    return pr.prune()
+
+
 def main():
     parser = argparse.ArgumentParser(description='Database Backup and Restore utility')
     subparsers = parser.add_subparsers(dest='command', help='commands')
@@ -71,6 +88,127 @@ def main():
         "--save-into",
         help="Specify in which folder save backup.",
     )
+    backup_parser.add_argument(
+        '--batch-size',
+        help='Number of rows fetched from the server per round trip.',
+        type=int,
+        default=1000
+    )
+    backup_parser.add_argument(
+        '--rows-per-statement',
+        help='Maximum number of rows in one INSERT statement.',
+        type=int,
+        default=None
+    )
+    backup_parser.add_argument(
+        '--bytes-per-statement',
+        help='Maximum size of one INSERT statement in bytes, defaults to 4 MiB, '
+             'never more than server max_allowed_packet for mysql and 16 MiB for postgresql.',
+        type=int,
+        default=None
+    )
+    backup_parser.add_argument(
+        '--format',
+        choices=['sql', 'copy', 'copy-binary', 'tsv', 'columnar'],
+        default='sql',
+        help='Format of table data files. copy and copy-binary use postgresql COPY, tsv uses mysql '
+             'LOAD DATA LOCAL INFILE, columnar is typed binary format of both databases, '
+             'bulk formats always save data into separate per-table files.'
+    )
+    backup_parser.add_argument(
+        '--jobs',
+        help='Number of tables dumped concurrently, each job uses its own connection '
+             'reading from the same consistent snapshot.',
+        type=int,
+        default=1
+    )
+    backup_parser.add_argument(
+        '--incremental',
+        help='Save only rows changed since previous incremental backup into separate per-table files, '
+             'the first incremental backup saves all rows.',
+        action='store_true'
+    )
+    backup_parser.add_argument(
+        '--watermark-column',
+        help='Column tracking changed rows for incremental backup, '
+             'tables without it use their auto increment column.',
+        default='last_update'
+    )
+    backup_parser.add_argument(
+        '--decremental',
+        help='Save full backup into separate files and keep in previous version only files '
+             'which differ from the new one.',
+        action='store_true'
+    )
+    backup_parser.add_argument(
+        '--chunked',
+        help='Store files split into content defined chunks shared by all versions, '
+             'version folder only holds manifest of chunks.',
+        action='store_true'
+    )
+    backup_parser.add_argument(
+        '--skip-unchanged',
+        help='Reuse data file of previous version for tables which server checksum did not change, '
+             'needs per-table data files (--save-multi, --decremental or bulk --format).',
+        action='store_true'
+    )
+    backup_parser.add_argument(
+        '--compress',
+        help='Compress backup files, zstd needs zstandard package. Restore detects compression by file suffix.',
+        choices=['gzip', 'lzma', 'zstd'],
+        action='store'
+    )
+    backup_parser.add_argument(
+        '--compress-level',
+        help='Compression level, default level of compression if not set',
+        type=int,
+        action='store'
+    )
+    backup_parser.add_argument(
+        '--compress-threads',
+        help='Number of threads compressing blocks of backup files, number of CPUs by default',
+        type=int,
+        action='store'
+    )
+    backup_parser.add_argument(
+        '--pipeline-depth',
+        help='Number of batches fetched and formatted ahead while writer thread writes previous data, '
+             '0 fetches, formats and writes table data one step after another.',
+        type=int,
+        default=2
+    )
+    backup_parser.add_argument(
+        '--format-threads',
+        help='Number of threads formatting fetched rows as sql values, formatting runs in writing thread '
+             'by default as extra threads only help on free-threaded python.',
+        type=int,
+        default=0
+    )
+    backup_parser.add_argument(
+        '--split-rows',
+        help='Tables estimated to have more rows are dumped in parts by ranges of integer primary key '
+             'into numbered data files, parts are dumped concurrently with --jobs.',
+        type=int,
+        default=None
+    )
+    backup_parser.add_argument(
+        '--page-rows',
+        help='Read tables with primary key in key order by pages of this many rows, every page is a separate '
+             'query continuing after the last key, so restored rows arrive in clustered index order.',
+        type=int,
+        default=None
+    )
+    backup_parser.add_argument(
+        '--resume',
+        help='Continue newest interrupted backup from its checkpoint journal, data files it completed are kept.',
+        action='store_true'
+    )
+    backup_parser.add_argument(
+        '--metrics-into',
+        help='Folder receiving {db}-{db_type}.json and .prom (Prometheus textfile collector) metrics of the run',
+        action='store',
+        default=None
+    )
 
     restore_parser = subparsers.add_parser('restore', help='Restore database')
     restore_parser.add_argument(
@@ -109,6 +247,54 @@ def main():
         help='Table to restore.',
         action='store'
     )
+    restore_parser.add_argument(
+        '--jobs',
+        help='Number of tables which data is loaded concurrently, '
+             'tables wait for tables they reference with foreign keys.',
+        type=int,
+        default=1
+    )
+    restore_parser.add_argument(
+        '--statements-per-batch',
+        help='Number of statements sent to the server in one round trip.',
+        type=int,
+        default=50
+    )
+    restore_parser.add_argument(
+        '--commit-every',
+        help='Number of executed statements after which transaction is committed.',
+        type=int,
+        default=1000
+    )
+    restore_parser.add_argument(
+        '--resume',
+        help='Continue interrupted restore of the version from its checkpoint journal, restored files '
+             'and committed statements are skipped.',
+        action='store_true'
+    )
+
+    prune_parser = subparsers.add_parser('prune', help='Remove old backup versions and unreferenced chunks')
+    prune_parser.add_argument(
+        '--db',
+        required=True,
+        help='Database name',
+        action='store'
+    )
+    prune_parser.add_argument(
+        '--db-type',
+        required=True,
+        action='store'
+    )
+    prune_parser.add_argument(
+        '--file',
+        help='Folder holding backup versions.',
+    )
+    prune_parser.add_argument(
+        '--keep',
+        help='Number of newest versions to keep, versions they are restored from are kept too.',
+        type=int,
+        default=None
+    )
 
     parser.add_argument(
         '-v', '--verbose',
@@ -147,6 +333,14 @@ def main():
             logger.error(e)
             sys.exit(RESTORATION_ERROR)
 
+    elif args.command == 'prune':
+        logger.info('Starting prune process')
+        try:
+            print(prune_controller(args))
+        except Exception as e:
+            logger.error(e)
+            sys.exit(PRUNE_ERROR)
+
 
 
 if __name__ == '__main__':
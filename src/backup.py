@@ -1,18 +1,48 @@
+import io
+import math
 import os
 from datetime import datetime
 import logging
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TextIO
 
+from src.checkpoint import BACKUP_CHECKPOINT, Checkpoint
+from src.chunk_store import CHUNKS_FOLDER, ChunkStore, ChunkWriter
+from src.compression import COMPRESSIONS, ParallelCompressor, available_compressions
+from src.manifest import MANIFEST_FILE, DigestWriter, read_manifest, write_manifest, list_versions, files_equal, \
+    version_paths
+from src.models.database import DATA_EXTENSIONS
 from src.models import mysql_database as mysql
 from src.models import postgresql_database as postgresql
+from src.pipeline import BackgroundWriter
+from src.pool import ConnectionPool
+from src.progress import Progress, format_duration, format_size, write_metrics
+from src.scheduler import dependency_order
 
 logger = logging.getLogger(__name__)
 
+# Size of write buffer of backup files
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Size of write buffer with pipeline, one full buffer is written by writer thread while the next one is filled,
+# so file takes two buffers and smaller ones keep memory of pipelined backup near sequential one
+PIPELINE_WRITE_BUFFER_SIZE = 256 * 1024
+
 
 class Backup:
 
     def __init__(self, db_type: str, database_name: str, connection_string: str, table_name: str = None,
                  op_type: str = None,
-                 is_save_multiple: bool = False, save_into: str = None) -> None:
+                 is_save_multiple: bool = False, save_into: str = None, batch_size: int = 1000,
+                 data_format: str = 'sql', jobs: int = 1, rows_per_statement: int = None,
+                 bytes_per_statement: int = None, incremental: bool = False,
+                 watermark_column: str = 'last_update', decremental: bool = False,
+                 chunked: bool = False, skip_unchanged: bool = False, compression: str = None,
+                 compression_level: int = None, compress_threads: int = None, metrics_into: str = None,
+                 pipeline_depth: int = 2, format_threads: int = 0, split_rows: int = None,
+                 page_rows: int = None, resume: bool = False) -> None:
         self.db_type = db_type
         self.database_name = database_name
         self.connection_string = connection_string
@@ -20,6 +50,67 @@ class Backup:
         self.op_type = op_type
         self.is_save_multiple = is_save_multiple
         self.save_into = save_into
+        self.batch_size = batch_size
+        self.data_format = data_format
+        self.jobs = jobs
+        self.rows_per_statement = rows_per_statement
+        self.bytes_per_statement = bytes_per_statement
+        self.incremental = incremental
+        self.watermark_column = watermark_column
+        self.decremental = decremental
+        self.chunked = chunked
+        self.skip_unchanged = skip_unchanged
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compress_threads = compress_threads or os.cpu_count() or 1
+        self.compress_executor = None
+        self.metrics_into = metrics_into
+        # Table data is fetched, formatted and written by separate threads passing up to pipeline_depth
+        # batches or writes through bounded queues, 0 runs the stages one after another
+        self.pipeline_depth = pipeline_depth
+        # Formatting is python code holding the GIL, format threads pay off only on free-threaded python
+        self.format_threads = format_threads
+        self.format_executor = None
+        # Tables estimated to have more rows are dumped as primary key ranges into numbered part files
+        self.split_rows = split_rows
+        # Tables with primary key are read in key order by keyset pages of page_rows rows
+        self.page_rows = page_rows
+        # Data files completed by interrupted run are kept when the run is resumed from its checkpoint journal
+        self.resume = resume
+        self.checkpoint = None
+        self.planned_parts = {}
+        self.completed_files = {}
+        # Rows of dumped tables are reported by every connection of the pool
+        self.progress = Progress()
+        # Chunk hashes of files written into chunk store by file name
+        self.chunk_files = {}
+        # Manifest entries of written files by file name without compression suffix
+        self.files = {}
+        # Table checksums of version being written and the previous version unchanged tables are taken from
+        self.checksums = {}
+        self.previous_version = None
+        self.previous_manifest = {}
+        self.previous_paths = {}
+        # Watermarks of version the incremental backup is based on and of the one being written
+        self.previous_watermarks = {}
+        self.watermarks = {}
+        engine = mysql.mysql if db_type == 'mysql' else postgresql.postgresql
+        if data_format not in engine.data_formats:
+            raise ValueError(f'{data_format} data format is not supported by {db_type}')
+        if incremental and (data_format != 'sql' or op_type == 'structure'):
+            raise ValueError('Incremental backup needs sql data format and table data')
+        if decremental and (incremental or op_type or table_name):
+            raise ValueError('Decremental backup covers whole database and can not be incremental')
+        if decremental and chunked:
+            raise ValueError('Chunked backup already shares unchanged data between versions')
+        if skip_unchanged and (incremental or not (is_save_multiple or decremental or data_format != 'sql')):
+            raise ValueError('Unchanged tables can be skipped only when every table has its own data file')
+        if split_rows and (incremental or skip_unchanged):
+            raise ValueError('Tables split into parts can not be backed up incrementally or skipped when unchanged')
+        if compression is not None and compression not in available_compressions():
+            raise ValueError(f'{compression} compression is not available, use one of {available_compressions()}')
+        # One connection for the run plus one per parallel job
+        self.pool = ConnectionPool(connect=self.connect, max_size=max(jobs, 1) + 1)
         if self.save_into is not None:
             if os.path.isdir(save_into):
                 os.makedirs(f"{save_into}-{db_type}", exist_ok=True)
@@ -34,141 +125,716 @@ class Backup:
         Writes sql code in files and operates backup format
         :return: Notification string
         """
-        now = datetime.now()
-        timestamp = int(now.timestamp())
-        save_into = f"{self.save_into}/{timestamp}"
+        version = self.find_interrupted_version() if self.resume else None
+        if version is None:
+            version = str(int(datetime.now().timestamp()))
+        save_into = f"{self.save_into}/{version}"
         os.makedirs(save_into, exist_ok=True)
+        self.checkpoint = Checkpoint(f'{save_into}/{BACKUP_CHECKPOINT}', resume=self.resume)
+        self.read_checkpoint()
+
+        if self.chunked:
+            self.chunk_store = ChunkStore(f'{self.save_into}/{CHUNKS_FOLDER}', compression=self.compression,
+                                          level=self.compression_level)
+        elif self.compression:
+            self.compress_executor = ThreadPoolExecutor(max_workers=self.compress_threads,
+                                                        thread_name_prefix='compress')
+        if self.pipeline_depth and self.format_threads:
+            self.format_executor = ThreadPoolExecutor(max_workers=self.format_threads, thread_name_prefix='format')
+        if self.skip_unchanged:
+            self.find_checksums_version(version=version)
+
+        try:
+            if self.op_type != 'structure':
+                with self.progress.phase('estimate'):
+                    self.estimate_tables()
+            with self.progress.phase('dump'):
+                result = self.backup_version(save_into=save_into)
+            with self.progress.phase('order'):
+                tables = self.table_order()
+        finally:
+            self.checkpoint.close()
+            self.pool.close()
+            if self.compress_executor is not None:
+                self.compress_executor.shutdown()
+            if self.format_executor is not None:
+                self.format_executor.shutdown()
+
+        metrics = self.progress.metrics()
+        logger.info(f'Backed up {metrics["rows"]} rows, {format_size(metrics["bytes"])} '
+                    f'in {format_duration(metrics["seconds"])}')
+
+        manifest = read_manifest(save_into) or {}
+        manifest['tables'] = tables
+        manifest['files'] = self.files
+        if self.compression:
+            manifest['compression'] = self.compression
+        if self.chunked:
+            manifest['chunks'] = self.chunk_files
+            logger.info(f'Stored {self.chunk_store.stored} new chunks, {self.chunk_store.reused} chunks '
+                        f'were already stored')
+        if self.skip_unchanged:
+            manifest['data_format'] = self.data_format
+            manifest['checksums'] = self.checksums
+        # Every version keeps metrics of the run which wrote it as history of table throughput
+        manifest['metrics'] = metrics
+        write_manifest(save_into, manifest)
+        if self.metrics_into is not None:
+            write_metrics(folder=self.metrics_into, name=f'{self.database_name}-{self.db_type}',
+                          metrics={**metrics, 'version': version, 'finished': int(datetime.now().timestamp())},
+                          labels={'database': self.database_name, 'db_type': self.db_type})
+        self.checkpoint.remove()
+        return result
+
+    def checkpoint_options(self) -> dict:
+        """
+        Returns options deciding which files backup writes and what they hold, interrupted run
+        is resumed only with the same options
+        :return: options
+        """
+        return {
+            'db_type': self.db_type,
+            'database': self.database_name,
+            'table': self.table_name,
+            'op_type': self.op_type,
+            'save_multiple': self.is_save_multiple,
+            'data_format': self.data_format,
+            'incremental': self.incremental,
+            'decremental': self.decremental,
+            'chunked': self.chunked,
+            'compression': self.compression,
+        }
+
+    def find_interrupted_version(self) -> str | None:
+        """
+        Finds newest version whose backup was interrupted, it still holds checkpoint journal
+        :return: version name or None
+        """
+        for version in reversed(list_versions(self.save_into)):
+            if os.path.isfile(f'{self.save_into}/{version}/{BACKUP_CHECKPOINT}'):
+                logger.info(f'Resuming interrupted backup version {version}')
+                return version
+        logger.info('No interrupted backup found, starting new version')
+        return None
+
+    def read_checkpoint(self) -> None:
+        """
+        Reads key ranges tables were split into and data files completed by interrupted run from checkpoint journal,
+        journal of new run starts with options of the run
+        """
+        records = self.checkpoint.records
+        if not records:
+            self.checkpoint.record({'options': self.checkpoint_options()})
+            return
+        if records[0].get('options') != self.checkpoint_options():
+            raise ValueError(f'Interrupted backup {self.checkpoint.path} was started with different options: '
+                             f'{records[0].get("options")}')
+        for record in records[1:]:
+            if 'key_ranges' in record:
+                self.planned_parts[record['table']] = record['key_ranges']
+            elif 'file' in record:
+                self.completed_files[record['file']] = record
+        logger.info(f'{len(self.completed_files)} data files were completed by interrupted run')
+
+    def checkpoint_file(self, name: str) -> None:
+        """
+        Records completed data file with its manifest entry and state of its table in checkpoint journal
+        :param name: file name without compression suffix
+        """
+        if self.checkpoint is None:
+            return
+        table = self.files[name]['table']
+        record = {'file': name, 'entry': self.files[name]}
+        if name in self.chunk_files:
+            record['chunks'] = self.chunk_files[name]
+        if table in self.watermarks:
+            record['watermark'] = self.watermarks[table]
+        if table in self.checksums:
+            record['checksum'] = self.checksums[table]
+        self.checkpoint.record(record)
+
+    def keep_completed_file(self, name: str) -> None:
+        """
+        Takes data file completed by interrupted run into version being written
+        :param name: file name without compression suffix
+        """
+        record = self.completed_files[name]
+        table = record['entry']['table']
+        self.files[name] = record['entry']
+        if 'chunks' in record:
+            self.chunk_files[name] = record['chunks']
+        if 'watermark' in record:
+            self.watermarks[table] = record['watermark']
+        if 'checksum' in record:
+            self.checksums[table] = record['checksum']
+        logger.info(f'{name} was completed by interrupted run')
+        self.finish_file(name=name)
+
+    def estimate_tables(self) -> None:
+        """
+        Reads estimated rows and sizes of backed up tables from server statistics, ETA of progress is based on them
+        """
+        try:
+            with self.pool.acquire() as db:
+                estimates = db.get_table_estimates()
+        except Exception as e:
+            logger.warning(f'Table statistics are not available, progress is shown without ETA: {e}')
+            return
+        if self.table_name:
+            estimates = {table: estimate for table, estimate in estimates.items() if table == self.table_name}
+        self.progress.estimates = estimates
+        logger.info(f'Backing up about {sum(estimate["rows"] for estimate in estimates.values())} rows, '
+                    f'{format_size(sum(estimate["bytes"] for estimate in estimates.values()))} '
+                    f'of {len(estimates)} tables')
+
+    def table_order(self) -> dict:
+        """
+        Orders tables of written files so referenced tables come first
+        :return: {'order': tables, 'foreign_keys': (table, referenced table) pairs}
+        """
+        tables = sorted({entry['table'] for entry in self.files.values() if entry['table']})
+        if len(tables) <= 1:
+            return {'order': tables, 'foreign_keys': []}
+        with self.pool.acquire() as db:
+            foreign_keys = [[table, referenced] for table, referenced in db.get_foreign_keys()
+                            if table in tables and referenced in tables]
+        return {'order': dependency_order(tables=tables, dependencies=foreign_keys), 'foreign_keys': foreign_keys}
+
+    def open_output(self, path: str, mode: str, kind: str, table: str = None):
+        """
+        Opens backup file for writing and records it in version manifest with its size and sha256,
+        with chunked storage the file is written into chunk store and only its chunk list is kept
+        in version manifest, with compression the file name gets suffix of compression and its blocks
+        are compressed on compression threads
+        :param path: path of file inside version folder
+        :param mode: w for text or wb for binary file
+        :param kind: ddl, dml, dcl for per-table files, structure, data or full for files of several tables
+        :param table: table the file belongs to
+        :return: file object
+        """
+        name = os.path.basename(path)
+        data_format = next(data_format for data_format, extension in DATA_EXTENSIONS.items()
+                           if name.endswith(f'.{extension}'))
+        entry = {'file': name, 'table': table, 'kind': kind, 'format': data_format, 'rows': None}
+        self.files[name] = entry
+
+        if self.chunked:
+            raw = ChunkWriter(store=self.chunk_store, on_close=partial(self.chunk_files.__setitem__, name))
+        elif self.compression:
+            entry['file'] = f'{name}.{COMPRESSIONS[self.compression]}'
+            raw = ParallelCompressor(sink=open(f'{path}.{COMPRESSIONS[self.compression]}', 'wb'),
+                                     compression=self.compression, level=self.compression_level,
+                                     executor=self.compress_executor, max_pending=self.compress_threads * 2,
+                                     on_close=entry.update)
+        else:
+            raw = open(path, 'wb')
+        buffer_size = WRITE_BUFFER_SIZE
+        if self.pipeline_depth:
+            buffer_size = PIPELINE_WRITE_BUFFER_SIZE
+            raw = BackgroundWriter(raw=raw, max_bytes=buffer_size, name=f'write-{name}')
+        buffered = io.BufferedWriter(DigestWriter(raw=raw, on_close=entry.update), buffer_size=buffer_size)
+        if mode == 'wb':
+            return buffered
+        return io.TextIOWrapper(buffered, encoding='utf-8')
+
+    def backup_version(self, save_into: str) -> str:
+        """
+        Writes backup files of one version
+        :param save_into: version folder the files are written to
+        :return: Notification string
+        """
+        if self.incremental:
+            return self.backup_incremental(save_into=save_into)
+        if self.decremental:
+            return self.backup_decremental(save_into=save_into)
 
         match self.op_type:
             case 'structure':
                 if self.table_name:
-                    with open(f'{save_into}/{self.table_name}.DDL.sql', 'w') as f:
+                    with self.open_output(f'{save_into}/{self.table_name}.DDL.sql', 'w', kind='ddl',
+                                          table=self.table_name) as f:
                         f.write(self.backup_table())
                     return f'Successfully backed up {self.table_name}\'s {self.op_type} from {self.database_name}!'
 
-                with open(f'{save_into}/{self.database_name}-structure.sql', 'w') as f:
-                    f.write(self.backup_structure())
+                name = f'{self.database_name}-structure.sql'
+                with self.open_output(f'{save_into}/{name}', 'w', kind='structure') as f:
+                    self.backup_structure(sink=f, on_section=self.section_recorder(sink=f, name=name, kind='ddl'))
 
                 return f'Successfully backed up {self.database_name}\'s {self.op_type}!'
 
             case 'data':
+                if self.data_format != 'sql':
+                    self.backup_data_bulk(save_into=save_into)
+                    if self.table_name:
+                        return f'Successfully backed up {self.table_name}\'s {self.op_type} from {self.database_name}!'
+                    return f'Successfully backed up {self.database_name}\'s {self.op_type}!'
+
                 if self.table_name:
-                    with open(f'{save_into}/{self.table_name}.DML.sql', 'w') as f:
-                        f.write(self.backup_table_data())
+                    with self.open_output(f'{save_into}/{self.table_name}.DML.sql', 'w', kind='dml',
+                                          table=self.table_name) as f:
+                        self.files[f'{self.table_name}.DML.sql']['rows'] = self.backup_table_data(sink=f)
+                    self.finish_file(name=f'{self.table_name}.DML.sql')
                     return f'Successfully backed up {self.table_name}\'s {self.op_type} from {self.database_name}!'
 
-                with open(f'{save_into}/{self.database_name}-data.sql', 'w') as f:
-                    f.write(self.backup_data())
+                name = f'{self.database_name}-data.sql'
+                with self.open_output(f'{save_into}/{name}', 'w', kind='data') as f:
+                    self.backup_data(sink=f, on_section=self.section_recorder(sink=f, name=name, kind='dml'))
 
                 return f'Successfully backed up {self.database_name}\'s {self.op_type}!'
 
             case _:
                 if self.is_save_multiple:
-                    sql_dict = self.backup_separate()
-                    for table, structure in sql_dict["ddl"].items():
-                        with open(f'{save_into}/{table}.DDL.sql', 'w') as f:
-                            f.write(structure)
-                    for table, structure in sql_dict["dcl"].items():
-                        with open(f'{save_into}/{table}.DCL.sql', 'w') as f:
-                            f.write(structure)
-                    for db, structure in sql_dict["dml"].items():
-                        with open(f'{save_into}/{db}.DML.sql', 'w') as f:
-                            f.write(structure)
+                    self.backup_separate(save_into=save_into)
                     return f'Successfully backed up {self.database_name}!'
 
                 else:
                     if self.table_name:
-                        result = f'{self.backup_table()}\n\n\n-- DATA --\n' + f'{self.backup_table_data()}'
-                        with open(f'{save_into}/{self.table_name}.sql', 'w') as f:
-                            f.write(result)
+                        with self.open_output(f'{save_into}/{self.table_name}.sql', 'w', kind='full',
+                                              table=self.table_name) as f:
+                            f.write(self.backup_table())
+                            if self.data_format == 'sql':
+                                f.write('\n\n\n-- DATA --\n')
+                                self.files[f'{self.table_name}.sql']['rows'] = self.backup_table_data(sink=f)
+                        if self.data_format == 'sql':
+                            self.finish_file(name=f'{self.table_name}.sql')
+                        if self.data_format != 'sql':
+                            self.backup_data_bulk(save_into=save_into)
 
                         return f'Successfully backed up {self.table_name} from {self.database_name}!'
 
-                    result = f'{self.backup_structure()}\n\n\n-- DATA --\n' + f'{self.backup_data()}'
-                    with open(f'{save_into}/{self.database_name}.sql', 'w') as f:
-                        f.write(result)
+                    name = f'{self.database_name}.sql'
+                    with self.open_output(f'{save_into}/{name}', 'w', kind='full') as f:
+                        self.backup_structure(sink=f, on_section=self.section_recorder(sink=f, name=name, kind='ddl'))
+                        if self.data_format == 'sql':
+                            f.write('\n\n\n-- DATA --\n')
+                            self.backup_data(sink=f, on_section=self.section_recorder(sink=f, name=name, kind='dml'))
+                    if self.data_format != 'sql':
+                        self.backup_data_bulk(save_into=save_into)
 
                     return f'Successfully backed up {self.database_name}!'
 
-    def backup_structure(self) -> str:
+    def backup_structure(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
         """
-        Connects to database and returns schema
-        :return: sql code
+        Writes database schema into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
         """
-        if self.db_type == 'mysql':
-            db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_database_structure()
+        with self.pool.acquire() as db:
+            db.get_database_structure(sink=sink, on_section=on_section)
 
-        elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_database_structure()
+    def backup_data(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
+        """
+        Writes database insert data into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
+        """
+        with self.pool.acquire() as db:
+            db.get_database_data(sink=sink, on_section=on_section)
 
-    def backup_data(self) -> str:
+    def section_recorder(self, sink: TextIO, name: str, kind: str) -> Callable[[str | None], None]:
         """
-        Connects to database and returns insert data
-        :return: sql code
+        Creates callback recording byte ranges of table sections written into file of several tables,
+        restore of one table reads only its ranges
+        :param sink: file object returned by open_output
+        :param name: file name
+        :param kind: ddl or dml
+        :return: function called with table name when its section starts and with None after the last section
         """
-        if self.db_type == 'mysql':
-            db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_database_data()
+        sections = self.files[name].setdefault('sections', {})
+        current = []
 
-        elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_database_data()
+        def on_section(table: str | None) -> None:
+            sink.flush()
+            offset = sink.buffer.tell()
+            if current:
+                sections.setdefault(current[0], {})[kind] = [current[1], offset]
+                if kind == 'dml':
+                    self.progress.finish_table(table=current[0], size=offset - current[1])
+            current[:] = [table, offset] if table is not None else []
+
+        return on_section
 
     def backup_table(self) -> str:
         """
-        Connects to database and returns table creation sql
+        Returns table creation sql
         :return: sql code
         """
-        if self.db_type == 'mysql':
-            db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name,
-                             table_name=self.table_name)
+        with self.pool.acquire() as db:
             return db.get_table()
 
-        elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_table()
+    def backup_table_data(self, sink: TextIO) -> int:
+        """
+        Writes table insert data into sink
+        :param sink: file-like object the sql code is written to
+        :return: number of written rows
+        """
+        with self.pool.acquire() as db:
+            return db.get_table_data(sink=sink)
 
-    def backup_table_data(self) -> str:
+    def backup_data_bulk(self, save_into: str) -> None:
         """
-        Connects to database and returns table insert data
-        :return: sql code
+        Writes table data into separate files in bulk load format,
+        bulk formats can not be mixed with sql code so every table always gets its own file
+        :param save_into: version folder the files are written to
+        """
+        with self.pool.acquire() as db:
+            tables = [self.table_name] if self.table_name else db.get_all_tables()
+            self.write_tables_data(db=db, save_into=save_into, tables=tables)
+
+    def connect(self):
+        """
+        Opens new connection to database
+        :return: database object
         """
         if self.db_type == 'mysql':
             db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name,
-                             table_name=self.table_name)
-            return db.get_table_data()
+                             table_name=self.table_name, batch_size=self.batch_size,
+                             rows_per_statement=self.rows_per_statement,
+                             bytes_per_statement=self.bytes_per_statement)
 
         elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name)
-            return db.get_table_data()
+            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name,
+                                       table_name=self.table_name, batch_size=self.batch_size,
+                                       rows_per_statement=self.rows_per_statement,
+                                       bytes_per_statement=self.bytes_per_statement)
+        db.on_rows = self.progress.advance
+        db.pipeline_depth = self.pipeline_depth
+        db.format_executor = self.format_executor
+        db.page_size = self.page_rows
+        return db
 
-    def backup_separate(self) -> dict:
+    def write_tables_data(self, db, save_into: str, tables: list,
+                          write_structure: Callable[[], None] = None) -> None:
         """
-        Connects to database and returns all sql data in comfortable format with separate sql code types (DDL, DML, DCL)
-        :return: dictionary of dictionaries {type}{table}[sql code]
+        Writes data files of tables, with more than one job tables and parts of split tables are dumped
+        concurrently by worker connections which all read from the snapshot exported by db
+        :param db: connected database object
+        :param save_into: version folder the files are written to
+        :param tables: tables to dump
+        :param write_structure: writes table DDL files with db, called while the snapshot is held
+            so the structure matches the dumped rows
         """
-        db = None
+        parts = []
+        for table in tables:
+            key_ranges = self.planned_parts.get(table)
+            if key_ranges is None:
+                key_ranges = self.split_table(db=db, table=table)
+                # Resumed run dumps remaining parts by the same ranges whatever current table statistics say
+                if self.checkpoint is not None:
+                    self.checkpoint.record({'table': table, 'key_ranges': key_ranges})
+            for part, key_range in enumerate(key_ranges, start=1):
+                part = part if len(key_ranges) > 1 else None
+                if self.data_file_name(table=table, part=part) in self.completed_files:
+                    self.keep_completed_file(name=self.data_file_name(table=table, part=part))
+                    continue
+                parts.append({'table': table, 'key_range': key_range, 'part': part})
 
-        if self.db_type == 'mysql':
-            db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name,
-                             table_name=self.table_name)
+        if self.jobs <= 1 or len(parts) <= 1:
+            if write_structure is not None:
+                write_structure()
+            for part in parts:
+                self.write_table_data(db=db, save_into=save_into, **part)
+            return
 
-        elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name,
-                                       table_name=self.table_name)
+        jobs = min(self.jobs, len(parts))
+        workers = queue.Queue()
+        snapshot = db.export_snapshot()
+        try:
+            for _ in range(jobs):
+                worker = self.pool.get()
+                workers.put(worker)
+                worker.start_snapshot(snapshot=snapshot)
+            # Postgresql reads DDL in the exported snapshot transaction, mysql global read lock blocks DDL
+            # until it is released, either way no ALTER can land between the structure and the rows
+            if write_structure is not None:
+                write_structure()
+        finally:
+            db.release_snapshot()
+        logger.info(f'Dumping {len(tables)} tables in {len(parts)} parts with {jobs} jobs')
 
-        tables = db.get_all_tables()
-        result = {
-            "ddl": {},
-            "dml": {},
-            "dcl": {}
-        }
+        def dump(part: dict) -> None:
+            worker = workers.get()
+            try:
+                self.write_table_data(db=worker, save_into=save_into, **part)
+            finally:
+                workers.put(worker)
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for future in [executor.submit(dump, part) for part in parts]:
+                    future.result()
+        finally:
+            while not workers.empty():
+                worker = workers.get()
+                worker.release_snapshot()
+                self.pool.put(worker)
+
+    def split_table(self, db, table: str) -> list:
+        """
+        Splits table estimated to have more than split_rows rows into ranges of its integer primary key,
+        first and last ranges are open so rows outside of current minimum and maximum are dumped too
+        :param db: connected database object
+        :param table: table name
+        :return: key ranges for get_table_data, [None] when table is dumped whole
+        """
+        estimated = self.progress.estimates.get(table, {}).get('rows') or 0
+        if not self.split_rows or estimated <= self.split_rows:
+            return [None]
+        key = db.get_key_range(table=table)
+        if key is None:
+            logger.info(f'{table} has no integer primary key, dumping it whole')
+            return [None]
+        parts = min(math.ceil(estimated / self.split_rows), key['max'] - key['min'] + 1)
+        if parts <= 1:
+            return [None]
+        step = math.ceil((key['max'] - key['min'] + 1) / parts)
+        bounds = [key['min'] + step * index for index in range(1, parts)]
+        logger.info(f'Splitting {table} into {parts} parts by {key["column"]}')
+        return [{'column': key['column'], 'start': start, 'end': end}
+                for start, end in zip([None] + bounds, bounds + [None])]
+
+    def write_table_data(self, db, save_into: str, table: str, key_range: dict = None, part: int = None) -> None:
+        """
+        Writes one table data file in selected data format, part of split table gets numbered file
+        {table}.DML.{part}.{extension} which restore loads as data of the table
+        :param db: connected database object
+        :param save_into: version folder the file is written to
+        :param table: table to dump
+        :param key_range: primary key range of the part
+        :param part: number of the part
+        """
+        if self.skip_unchanged and self.reuse_unchanged(db=db, save_into=save_into, table=table):
+            self.checkpoint_file(name=self.data_file_name(table=table))
+            return
+        name = self.data_file_name(table=table, part=part)
+        if self.incremental:
+            since = self.record_watermark(db=db, table=table)
+            with self.open_output(f'{save_into}/{name}', 'w', kind='dml', table=table) as f:
+                rows = db.get_table_data(sink=f, custom_table=table, since=since, upsert=True)
+        elif self.data_format == 'sql':
+            with self.open_output(f'{save_into}/{name}', 'w', kind='dml', table=table) as f:
+                rows = db.get_table_data(sink=f, custom_table=table, key_range=key_range)
+        else:
+            with self.open_output(f'{save_into}/{name}', 'wb', kind='dml', table=table) as f:
+                rows = db.get_table_data_bulk(sink=f, custom_table=table, data_format=self.data_format,
+                                              key_range=key_range)
+        self.files[name]['rows'] = rows
+        if part is not None:
+            self.files[name].update({'part': part, 'key_range': key_range})
+        self.finish_file(name=name)
+        self.checkpoint_file(name=name)
 
+    def data_file_name(self, table: str, part: int = None) -> str:
+        """
+        Returns name of table data file written by write_table_data
+        :param table: table name
+        :param part: number of the part of split table
+        :return: file name without compression suffix
+        """
+        code = f'DML.{part:04d}' if part is not None else 'DML'
+        extension = 'sql' if self.incremental else DATA_EXTENSIONS[self.data_format]
+        return f'{table}.{code}.{extension}'
+
+    def finish_file(self, name: str) -> None:
+        """
+        Reports table data file as dumped to progress, rows of table parts are counted as they are fetched
+        :param name: file name without compression suffix
+        """
+        entry = self.files[name]
+        rows = entry['rows'] if 'part' not in entry else None
+        self.progress.finish_table(table=entry['table'], rows=rows, size=entry.get('bytes'))
+
+    def backup_separate(self, save_into: str) -> None:
+        """
+        Writes all sql data into separate files by sql code types (DDL, DML, DCL)
+        :param save_into: version folder the files are written to
+        """
+        with self.pool.acquire() as db:
+            tables = db.get_all_tables()
+            self.write_tables_data(db=db, save_into=save_into, tables=tables,
+                                   write_structure=partial(self.write_tables_structure, db=db,
+                                                           save_into=save_into, tables=tables))
+            with self.open_output(f'{save_into}/{self.database_name}.DCL.sql', 'w', kind='dcl') as f:
+                f.write(db.get_grants())
+
+    def write_tables_structure(self, db, save_into: str, tables: list) -> None:
+        """
+        Writes DDL file of every table
+        :param db: connected database object
+        :param save_into: version folder the files are written to
+        :param tables: tables to write
+        """
         for table in tables:
-            result["ddl"][table] = db.get_table(custom_table=table)
-            result["dml"][table] = db.get_table_data(custom_table=table)
-        result["dcl"][self.database_name] = db.get_grants()
+            with self.open_output(f'{save_into}/{table}.DDL.sql', 'w', kind='ddl', table=table) as f:
+                f.write(db.get_table(custom_table=table))
 
-        return result
+    def backup_incremental(self, save_into: str) -> str:
+        """
+        Writes tables into separate files with rows changed since previous incremental version,
+        the first incremental backup writes all rows and becomes base of the chain
+        :param save_into: version folder the files are written to
+        :return: Notification string
+        """
+        version = os.path.basename(save_into)
+        base = self.find_base_version(version=version)
+        if base is not None:
+            self.previous_watermarks = read_manifest(f'{self.save_into}/{base}')['watermarks']
+            logger.info(f'Backing up changes since version {base}')
+        else:
+            logger.info('No previous incremental version found, backing up all rows')
+
+        with self.pool.acquire() as db:
+            tables = [self.table_name] if self.table_name else db.get_all_tables()
+            write_structure = None
+            if self.op_type != 'data':
+                write_structure = partial(self.write_tables_structure, db=db, save_into=save_into, tables=tables)
+            self.write_tables_data(db=db, save_into=save_into, tables=tables, write_structure=write_structure)
+            if self.op_type != 'data' and not self.table_name:
+                with self.open_output(f'{save_into}/{self.database_name}.DCL.sql', 'w', kind='dcl') as f:
+                    f.write(db.get_grants())
+
+        write_manifest(save_into, {
+            'type': 'incremental' if base is not None else 'full',
+            'base': base,
+            'table': self.table_name,
+            'op_type': self.op_type,
+            'watermarks': self.watermarks,
+        })
+        if base is not None:
+            return f'Successfully backed up changes of {self.database_name} since version {base}!'
+        return f'Successfully backed up {self.database_name}!'
+
+    def find_base_version(self, version: str) -> str | None:
+        """
+        Finds newest version written by incremental backup of the same tables
+        :param version: version being written
+        :return: version name or None
+        """
+        for previous in reversed(list_versions(self.save_into)):
+            if previous == version:
+                continue
+            manifest = read_manifest(f'{self.save_into}/{previous}')
+            if manifest and 'watermarks' in manifest and manifest.get('table') == self.table_name \
+                    and manifest.get('op_type') == self.op_type:
+                return previous
+        return None
+
+    def record_watermark(self, db, table: str) -> dict | None:
+        """
+        Reads current watermark of table before its data is dumped, rows changed while dumping
+        are dumped again by next incremental backup
+        :param db: connected database object
+        :param table: table name
+        :return: watermark of previous version to dump changes since, None to dump all rows
+        """
+        column = db.get_watermark_column(table=table, preferred=self.watermark_column)
+        if column is None:
+            logger.info(f'{table} has no watermark column, backing up all rows')
+            self.watermarks[table] = None
+            return None
+
+        self.watermarks[table] = {
+            'column': column[0],
+            'kind': column[1],
+            'value': db.get_watermark(table=table, column=column[0]),
+        }
+        previous = self.previous_watermarks.get(table)
+        if previous and previous['column'] == column[0] and previous['value'] is not None:
+            return previous
+        return None
+
+    def backup_decremental(self, save_into: str) -> str:
+        """
+        Writes full backup into separate files and rewrites previous newest version
+        as reverse delta keeping only files which differ from the new one
+        :param save_into: version folder the files are written to
+        :return: Notification string
+        """
+        version = os.path.basename(save_into)
+        self.backup_separate(save_into=save_into)
+        write_manifest(save_into, {'type': 'full', 'decremental': True})
+
+        for previous in reversed(list_versions(self.save_into)):
+            if previous == version:
+                continue
+            manifest = read_manifest(f'{self.save_into}/{previous}')
+            if manifest and manifest.get('decremental') and manifest['type'] == 'full':
+                self.rewrite_as_reverse_delta(version=previous, successor=version, manifest=manifest)
+            break
+        return f'Successfully backed up {self.database_name}!'
+
+    def rewrite_as_reverse_delta(self, version: str, successor: str, manifest: dict) -> None:
+        """
+        Removes files of version equal to files of its successor, restore reads them from the successor
+        :param version: full version becoming reverse delta
+        :param successor: newer full version
+        :param manifest: manifest of version
+        """
+        version_folder = f'{self.save_into}/{version}'
+        same_as = []
+        for name in sorted(os.listdir(version_folder)):
+            successor_file = f'{self.save_into}/{successor}/{name}'
+            if name != MANIFEST_FILE and os.path.isfile(successor_file) \
+                    and files_equal(f'{version_folder}/{name}', successor_file):
+                same_as.append(name)
+
+        manifest.update({'type': 'reverse-delta', 'successor': successor, 'same_as': same_as})
+        # Manifest is written first so an interrupted rewrite leaves files restorable
+        write_manifest(version_folder, manifest)
+        for name in same_as:
+            os.remove(f'{version_folder}/{name}')
+        logger.info(f'Version {version} keeps {len(os.listdir(version_folder)) - 1} changed files, '
+                    f'{len(same_as)} files are read from {successor}')
+
+    def find_checksums_version(self, version: str) -> None:
+        """
+        Finds newest version with table checksums saved in the same data format and compression
+        :param version: version being written
+        """
+        for previous in reversed(list_versions(self.save_into)):
+            manifest = read_manifest(f'{self.save_into}/{previous}')
+            if previous != version and manifest and 'checksums' in manifest \
+                    and manifest.get('data_format') == self.data_format \
+                    and (self.chunked or manifest.get('compression') == self.compression):
+                self.previous_version = previous
+                self.previous_manifest = manifest
+                self.previous_paths = version_paths(folder=self.save_into, version=previous)
+                logger.info(f'Comparing tables with version {previous}')
+                return
+
+    def reuse_unchanged(self, db, save_into: str, table: str) -> bool:
+        """
+        Reads table checksum before its data is dumped, when it equals checksum of previous version
+        data file of that version is hard linked (or its chunks referenced) instead of dumping the table
+        :param db: connected database object
+        :param save_into: version folder the file is written to
+        :param table: table name
+        :return: True if data file was reused
+        """
+        checksum = db.get_table_checksum(table=table)
+        self.checksums[table] = checksum
+        if checksum is None or self.previous_manifest.get('checksums', {}).get(table) != checksum:
+            return False
+
+        name = self.data_file_name(table=table)
+        file_name = name
+        if self.compression and not self.chunked:
+            file_name = f'{name}.{COMPRESSIONS[self.compression]}'
+        if self.chunked:
+            hashes = self.previous_manifest.get('chunks', {}).get(name)
+            if hashes is None:
+                return False
+            self.chunk_files[name] = hashes
+        else:
+            source = self.previous_paths.get(file_name)
+            if source is None or not os.path.isfile(source):
+                return False
+            try:
+                os.link(source, f'{save_into}/{file_name}')
+            except OSError:
+                shutil.copyfile(source, f'{save_into}/{file_name}')
+        previous_entry = self.previous_manifest.get('files', {}).get(name)
+        self.files[name] = dict(previous_entry or {'file': file_name, 'table': table, 'kind': 'dml',
+                                                   'format': self.data_format, 'rows': None})
+        logger.info(f'{table} is unchanged since version {self.previous_version}')
+        return True
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Journals are kept in version folder next to backup files, restore does not treat them as backup files
+CHECKPOINT_SUFFIX = '.checkpoint.jsonl'
+BACKUP_CHECKPOINT = f'backup{CHECKPOINT_SUFFIX}'
+
+
+def restore_checkpoint(database_name: str) -> str:
+    """
+    Returns file name of journal of restore into database
+    :param database_name: restored database
+    :return: file name
+    """
+    return f'restore-{database_name}{CHECKPOINT_SUFFIX}'
+
+
+def read_journal(path: str) -> list:
+    """
+    Reads complete records of journal without changing it, so journal of a running or interrupted
+    run may be read by other commands
+    :param path: path of journal file
+    :return: list of records, empty if journal does not exist
+    """
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+class Checkpoint:
+    def __init__(self, path: str, resume: bool = False) -> None:
+        """
+        Append only journal of work completed by a run, every record is one json line written and synced
+        before the run goes on, so an interrupted run can be resumed from the records. Last line of
+        interrupted run may be cut short and is ignored, the file is created by the first record
+        :param path: path of journal file
+        :param resume: read records of interrupted run, otherwise they are discarded
+        """
+        self.path = path
+        self.records = []
+        self.descriptor = None
+        self.lock = threading.Lock()
+        if os.path.isfile(path):
+            if resume:
+                self.records = self.read()
+                logger.info(f'Resuming from {len(self.records)} records of {path}')
+            else:
+                os.remove(path)
+
+    def read(self) -> list:
+        """
+        Reads records of journal, incomplete last record is cut off so new records follow complete ones
+        :return: list of records
+        """
+        records = []
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                if not line.endswith(b'\n'):
+                    records.pop()
+                    break
+                complete += len(line)
+        if complete < os.path.getsize(self.path):
+            logger.warning(f'Ignoring incomplete record of {self.path}')
+            os.truncate(self.path, complete)
+        return records
+
+    def record(self, record: dict) -> None:
+        """
+        Appends record to journal and syncs it to disk, records may be written from several threads
+        :param record: json serializable record, values json does not know are written as strings
+        """
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            if self.descriptor is None:
+                self.descriptor = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self.descriptor, line.encode('utf-8'))
+            os.fsync(self.descriptor)
+            self.records.append(json.loads(line))
+
+    def close(self) -> None:
+        """
+        Closes journal file keeping it for resume
+        """
+        with self.lock:
+            if self.descriptor is not None:
+                os.close(self.descriptor)
+                self.descriptor = None
+
+    def remove(self) -> None:
+        """
+        Removes journal once the run completed
+        """
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
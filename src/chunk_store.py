@@ -0,0 +1,213 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import time
+import zlib
+from typing import Callable
+
+from src.compression import COMPRESSIONS, DEFAULT_LEVELS, compress_block, decompress_block
+
+logger = logging.getLogger(__name__)
+
+# Folder of chunk store next to version folders
+CHUNKS_FOLDER = 'chunks'
+# Chunk boundaries are searched only after MIN_CHUNK bytes, chunk is cut after a line which hash
+# has the masked bits zero (about one of 2048 lines) or once it reaches MAX_CHUNK bytes
+MIN_CHUNK = 512 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+BOUNDARY_MASK = 0x7FF
+# Chunks written or reused more recently are never collected, protects backups running during prune
+GC_GRACE_SECONDS = 24 * 60 * 60
+
+
+class ChunkStore:
+    def __init__(self, folder: str, compression: str = None, level: int = None) -> None:
+        """
+        Stores chunks of backup files by sha256 of their contents so equal chunks are stored once
+        :param folder: folder holding chunks
+        :param compression: compression of newly stored chunks, chunk file name gets its suffix
+        :param level: compression level
+        """
+        self.folder = folder
+        self.compression = compression
+        self.level = level if level is not None or compression is None else DEFAULT_LEVELS[compression]
+        self.stored = 0
+        self.reused = 0
+
+    def path(self, digest: str, compression: str = None) -> str:
+        """
+        Returns path of chunk
+        :param digest: sha256 of chunk
+        :param compression: compression the chunk is stored with
+        :return: chunk file path
+        """
+        suffix = f'.{COMPRESSIONS[compression]}' if compression else ''
+        return f'{self.folder}/{digest[:2]}/{digest}{suffix}'
+
+    def find(self, digest: str) -> tuple | None:
+        """
+        Finds chunk stored with any compression
+        :param digest: sha256 of chunk
+        :return: (path, compression) or None if chunk is not stored
+        """
+        for compression in (self.compression, None, *COMPRESSIONS):
+            path = self.path(digest, compression)
+            if os.path.exists(path):
+                return path, compression
+        return None
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores chunk unless the same chunk is already stored
+        :param data: chunk contents
+        :return: sha256 of chunk
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        stored = self.find(digest)
+        if stored is not None:
+            # Marks chunk as used for garbage collection grace period
+            os.utime(stored[0])
+            self.reused += 1
+            return digest
+
+        path = self.path(digest, self.compression)
+        if self.compression:
+            data = compress_block(data, self.compression, self.level)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # Concurrent writers of the same chunk replace each other with identical file
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self.stored += 1
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """
+        Reads chunk
+        :param digest: sha256 of chunk
+        :return: chunk contents
+        """
+        stored = self.find(digest)
+        if stored is None:
+            raise FileNotFoundError(f'Chunk {digest} is missing in {self.folder}')
+        path, compression = stored
+        with open(path, 'rb') as f:
+            data = f.read()
+        return decompress_block(data, compression) if compression else data
+
+    def collect_garbage(self, referenced: set) -> int:
+        """
+        Removes chunks not referenced by any version
+        :param referenced: sha256 of chunks which are kept
+        :return: number of removed chunks
+        """
+        if not os.path.isdir(self.folder):
+            return 0
+        removed = 0
+        deadline = time.time() - GC_GRACE_SECONDS
+        for prefix in os.listdir(self.folder):
+            for name in os.listdir(f'{self.folder}/{prefix}'):
+                path = f'{self.folder}/{prefix}/{name}'
+                if name.split('.')[0] in referenced or os.path.getmtime(path) > deadline:
+                    continue
+                os.remove(path)
+                removed += 1
+        logger.info(f'Removed {removed} unreferenced chunks')
+        return removed
+
+
+class ChunkWriter(io.RawIOBase):
+    def __init__(self, store: ChunkStore, on_close: Callable[[list], None] = None) -> None:
+        """
+        Binary file-like object splitting written data into content defined chunks at line ends,
+        so rows inserted into a table only change chunks around them
+        :param store: chunk store the chunks are written to
+        :param on_close: function receiving list of chunk hashes when writer is closed
+        """
+        super().__init__()
+        self.store = store
+        self.on_close = on_close
+        self.buffer = bytearray()
+        self.hashes = []
+        # Offset in buffer up to which lines were already checked for boundary
+        self.scanned = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.cut_chunks()
+        return len(data)
+
+    def cut_chunks(self) -> None:
+        """
+        Stores every complete chunk of buffer and keeps the rest
+        """
+        start = 0
+        with memoryview(self.buffer) as view:
+            while len(self.buffer) - start >= MIN_CHUNK:
+                # Boundary search starts at the line holding MIN_CHUNK offset or where previous write stopped it
+                line_start = max(self.buffer.rfind(b'\n', start, start + MIN_CHUNK) + 1 or start + MIN_CHUNK,
+                                 start + self.scanned)
+                end = None
+                while end is None:
+                    line_end = self.buffer.find(b'\n', line_start, start + MAX_CHUNK)
+                    if line_end == -1:
+                        break
+                    line_end += 1
+                    if zlib.crc32(view[line_start:line_end]) & BOUNDARY_MASK == 0:
+                        end = line_end
+                    line_start = line_end
+                if end is None:
+                    if len(self.buffer) - start < MAX_CHUNK:
+                        self.scanned = line_start - start
+                        break
+                    end = start + MAX_CHUNK
+                self.hashes.append(self.store.put(view[start:end]))
+                self.scanned = 0
+                start = end
+        del self.buffer[:start]
+
+    def close(self) -> None:
+        if not self.closed:
+            if self.buffer:
+                self.hashes.append(self.store.put(bytes(self.buffer)))
+                self.buffer = bytearray()
+            if self.on_close is not None:
+                self.on_close(self.hashes)
+        super().close()
+
+
+class ChunkReader(io.RawIOBase):
+    def __init__(self, store: ChunkStore, hashes: list) -> None:
+        """
+        Binary file-like object reading file stored as chunks
+        :param store: chunk store
+        :param hashes: sha256 of file chunks in order
+        """
+        super().__init__()
+        self.store = store
+        self.hashes = list(hashes)
+        self.index = 0
+        self.chunk = b''
+        self.offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self.offset >= len(self.chunk):
+            if self.index >= len(self.hashes):
+                return 0
+            self.chunk = self.store.get(self.hashes[self.index])
+            self.index += 1
+            self.offset = 0
+        size = min(len(buffer), len(self.chunk) - self.offset)
+        buffer[:size] = self.chunk[self.offset:self.offset + size]
+        self.offset += size
+        return size
@@ -0,0 +1,306 @@
+import datetime
+import decimal
+import json
+import logging
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# File starts with magic and length prefixed json header holding column names,
+# every batch of fetched rows becomes a row group storing values column by column
+MAGIC = b'BDBCOL\x01\n'
+ROW_GROUP = struct.Struct('<I')
+COLUMN = struct.Struct('<BB')
+LENGTH = struct.Struct('<I')
+
+# Column encodings, fixed width columns keep values in little endian arrays, variable width columns keep
+# int64 end offsets followed by concatenated values, null values are marked in a validity bitmap (like Arrow)
+NULL, INT, FLOAT, BOOL, BYTES, TEXT, DECIMAL, DATETIME, DATE, TIME, TIMEDELTA, JSON, OTHER = range(13)
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_array(typecode: str, values: Iterable) -> array:
+    """
+    Packs values into little endian array
+    :param typecode: array type code
+    :param values: numbers
+    :return: array
+    """
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed
+
+
+def from_array(typecode: str, data: bytes) -> list:
+    """
+    Unpacks little endian array
+    :param typecode: array type code
+    :param data: packed numbers
+    :return: numbers
+    """
+    packed = array(typecode)
+    packed.frombytes(data)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def pack_variable(values: list) -> bytes:
+    """
+    Packs byte strings as end offsets followed by their concatenation
+    :param values: byte strings
+    :return: packed values
+    """
+    offsets = []
+    end = 0
+    for value in values:
+        end += len(value)
+        offsets.append(end)
+    return to_array('q', offsets).tobytes() + b''.join(values)
+
+
+def column_kind(value) -> int:
+    """
+    Chooses encoding of column by its first not null value
+    :param value: value fetched from cursor
+    :return: encoding code
+    """
+    if isinstance(value, bool):
+        return BOOL
+    if isinstance(value, int):
+        return INT
+    if isinstance(value, float):
+        return FLOAT
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return BYTES
+    if isinstance(value, str):
+        return TEXT
+    if isinstance(value, decimal.Decimal):
+        return DECIMAL
+    if isinstance(value, datetime.datetime):
+        return DATETIME if value.tzinfo is None else OTHER
+    if isinstance(value, datetime.date):
+        return DATE
+    if isinstance(value, datetime.time):
+        return TIME
+    if isinstance(value, datetime.timedelta):
+        return TIMEDELTA
+    if isinstance(value, dict):
+        return JSON
+    # postgresql arrays are fetched as lists, they are kept as array literals
+    return OTHER
+
+
+def encode_column(values: list, kind: int) -> bytes:
+    """
+    Encodes values of one column of row group, null values get placeholder
+    :param values: column values
+    :param kind: encoding code
+    :return: encoded values
+    """
+    if kind == INT:
+        return to_array('q', [0 if value is None else value for value in values]).tobytes()
+    if kind == FLOAT:
+        return to_array('d', [0.0 if value is None else value for value in values]).tobytes()
+    if kind == BOOL:
+        return bytes([value is True for value in values])
+    if kind == DATETIME:
+        return to_array('q', [0 if value is None else (value - EPOCH) // MICROSECOND for value in values]).tobytes()
+    if kind == DATE:
+        return to_array('i', [0 if value is None else value.toordinal() for value in values]).tobytes()
+    if kind == TIMEDELTA:
+        return to_array('q', [0 if value is None else value // MICROSECOND for value in values]).tobytes()
+    if kind == BYTES:
+        return pack_variable([b'' if value is None else bytes(value) for value in values])
+    if kind == TEXT:
+        return pack_variable([b'' if value is None else value.encode('utf-8') for value in values])
+    if kind == JSON:
+        return pack_variable([b'' if value is None else json.dumps(value).encode('utf-8') for value in values])
+    if kind == TIME:
+        return pack_variable([b'' if value is None else value.isoformat().encode('ascii') for value in values])
+    if kind == OTHER:
+        return pack_variable([b'' if value is None else format_other(value).encode('utf-8') for value in values])
+    return pack_variable([b'' if value is None else str(value).encode('ascii') for value in values])
+
+
+def format_other(value) -> str:
+    """
+    Formats value without own encoding the way server accepts it as text
+    :param value: value fetched from cursor
+    :return: text
+    """
+    if isinstance(value, (set, frozenset)):
+        return ','.join(sorted(value))
+    if isinstance(value, list):
+        return format_array(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+
+def format_array(values: list) -> str:
+    """
+    Formats postgresql array as array literal ('{1,2}'), elements are quoted so any element type
+    is parsed by the server as type of the column
+    :param values: array elements, nested lists for multidimensional arrays
+    :return: array literal
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append('NULL')
+        elif isinstance(value, list):
+            elements.append(format_array(value))
+        else:
+            elements.append('"' + format_other(value).replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
+
+
+def decode_column(data: bytes, kind: int, rows: int) -> list:
+    """
+    Decodes values of one column of row group
+    :param data: encoded values
+    :param kind: encoding code
+    :param rows: number of values
+    :return: column values
+    """
+    if kind == INT:
+        return from_array('q', data)
+    if kind == FLOAT:
+        return from_array('d', data)
+    if kind == BOOL:
+        return [value == 1 for value in data]
+    if kind == DATETIME:
+        return [EPOCH + datetime.timedelta(microseconds=value) for value in from_array('q', data)]
+    if kind == DATE:
+        return [datetime.date.fromordinal(max(value, 1)) for value in from_array('i', data)]
+    if kind == TIMEDELTA:
+        return [datetime.timedelta(microseconds=value) for value in from_array('q', data)]
+
+    ends = from_array('q', data[:rows * 8])
+    with memoryview(data) as view:
+        start = rows * 8
+        values = []
+        for end in ends:
+            values.append(view[start:rows * 8 + end])
+            start = rows * 8 + end
+        if kind == BYTES:
+            return [bytes(value) for value in values]
+        if kind == DECIMAL:
+            return [decimal.Decimal(str(value, 'ascii')) if value else None for value in values]
+        if kind == TIME:
+            return [datetime.time.fromisoformat(str(value, 'ascii')) if value else None for value in values]
+        return [str(value, 'utf-8') for value in values]
+
+
+def encode_row_group(rows: list, columns: int) -> bytes:
+    """
+    Encodes fetched rows column by column
+    :param rows: rows fetched from cursor
+    :param columns: number of columns
+    :return: encoded row group
+    """
+    parts = [ROW_GROUP.pack(len(rows))]
+    for values in zip(*rows) if rows else [() for _ in range(columns)]:
+        values = list(values)
+        kind = next((column_kind(value) for value in values if value is not None), NULL)
+        valid = [value is not None for value in values]
+        has_nulls = not all(valid)
+        data = b''
+        if kind != NULL:
+            try:
+                data = encode_column(values, kind)
+            except (TypeError, ValueError, OverflowError, AttributeError):
+                # Column mixing value types or integers wider than 64 bits keeps values as text
+                kind = OTHER
+                data = encode_column(values, kind)
+        parts.append(COLUMN.pack(kind, has_nulls))
+        if has_nulls and kind != NULL:
+            bitmap = bytearray((len(rows) + 7) // 8)
+            for index, is_valid in enumerate(valid):
+                if is_valid:
+                    bitmap[index >> 3] |= 1 << (index & 7)
+            parts.append(bytes(bitmap))
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def write_columnar(sink: BinaryIO, columns: list, batches: Iterable[list]) -> int:
+    """
+    Writes rows in typed columnar format, every batch becomes one row group
+    :param sink: binary file-like object the data is written to
+    :param columns: column names from cursor description
+    :param batches: iterator of row lists
+    :return: number of written rows
+    """
+    header = json.dumps({'columns': columns}).encode('utf-8')
+    sink.write(MAGIC + LENGTH.pack(len(header)) + header)
+    rows_count = 0
+    for rows in batches:
+        sink.write(encode_row_group(rows, len(columns)))
+        rows_count += len(rows)
+    return rows_count
+
+
+def read_exact(source: BinaryIO, size: int) -> bytes:
+    """
+    Reads exactly size bytes from source
+    :param source: binary file-like object
+    :param size: number of bytes
+    :return: data
+    """
+    data = source.read(size)
+    while len(data) < size:
+        more = source.read(size - len(data))
+        if not more:
+            raise ValueError(f'Columnar data ends {size - len(data)} bytes early')
+        data += more
+    return data
+
+
+def read_columnar(source: BinaryIO) -> tuple[list, Iterator[list]]:
+    """
+    Reads file written by write_columnar
+    :param source: binary file-like object
+    :return: column names and iterator of row lists, one per row group
+    """
+    if read_exact(source, len(MAGIC)) != MAGIC:
+        raise ValueError('Data is not in columnar format')
+    header = json.loads(read_exact(source, LENGTH.unpack(read_exact(source, LENGTH.size))[0]))
+    return header['columns'], read_row_groups(source, len(header['columns']))
+
+
+def read_row_groups(source: BinaryIO, columns: int) -> Iterator[list]:
+    """
+    Decodes row groups until end of source
+    :param source: binary file-like object positioned after header
+    :param columns: number of columns
+    :return: iterator of row lists
+    """
+    while True:
+        group_header = source.read(ROW_GROUP.size)
+        if not group_header:
+            return
+        rows = ROW_GROUP.unpack(group_header + read_exact(source, ROW_GROUP.size - len(group_header)))[0]
+        column_values = []
+        for _ in range(columns):
+            kind, has_nulls = COLUMN.unpack(read_exact(source, COLUMN.size))
+            bitmap = None
+            if has_nulls and kind != NULL:
+                bitmap = read_exact(source, (rows + 7) // 8)
+            data = read_exact(source, LENGTH.unpack(read_exact(source, LENGTH.size))[0])
+            if kind == NULL:
+                column_values.append([None] * rows)
+                continue
+            values = decode_column(data, kind, rows)
+            if bitmap is not None:
+                values = [value if bitmap[index >> 3] >> (index & 7) & 1 else None
+                          for index, value in enumerate(values)]
+            column_values.append(values)
+        yield list(zip(*column_values))
@@ -0,0 +1,193 @@
+import gzip
+import io
+import logging
+import lzma
+from collections import deque
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# File name suffixes of compressed files
+COMPRESSIONS = {
+    'gzip': 'gz',
+    'lzma': 'xz',
+    'zstd': 'zst',
+}
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'lzma': 6,
+    'zstd': 3,
+}
+# Data is compressed in independent blocks of this size so blocks can be compressed concurrently
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def available_compressions() -> list:
+    """
+    Returns compressions usable in current environment, zstd needs zstandard package
+    :return: compression names
+    """
+    return [compression for compression in COMPRESSIONS if compression != 'zstd' or zstandard is not None]
+
+
+def compression_of(path: str) -> str | None:
+    """
+    Detects compression of file by its name suffix
+    :param path: file path
+    :return: compression name or None for uncompressed file
+    """
+    suffix = path.rsplit('.', 1)[-1]
+    for compression, compression_suffix in COMPRESSIONS.items():
+        if suffix == compression_suffix:
+            return compression
+    return None
+
+
+def compress_block(data: bytes, compression: str, level: int) -> bytes:
+    """
+    Compresses block into a self-contained gzip member, xz stream or zstd frame,
+    concatenated blocks form a valid file of the format
+    :param data: block contents
+    :param compression: compression name
+    :param level: compression level
+    :return: compressed block
+    """
+    if compression == 'gzip':
+        # Fixed mtime keeps equal data compressed into equal bytes, so unchanged files can be compared
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == 'lzma':
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def decompress_block(data: bytes, compression: str) -> bytes:
+    """
+    Decompresses data compressed with compress_block
+    :param data: compressed data
+    :param compression: compression name
+    :return: block contents
+    """
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'lzma':
+        return lzma.decompress(data)
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def open_decompressed(path: str, compression: str, offset: int = 0) -> BinaryIO:
+    """
+    Opens compressed file for reading decompressed contents
+    :param path: file path
+    :param compression: compression name
+    :param offset: offset of compressed block decompression starts at
+    :return: binary file object
+    """
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError(f'zstandard package is needed to read {path}')
+    f = open(path, 'rb')
+    f.seek(offset)
+    if compression == 'gzip':
+        return CloseSource(gzip.GzipFile(fileobj=f, mode='rb'), f)
+    if compression == 'lzma':
+        return CloseSource(lzma.LZMAFile(f, 'rb'), f)
+    reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader)
+
+
+class CloseSource(io.BufferedReader):
+    def __init__(self, reader: BinaryIO, source: BinaryIO) -> None:
+        """
+        Buffered reader closing source file of decompressing reader together with it
+        :param reader: decompressing reader
+        :param source: compressed file
+        """
+        super().__init__(reader)
+        self.source = source
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.source.close()
+
+
+class ParallelCompressor(io.RawIOBase):
+    def __init__(self, sink: BinaryIO, compression: str, level: int = None, executor: Executor = None,
+                 max_pending: int = 0, block_size: int = BLOCK_SIZE,
+                 on_close: Callable[[dict], None] = None) -> None:
+        """
+        Binary file-like object compressing written data block by block on executor threads,
+        compressed blocks are written into sink in order
+        :param sink: binary file object receiving compressed data, closed together with compressor
+        :param compression: gzip, lzma or zstd
+        :param level: compression level, default level of compression if not set
+        :param executor: executor compressing blocks, blocks are compressed in writing thread without it
+        :param max_pending: number of blocks compressed at once before writer waits for the oldest one
+        :param block_size: size of independently compressed block
+        :param on_close: function receiving {'block_size': size, 'blocks': compressed sizes of blocks}
+            when compressor is closed, lets readers start decompression at any block
+        """
+        super().__init__()
+        self.sink = sink
+        self.compression = compression
+        self.level = level if level is not None else DEFAULT_LEVELS[compression]
+        self.executor = executor
+        self.max_pending = max_pending
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.on_close = on_close
+        self.pending = deque()
+        self.blocks = 0
+        self.compressed_sizes = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def submit(self, block: bytes) -> None:
+        """
+        Compresses block in background and writes blocks which are done
+        :param block: uncompressed block
+        """
+        self.blocks += 1
+        if self.executor is None:
+            self.write_block(compress_block(block, self.compression, self.level))
+            return
+        self.pending.append(self.executor.submit(compress_block, block, self.compression, self.level))
+        while len(self.pending) > self.max_pending:
+            self.write_block(self.pending.popleft().result())
+
+    def write_block(self, block: bytes) -> None:
+        """
+        Writes compressed block into sink
+        :param block: compressed block
+        """
+        self.sink.write(block)
+        self.compressed_sizes.append(len(block))
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                # Empty file still gets one block so it is a valid compressed file
+                if self.buffer or not self.blocks:
+                    self.submit(bytes(self.buffer))
+                    self.buffer = bytearray()
+                while self.pending:
+                    self.write_block(self.pending.popleft().result())
+            finally:
+                self.sink.close()
+            if self.on_close is not None:
+                self.on_close({'block_size': self.block_size, 'blocks': self.compressed_sizes})
+        super().close()
@@ -0,0 +1,180 @@
+import logging
+from typing import Callable, Iterable
+
+from src.models.database import DEFAULT_STATEMENT_BYTES, database
+
+logger = logging.getLogger(__name__)
+
+SAVEPOINT = 'restore_batch'
+# Statements are joined into one query up to this size, statements of half of it or bigger are sent
+# on their own right away, so a batch waiting for more statements never holds a big one and restore
+# holds only a few copies of the largest statement, statements written by backup are not bigger
+BATCH_BYTES = DEFAULT_STATEMENT_BYTES
+# Number of characters of statement encoded at once when its size is measured
+SIZE_PIECE = 64 * 1024
+
+
+def encoded_size(statement: str) -> int:
+    """
+    Returns size of statement encoded in utf-8, other than ascii statements are encoded piece by piece
+    so measuring does not make a whole copy of big statement
+    :param statement: sql statement
+    :return: size in bytes
+    """
+    if statement.isascii():
+        return len(statement)
+    return sum(len(statement[start:start + SIZE_PIECE].encode('utf-8'))
+               for start in range(0, len(statement), SIZE_PIECE))
+
+
+class StatementExecutor:
+    def __init__(self, db: database, statements_per_batch: int = 50, bytes_per_batch: int = None,
+                 statements_per_commit: int = 1000, bytes_per_commit: int = 64 * 1024 * 1024,
+                 on_commit: Callable[[int], None] = None) -> None:
+        """
+        Executes statements in batches sent in one round trip and commits every few batches,
+        every batch runs under a savepoint so a failing statement does not discard the others
+        :param db: connected database object
+        :param statements_per_batch: maximum number of statements sent in one round trip
+        :param bytes_per_batch: maximum size of one round trip, BATCH_BYTES or lower server statement size
+            limit by default, statements of half this size or bigger are executed one by one
+        :param statements_per_commit: number of statements after which transaction is committed
+        :param bytes_per_commit: number of executed bytes after which transaction is committed
+        :param on_commit: called after every commit with number of statements executed or failed so far
+        """
+        self.db = db
+        self.cursor = db.connection.cursor()
+        self.statements_per_batch = statements_per_batch
+        self.bytes_per_batch = bytes_per_batch or min(db.get_max_statement_size(), BATCH_BYTES)
+        self.statements_per_commit = statements_per_commit
+        self.bytes_per_commit = bytes_per_commit
+        self.on_commit = on_commit
+        self.uncommitted_statements = 0
+        self.uncommitted_bytes = 0
+        self.executed = 0
+        self.failed = 0
+
+    def run(self, statements: Iterable[str]) -> int:
+        """
+        Executes all statements and commits
+        :param statements: iterator of statements
+        :return: number of failed statements
+        """
+        batch = []
+        batch_bytes = 0
+        for statement in statements:
+            size = encoded_size(statement)
+            if self.db.unbatched_statement.match(statement):
+                self.execute(batch, batch_bytes)
+                batch, batch_bytes = [], 0
+                self.execute_alone(statement, size)
+            elif size * 2 >= self.bytes_per_batch:
+                self.execute(batch, batch_bytes)
+                batch, batch_bytes = [], 0
+                self.execute_large(statement, size)
+            else:
+                if batch and (len(batch) >= self.statements_per_batch or batch_bytes + size > self.bytes_per_batch):
+                    self.execute(batch, batch_bytes)
+                    batch, batch_bytes = [], 0
+                batch.append(statement)
+                batch_bytes += size
+            # Executed statement is released before the next one is read, two big statements are not held at once
+            del statement
+
+        self.execute(batch, batch_bytes)
+        self.commit()
+        logger.info(f'Executed {self.executed} statements, {self.failed} failed')
+        return self.failed
+
+    def execute(self, batch: list, batch_bytes: int) -> None:
+        """
+        Executes batch in one round trip, when it fails rolls it back and executes statements one by one
+        :param batch: list of statements
+        :param batch_bytes: size of statements
+        """
+        if not batch:
+            return
+        try:
+            self.db.execute_batch([f'SAVEPOINT {SAVEPOINT}'] + batch + [f'RELEASE SAVEPOINT {SAVEPOINT}'])
+            self.executed += len(batch)
+        except Exception as e:
+            logger.debug(f'Batch of {len(batch)} statements failed, executing one by one: {e}')
+            self.rollback_to_savepoint()
+            for statement in batch:
+                self.execute_isolated(statement)
+        self.count_uncommitted(len(batch), batch_bytes)
+
+    def execute_isolated(self, statement: str) -> None:
+        """
+        Executes one statement under savepoint, failure is logged and rolled back
+        :param statement: sql statement
+        """
+        try:
+            self.db.execute_batch([f'SAVEPOINT {SAVEPOINT}', statement, f'RELEASE SAVEPOINT {SAVEPOINT}'])
+            self.executed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f'Failed to execute {statement[:100]}: {e}')
+            self.rollback_to_savepoint()
+
+    def execute_large(self, statement: str, size: int) -> None:
+        """
+        Executes big statement under savepoint without joining it into one query with savepoint
+        statements, so the statement is not copied once more
+        :param statement: sql statement
+        :param size: size of statement
+        """
+        try:
+            self.cursor.execute(f'SAVEPOINT {SAVEPOINT}')
+            self.cursor.execute(statement)
+            self.cursor.execute(f'RELEASE SAVEPOINT {SAVEPOINT}')
+            self.executed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f'Failed to execute {statement[:100]}: {e}')
+            self.rollback_to_savepoint()
+        self.count_uncommitted(1, size)
+
+    def execute_alone(self, statement: str, size: int) -> None:
+        """
+        Executes statement which can not run under savepoint (transaction control, mysql DDL)
+        :param statement: sql statement
+        :param size: size of statement
+        """
+        try:
+            self.cursor.execute(statement)
+            self.executed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f'Failed to execute {statement[:100]}: {e}')
+        self.count_uncommitted(1, size)
+
+    def rollback_to_savepoint(self) -> None:
+        """
+        Rolls back statements executed after batch savepoint
+        """
+        try:
+            self.db.execute_batch([f'ROLLBACK TO SAVEPOINT {SAVEPOINT}', f'RELEASE SAVEPOINT {SAVEPOINT}'])
+        except Exception as e:
+            logger.warning(f'Failed to roll back to savepoint: {e}')
+
+    def count_uncommitted(self, statements: int, size: int) -> None:
+        """
+        Commits once enough statements or bytes were executed since last commit
+        :param statements: number of executed statements
+        :param size: size of executed statements
+        """
+        self.uncommitted_statements += statements
+        self.uncommitted_bytes += size
+        if self.uncommitted_statements >= self.statements_per_commit or self.uncommitted_bytes >= self.bytes_per_commit:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Commits transaction and reports statements processed so far
+        """
+        self.db.connection.commit()
+        self.uncommitted_statements = 0
+        self.uncommitted_bytes = 0
+        if self.on_commit is not None:
+            self.on_commit(self.executed + self.failed)
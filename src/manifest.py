@@ -0,0 +1,206 @@
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import BinaryIO, Callable
+
+from src.checkpoint import CHECKPOINT_SUFFIX
+from src.chunk_store import CHUNKS_FOLDER, ChunkStore, ChunkReader
+from src.compression import compression_of, open_decompressed
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def read_manifest(version_folder: str) -> dict | None:
+    """
+    Reads manifest of backup version
+    :param version_folder: folder of backup version
+    :return: manifest or None for versions written without one
+    """
+    path = os.path.join(version_folder, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(version_folder: str, manifest: dict) -> None:
+    """
+    Writes manifest of backup version
+    :param version_folder: folder of backup version
+    :param manifest: manifest data
+    """
+    with open(os.path.join(version_folder, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    logger.debug(f'Wrote manifest of {version_folder}')
+
+
+def version_key(name: str) -> tuple:
+    """
+    Sort key ordering versions named by timestamp numerically, other names after them
+    :param name: version name
+    :return: sort key
+    """
+    return not name.isdigit(), int(name) if name.isdigit() else 0, name
+
+
+def list_versions(folder: str) -> list:
+    """
+    Lists backup versions of folder from oldest to newest
+    :param folder: folder holding version folders named by timestamp
+    :return: version names
+    """
+    if not os.path.isdir(folder):
+        return []
+    versions = [name for name in os.listdir(folder)
+                if name != CHUNKS_FOLDER and os.path.isdir(os.path.join(folder, name))]
+    return sorted(versions, key=version_key)
+
+
+def version_paths(folder: str, version: str) -> dict:
+    """
+    Maps names of files belonging to backup version to their paths, files of reverse delta version
+    which equal files of its successor are resolved to the successor, files kept in chunk store
+    get path inside version folder which open_version_file understands
+    :param folder: folder holding version folders
+    :param version: version name
+    :return: dictionary of file name to path
+    """
+    version_folder = f'{folder}/{version}'
+    paths = {name: f'{version_folder}/{name}' for name in os.listdir(version_folder)
+             if name != MANIFEST_FILE and not name.endswith(CHECKPOINT_SUFFIX)}
+    manifest = read_manifest(version_folder)
+    for name in (manifest or {}).get('chunks', {}):
+        paths[name] = f'{version_folder}/{name}'
+    if manifest and manifest.get('same_as'):
+        successor_paths = version_paths(folder=folder, version=manifest['successor'])
+        for name in manifest['same_as']:
+            paths[name] = successor_paths[name]
+    return paths
+
+
+def files_equal(path: str, other_path: str) -> bool:
+    """
+    Compares contents of two files
+    :param path: first file
+    :param other_path: second file
+    :return: True if files have the same contents
+    """
+    if os.path.getsize(path) != os.path.getsize(other_path):
+        return False
+    return file_digest(path) == file_digest(other_path)
+
+
+def file_digest(path: str) -> str:
+    """
+    Computes sha256 of file contents without loading it into memory
+    :param path: file path
+    :return: hex digest
+    """
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def open_version_file(path: str, byte_range: list = None) -> BinaryIO:
+    """
+    Opens backup file for binary reading, files kept in chunk store are read chunk by chunk,
+    compressed files are decompressed while reading
+    :param path: path returned by version_paths
+    :param byte_range: [start, end) offsets of uncompressed contents to read instead of the whole file
+    :return: binary file object
+    """
+    version_folder, name = os.path.split(path)
+    manifest = read_manifest(version_folder)
+    start = byte_range[0] if byte_range else 0
+    if manifest and name in manifest.get('chunks', {}):
+        store = ChunkStore(f'{os.path.dirname(version_folder)}/{CHUNKS_FOLDER}')
+        f = io.BufferedReader(ChunkReader(store=store, hashes=manifest['chunks'][name]))
+    elif compression_of(path):
+        entry = next((entry for entry in (manifest or {}).get('files', {}).values() if entry['file'] == name), {})
+        skipped = 0
+        if 'blocks' in entry:
+            # Blocks are independent compressed streams, decompression starts at block holding start offset
+            first_block = start // entry['block_size']
+            skipped = first_block * entry['block_size']
+            f = open_decompressed(path, compression_of(path), offset=sum(entry['blocks'][:first_block]))
+        else:
+            f = open_decompressed(path, compression_of(path))
+        start -= skipped
+    else:
+        f = open(path, 'rb')
+        f.seek(start)
+        start = 0
+    if not byte_range:
+        return f
+    # Bytes before start which could not be skipped by seeking are read and dropped
+    while start:
+        skipped = f.read(min(start, 1024 * 1024))
+        if not skipped:
+            break
+        start -= len(skipped)
+    return io.BufferedReader(RangeReader(source=f, size=byte_range[1] - byte_range[0]))
+
+
+class DigestWriter(io.RawIOBase):
+    def __init__(self, raw: BinaryIO, on_close: Callable[[dict], None]) -> None:
+        """
+        Binary file-like object passing written data to raw writer while counting its size and sha256
+        :param raw: binary file object receiving data, closed together with digest writer
+        :param on_close: function receiving {'bytes': size, 'sha256': digest} when writer is closed
+        """
+        super().__init__()
+        self.raw = raw
+        self.on_close = on_close
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.size
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        self.raw.write(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self.raw.close()
+            finally:
+                self.on_close({'bytes': self.size, 'sha256': self.digest.hexdigest()})
+        super().close()
+
+
+class RangeReader(io.RawIOBase):
+    def __init__(self, source: BinaryIO, size: int) -> None:
+        """
+        Binary file-like object reading at most size bytes from source
+        :param source: binary file object positioned at start of range, closed together with range reader
+        :param size: size of range
+        """
+        super().__init__()
+        self.source = source
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        data = self.source.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.source.close()
+        super().close()
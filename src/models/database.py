@@ -1,7 +1,84 @@
+import logging
+import re
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import TextIO, BinaryIO, Callable, Iterable, Iterator
+
+from src.pipeline import ordered_map, prefetch
+
+logger = logging.getLogger(__name__)
+
+# File extensions of per-table data files by data format
+DATA_EXTENSIONS = {
+    'sql': 'sql',
+    'copy': 'copy',
+    'copy-binary': 'bin',
+    'tsv': 'tsv',
+    'columnar': 'col',
+}
+
+# Statement size limit used when server does not dictate one
+MAX_STATEMENT_BYTES = 16 * 1024 * 1024
+# Size of written INSERT statements unless set, server limit is only a ceiling as restore holds
+# a few copies of every statement in memory
+DEFAULT_STATEMENT_BYTES = 4 * 1024 * 1024
+
+# Rows changed since previous backup are selected with these comparisons against its watermark,
+# timestamps are compared inclusively as more rows may still get the same timestamp after backup
+WATERMARK_OPERATORS = {
+    'timestamp': '>=',
+    'sequence': '>',
+}
+
+# Whitespace and comments allowed before first keyword of a statement
+LEADING_COMMENTS = r'(?:\s+|--[^\n]*(?:\n|$)|#[^\n]*(?:\n|$)|/\*.*?\*/)*'
+TRANSACTION_CONTROL = r'BEGIN|START\s+TRANSACTION|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE|SET\s+(?:SESSION\s+)?AUTOCOMMIT'
+
+
+def statement_pattern(keywords: str) -> re.Pattern:
+    """
+    Compiles pattern matching statements starting with one of keywords
+    :param keywords: alternatives of regular expression
+    :return: compiled pattern
+    """
+    return re.compile(LEADING_COMMENTS + f'(?:{keywords})\\b', re.IGNORECASE | re.DOTALL)
+
+
+def fetch_batches(cursor, batch_size: int, on_batch: Callable[[int], None] = None) -> Iterator[list]:
+    """
+    Yields rows of executed query batch by batch
+    :param cursor: cursor with executed query
+    :param batch_size: number of rows fetched per round trip
+    :param on_batch: called with number of rows of every fetched batch
+    :return: iterator of row lists
+    """
+    rows = cursor.fetchmany(batch_size)
+    while rows:
+        if on_batch is not None:
+            on_batch(len(rows))
+        yield rows
+        rows = cursor.fetchmany(batch_size)
 
 
 class database(ABC):
+    data_formats = ['sql']
+    rows_per_statement = None
+    bytes_per_statement = None
+    statements_per_batch = 50
+    statements_per_commit = 1000
+    # Called with table name and number of rows of every batch fetched for a dump
+    on_rows = None
+    # Number of batches fetched ahead on background thread and formatted ahead on format_executor,
+    # 0 fetches, formats and writes batches one after another
+    pipeline_depth = 0
+    format_executor: Executor = None
+    # Rows of one keyset page, tables with primary key are read in its order page by page, None reads tables
+    # with one query in server order
+    page_size = None
+    # Quote of table and column names in generated queries
+    identifier_quote = ''
+    # Statements which end transaction and can not be executed under a savepoint
+    unbatched_statement = statement_pattern(TRANSACTION_CONTROL)
 
     @abstractmethod
     def __init__(self, database_name: str, connection_string: str) -> None:
@@ -11,13 +88,13 @@ class database(ABC):
         """Get all tables in the database."""
         pass
     @abstractmethod
-    def get_database_structure(self) -> str:
-        """Get database structure"""
+    def get_database_structure(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
+        """Write database structure into sink, on_section is called before every table and after the last one"""
         pass
 
     @abstractmethod
-    def get_database_data(self) -> str:
-        """Get database data"""
+    def get_database_data(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
+        """Write database data into sink, on_section is called before every table and after the last one"""
         pass
 
     @abstractmethod
@@ -26,16 +103,272 @@ class database(ABC):
         pass
 
     @abstractmethod
-    def get_table_data(self, custom_table: str) -> str:
-        """Get table structure with data"""
+    def get_table_data(self, sink: TextIO, custom_table: str, since: dict = None, upsert: bool = False,
+                       key_range: dict = None) -> int:
+        """Write table data (changed since watermark, inside key range) into sink, returns number of written rows"""
+        pass
+
+    @abstractmethod
+    def get_primary_key(self, table: str) -> list:
+        """Get primary key columns of table in key order"""
+        pass
+
+    @abstractmethod
+    def table_cursor(self, table: str, paged: bool):
+        """Create cursor reading dumped rows, rows of whole table are streamed while pages may be buffered"""
+        pass
+
+    @abstractmethod
+    def get_key_range(self, table: str) -> dict | None:
+        """Get single integer primary key column of table with its minimum and maximum value"""
+        pass
+
+    @abstractmethod
+    def get_watermark_column(self, table: str, preferred: str = None) -> tuple | None:
+        """Get (column, kind) tracking changed rows of table"""
+        pass
+
+    @abstractmethod
+    def get_watermark(self, table: str, column: str):
+        """Get current maximum value of watermark column"""
+        pass
+    @abstractmethod
+    def get_table_checksum(self, table: str) -> str | None:
+        """Get value which changes whenever table data changes"""
+        pass
+
+    @abstractmethod
+    def get_foreign_keys(self) -> list:
+        """Get (table, referenced table) pairs"""
+        pass
+
+    @abstractmethod
+    def get_table_estimates(self) -> dict:
+        """Get estimated rows and size of tables from server statistics"""
         pass
+
     @abstractmethod
     def get_grants(self) -> str:
         """Get grants"""
         pass
 
     @abstractmethod
-    def restore_database_sql(self, database_data) -> bool:
-        """Restore database structure"""
+    def restore_database_sql(self, sql: str | Iterable[str], on_commit: Callable[[int], None] = None) -> bool:
+        """Execute sql code or iterator of statements, on_commit gets number of committed statements of sql"""
+        pass
+
+    @abstractmethod
+    def execute_batch(self, statements: list) -> None:
+        """Execute list of statements in one round trip"""
+        pass
+
+    @abstractmethod
+    def export_snapshot(self) -> str | None:
+        """Freeze a consistent point in time other connections can join"""
+        pass
+
+    @abstractmethod
+    def start_snapshot(self, snapshot: str | None) -> None:
+        """Start reading from snapshot exported by another connection"""
+        pass
+
+    @abstractmethod
+    def release_snapshot(self) -> None:
+        """Release exported or joined snapshot"""
+        pass
+
+    def get_table_data_bulk(self, sink: BinaryIO, custom_table: str, data_format: str, key_range: dict = None) -> int:
+        """Write table data (inside key range) into binary sink in a bulk load format"""
+        raise ValueError(f'{data_format} data format is not supported by {type(self).__name__}')
+
+    def restore_table_data_bulk(self, source: BinaryIO, table: str, data_format: str) -> bool:
+        """Load table data from binary source in a bulk load format"""
+        raise ValueError(f'{data_format} data format is not supported by {type(self).__name__}')
+
+    @abstractmethod
+    def batch_formatter(self, description: list) -> Callable[[list], list]:
+        """Create function formatting fetched rows as sql values, formatters are chosen once per column"""
         pass
 
+    def rows_reporter(self, table: str) -> Callable[[int], None] | None:
+        """
+        Creates on_batch callback of fetch_batches reporting fetched rows of table to on_rows
+        :param table: table name
+        :return: callback or None when nobody tracks progress
+        """
+        if self.on_rows is None:
+            return None
+        return lambda rows: self.on_rows(table, rows)
+
+    def fetch_table_batches(self, cursor, table: str) -> Iterator[list]:
+        """
+        Fetches rows of executed dump query batch by batch reporting them to on_rows,
+        with pipeline_depth set batches are fetched on background thread while previous ones are processed
+        :param cursor: cursor with executed query
+        :param table: dumped table
+        :return: iterator of row lists
+        """
+        return self.read_ahead(fetch_batches(cursor, self.batch_size, on_batch=self.rows_reporter(table)), table)
+
+    def read_ahead(self, batches: Iterator[list], table: str) -> Iterator[list]:
+        """
+        Fetches batches on background thread while previous ones are processed when pipeline_depth is set
+        :param batches: iterator of row lists read from the server
+        :param table: dumped table
+        :return: iterator of row lists
+        """
+        if self.pipeline_depth:
+            return prefetch(batches, depth=self.pipeline_depth, name=f'fetch-{table}')
+        return batches
+
+    def select_table(self, table: str, since: dict = None, key_range: dict = None) -> tuple:
+        """
+        Executes dump query of table and returns its rows batch by batch. With page_size set tables with primary
+        key are read in key order by keyset pagination, every page continues after key of the last row
+        (WHERE key > last ORDER BY key LIMIT page_size), so rows arrive in clustered index order and no query
+        runs longer than one page
+        :param table: table name
+        :param since: watermark of previous backup, only rows changed after it are selected
+        :param key_range: primary key range returned by split of get_key_range, only its rows are selected
+        :return: cursor with description of selected columns and iterator of row lists
+        """
+        quote = self.identifier_quote
+        where, params = self.row_filter(since=since, key_range=key_range)
+        key = self.get_primary_key(table) if self.page_size else []
+        cursor = self.table_cursor(table, paged=bool(key))
+        if not key:
+            cursor.execute(f'SELECT * FROM {quote}{table}{quote}{where}', params or None)
+            return cursor, self.fetch_table_batches(cursor, table)
+
+        key_columns = [f'{quote}{column}{quote}' for column in key]
+        order = ', '.join(key_columns)
+
+        def page_query(after_key: tuple) -> tuple[str, tuple]:
+            conditions = where
+            after_params = ()
+            if after_key:
+                after, after_params = self.keyset_condition(key_columns, after_key)
+                conditions += f' AND {after}' if where else f' WHERE {after}'
+            return (f'SELECT * FROM {quote}{table}{quote}{conditions} ORDER BY {order} LIMIT {self.page_size}',
+                    params + after_params)
+
+        logger.debug(f'Reading {table} in pages of {self.page_size} rows ordered by {order}')
+        query, page_params = page_query(())
+        cursor.execute(query, page_params or None)
+        names = [column[0] for column in cursor.description]
+        positions = [names.index(column) for column in key]
+
+        def pages() -> Iterator[list]:
+            while True:
+                page_rows = 0
+                last_row = None
+                for rows in fetch_batches(cursor, self.batch_size, on_batch=self.rows_reporter(table)):
+                    page_rows += len(rows)
+                    last_row = rows[-1]
+                    yield rows
+                if page_rows < self.page_size:
+                    return
+                after_key = tuple(last_row[position] for position in positions)
+                cursor.execute(*page_query(after_key))
+
+        return cursor, self.read_ahead(pages(), table)
+
+    def keyset_condition(self, key_columns: list, after_key: tuple) -> tuple[str, tuple]:
+        """
+        Builds condition selecting rows after primary key of the last row of previous page, composite
+        keys are compared as row values, which postgresql resolves by index range scan
+        :param key_columns: quoted primary key columns in key order
+        :param after_key: key values of the last row
+        :return: condition and its parameters
+        """
+        if len(key_columns) == 1:
+            return f'{key_columns[0]} > %s', after_key
+        return f'({", ".join(key_columns)}) > ({", ".join(["%s"] * len(key_columns))})', after_key
+
+    def row_filter(self, since: dict = None, key_range: dict = None) -> tuple[str, tuple]:
+        """
+        Builds WHERE clause of dump query selecting rows changed since watermark and rows inside key range
+        :param since: watermark of previous backup
+        :param key_range: {'column': primary key, 'start': first value or None, 'end': value after the last or None}
+        :return: WHERE clause (empty when all rows are selected) and its parameters
+        """
+        quote = self.identifier_quote
+        conditions = []
+        params = []
+        if since:
+            operator = WATERMARK_OPERATORS[since['kind']]
+            logger.debug(f'Getting rows where {since["column"]} {operator} {since["value"]}')
+            conditions.append(f"{quote}{since['column']}{quote} {operator} %s")
+            params.append(since['value'])
+        if key_range:
+            column = f"{quote}{key_range['column']}{quote}"
+            if key_range['start'] is not None:
+                conditions.append(f'{column} >= %s')
+                params.append(key_range['start'])
+            if key_range['end'] is not None:
+                conditions.append(f'{column} < %s')
+                params.append(key_range['end'])
+        if not conditions:
+            return '', ()
+        return ' WHERE ' + ' AND '.join(conditions), tuple(params)
+
+    def get_max_statement_size(self) -> int:
+        """Get maximum size of one sql statement in bytes"""
+        return MAX_STATEMENT_BYTES
+
+    def write_insert_statements(self, sink: TextIO, batches: Iterable[list], format_batch: Callable[[list], list],
+                                statement_start: str, statement_end: str, preamble: str = '') -> int:
+        """
+        Writes rows as multi-row INSERT statements, new statement is started once current one reaches
+        rows_per_statement rows or bytes_per_statement bytes (DEFAULT_STATEMENT_BYTES by default),
+        statements never exceed server statement size limit
+        :param sink: file-like object the sql code is written to
+        :param batches: iterator of row lists
+        :param format_batch: function returned by batch_formatter
+        :param statement_start: INSERT INTO ... VALUES part of every statement
+        :param statement_end: sql code closing every statement
+        :param preamble: sql code written once before first statement
+        :return: number of written rows
+        """
+        rows_limit = self.rows_per_statement or float('inf')
+        bytes_limit = min(self.bytes_per_statement or DEFAULT_STATEMENT_BYTES, self.get_max_statement_size())
+        start_bytes = len(statement_start.encode('utf-8')) + len(statement_end.encode('utf-8'))
+
+        def format_values(rows: list) -> list:
+            values_list = []
+            for row_values in format_batch(rows):
+                values = f'({row_values})'
+                # Length of ascii string is its size in bytes, only other strings need encoding
+                values_list.append((values, (len(values) if values.isascii() else len(values.encode('utf-8'))) + 2))
+            return values_list
+
+        if self.format_executor is not None:
+            # Batches are formatted on executor threads while statements of earlier batches are written
+            formatted = ordered_map(format_values, batches, executor=self.format_executor,
+                                    max_pending=max(self.pipeline_depth, 1))
+        else:
+            formatted = map(format_values, batches)
+
+        rows_count = 0
+        statement_rows = 0
+        statement_bytes = 0
+        for values_list in formatted:
+            chunk = [preamble] if rows_count == 0 else []
+            for values, values_bytes in values_list:
+                if statement_rows and (statement_rows >= rows_limit or statement_bytes + values_bytes > bytes_limit):
+                    chunk.append(statement_end)
+                    statement_rows = 0
+                if statement_rows:
+                    chunk.append(',\n')
+                    statement_bytes += values_bytes
+                else:
+                    chunk.append(statement_start)
+                    statement_bytes = start_bytes + values_bytes
+                chunk.append(values)
+                statement_rows += 1
+            sink.write(''.join(chunk))
+            rows_count += len(values_list)
+
+        if rows_count:
+            sink.write(statement_end)
+        return rows_count
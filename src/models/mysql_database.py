@@ -1,12 +1,31 @@
-import binascii
 import datetime
+import itertools
 import logging
+from typing import TextIO, BinaryIO, Callable, Iterable
 
 import pymysql
+from pymysql.constants import CLIENT, FIELD_TYPE
 
-from src.models.database import database
+from src.columnar import read_columnar, write_columnar
+from src.executor import StatementExecutor
+from src.models.database import database, statement_pattern, TRANSACTION_CONTROL
+from src.sql_splitter import split_sql
 
 mysql_version = 80003
+FETCH_BATCH_SIZE = 1000
+# Room left in max_allowed_packet for packet header and statement framing
+PACKET_MARGIN = 1024
+# Statements causing implicit commit, they would release savepoint of a batch
+IMPLICIT_COMMIT = r'CREATE|ALTER|DROP|RENAME|TRUNCATE|GRANT|REVOKE|LOCK|UNLOCK|FLUSH|ANALYZE|OPTIMIZE|REPAIR'
+TIMESTAMP_TYPES = ('timestamp', 'datetime', 'date')
+# Primary key types tables can be split into ranges by
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+# Column types which values are written as they are printed
+NUMERIC_FIELDS = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24,
+                  FIELD_TYPE.YEAR, FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+# Column types fetched as text or bytes depending on column character set
+STRING_FIELDS = {FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING, FIELD_TYPE.TINY_BLOB,
+                 FIELD_TYPE.MEDIUM_BLOB, FIELD_TYPE.LONG_BLOB, FIELD_TYPE.BLOB, FIELD_TYPE.BIT, FIELD_TYPE.GEOMETRY}
 logger = logging.getLogger(__name__)
 
 def parse_connection_string(connection_string: str) -> dict:
@@ -24,13 +43,53 @@ def parse_connection_string(connection_string: str) -> dict:
     return match.groupdict()
 
 
+def escape_tsv(value: bytes) -> bytes:
+    """
+    Escapes value the way LOAD DATA with default FIELDS ESCAPED BY '\\' expects it
+    :param value: raw value bytes
+    :return: escaped value bytes
+    """
+    return (value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+            .replace(b'\r', b'\\r').replace(b'\0', b'\\0'))
+
+
+def format_tsv_value(value) -> bytes:
+    """
+    Formats one value as tab separated field
+    :param value: value fetched from cursor
+    :return: escaped field bytes
+    """
+    if value is None:
+        return b'\\N'
+    if isinstance(value, bytes):
+        return escape_tsv(value)
+    if isinstance(value, datetime.timedelta):
+        seconds = int(value.total_seconds())
+        sign = '-' if seconds < 0 else ''
+        hours, rest = divmod(abs(seconds), 3600)
+        value = f'{sign}{hours:02d}:{rest // 60:02d}:{rest % 60:02d}'
+    return escape_tsv(str(value).encode('utf-8'))
+
+
 class mysql(database):
+    data_formats = ['sql', 'tsv', 'columnar']
+    identifier_quote = '`'
+    unbatched_statement = statement_pattern(f'{TRANSACTION_CONTROL}|{IMPLICIT_COMMIT}')
+
     def __init__(self, database_name: str, connection_string: str, is_restore: bool = False,
-                 table_name: str = None) -> None:
+                 table_name: str = None, batch_size: int = FETCH_BATCH_SIZE, rows_per_statement: int = None,
+                 bytes_per_statement: int = None, statements_per_batch: int = None,
+                 statements_per_commit: int = None) -> None:
         self.database_name = database_name
         self.connection_string = connection_string
         self.table_name = table_name
         self.is_restore = is_restore
+        self.batch_size = batch_size
+        self.rows_per_statement = rows_per_statement
+        self.bytes_per_statement = bytes_per_statement
+        self.statements_per_batch = statements_per_batch or self.statements_per_batch
+        self.statements_per_commit = statements_per_commit or self.statements_per_commit
+        self.max_allowed_packet = None
         connection_params = parse_connection_string(connection_string)
         try:
             self.connection = pymysql.connect(
@@ -39,7 +98,9 @@ class mysql(database):
                 host=connection_params['host'],
                 port=int(connection_params['port']),
                 database=database_name,
-                charset='utf8mb4'
+                charset='utf8mb4',
+                local_infile=True,
+                client_flag=CLIENT.MULTI_STATEMENTS
             )
         except Exception as e:
             logger.warning(e)
@@ -50,7 +111,9 @@ class mysql(database):
                     password=connection_params['password'],
                     host=connection_params['host'],
                     port=int(connection_params['port']),
-                    charset='utf8mb4'
+                    charset='utf8mb4',
+                    local_infile=True,
+                    client_flag=CLIENT.MULTI_STATEMENTS
                 )
                 cursor = self.connection.cursor()
                 cursor.execute(f'CREATE SCHEMA {self.database_name}')
@@ -83,47 +146,50 @@ SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;
         logger.debug(f'Getting all database tables.')
         return [row[0] for row in cursor.fetchall()]
 
-    def get_database_structure(self) -> str:
+    def get_database_structure(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
         """
-        Creates a string sql code for mysql database schema creation with all tables
-        :return: sql code represented as string
+        Writes sql code for mysql database schema creation with all tables into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
         """
-
+        on_section = on_section or (lambda table: None)
         tables = self.get_all_tables()
 
-        structure = self.turn_off_checks_sql + f"""DROP SCHEMA IF EXISTS {self.database_name};
+        sink.write(self.turn_off_checks_sql + f"""DROP SCHEMA IF EXISTS {self.database_name};
 CREATE SCHEMA {self.database_name};
-USE {self.database_name};"""
+USE {self.database_name};\n""")
 
         for table in tables:
-            structure += self.get_table(custom_table=table)
-        structure += self.get_grants()
-        structure += self.turn_on_checks_sql
-        return structure
+            on_section(table)
+            sink.write(self.get_table(custom_table=table))
+        on_section(None)
+        sink.write(self.get_grants())
+        sink.write(self.turn_on_checks_sql)
 
-    def get_database_data(self) -> str:
+    def get_database_data(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
         """
-        Creates a string sql code for mysql database data insertion for all tables
-        :return: sql code represented as string
+        Writes sql code for mysql database data insertion for all tables into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
         """
+        on_section = on_section or (lambda table: None)
         cursor = self.connection.cursor()
-        result = self.turn_off_checks_tables_sql
-        result += f'USE {self.database_name};\n'
+        sink.write(self.turn_off_checks_tables_sql)
+        sink.write(f'USE {self.database_name};\n')
         logger.info('Getting database data...')
         try:
             cursor.execute(f"SHOW FULL TABLES WHERE Table_Type = 'BASE TABLE'")
             tables = [row[0] for row in cursor.fetchall()]
 
             for table in tables:
-                result += self.get_table_data(custom_table=table)
-
+                on_section(table)
+                self.get_table_data(sink=sink, custom_table=table)
+            on_section(None)
 
         except pymysql.Error as err:
             logger.error(err)
             raise Exception(err)
 
-        return result
-
     def get_table(self, custom_table: str = None) -> str:
         """
         Creates a string sql code for mysql one table creation
@@ -148,48 +214,262 @@ USE {self.database_name};"""
 
         return structure
 
-    def get_table_data(self, custom_table: str = None) -> str:
+    def get_table_data(self, sink: TextIO, custom_table: str = None, since: dict = None, upsert: bool = False,
+                       key_range: dict = None) -> int:
         """
-        Creates a string sql code for mysql one table data insertion
+        Writes sql code for mysql one table data insertion into sink batch by batch
+        :param sink: file-like object the sql code is written to
         :param custom_table: if class param is not set
-        :return: a sql code represented as string
+        :param since: watermark of previous backup, only rows changed after it are written
+        :param upsert: write statements updating rows which already exist
+        :param key_range: primary key range returned by split of get_key_range, only its rows are written
+        :return: number of written rows
         """
-        cursor = self.connection.cursor()
+        # Read before unbuffered query blocks the connection
+        self.get_max_statement_size()
         if custom_table is not None:
             table = custom_table
-            result = ''
         else:
-            result = f'USE {self.database_name};\n'
+            sink.write(f'USE {self.database_name};\n')
             table = self.table_name
 
         logger.info(f'Getting data from table: {table}')
 
-        cursor.execute(f"SELECT * FROM {table}")
-        rows = cursor.fetchall()
-
-        result += f"SET AUTOCOMMIT=0;\nINSERT INTO `{table}` ({', '.join([desc[0] for desc in cursor.description])}) VALUES "
-
-        for row in rows:
-            formatted_data = ''
-            for value in row:
-                if value is None:
-                    formatted_data += 'NULL'
-                elif isinstance(value, str):
-                    formatted_data += f'\'{value}\''
-                elif isinstance(value, datetime.datetime):
-                    formatted_data += f"'{value.strftime('%Y-%m-%d %H:%M:%S')}'"
-                elif isinstance(value, bytes):
-                    hex_value = binascii.hexlify(value).decode('ascii')
-                    formatted_data += f'/*!{mysql_version} 0x{hex_value}*/'
+        cursor, batches = self.select_table(table, since=since, key_range=key_range)
+        column_names = [desc[0] for desc in cursor.description]
+        columns = ', '.join(column_names)
+        statement_end = ';\nCOMMIT;\n'
+        if upsert:
+            updates = ', '.join([f'`{column}`=VALUES(`{column}`)' for column in column_names])
+            statement_end = f' ON DUPLICATE KEY UPDATE {updates}' + statement_end
+
+        rows_count = self.write_insert_statements(sink=sink, batches=batches,
+                                                  format_batch=self.batch_formatter(cursor.description),
+                                                  statement_start=f"INSERT INTO `{table}` ({columns}) VALUES ",
+                                                  statement_end=statement_end, preamble='SET AUTOCOMMIT=0;\n')
+        cursor.close()
+        return rows_count
+
+    def get_watermark_column(self, table: str, preferred: str = 'last_update') -> tuple | None:
+        """
+        Chooses column tracking changed rows, preferred column if table has it, auto increment column otherwise
+        :param table: table name
+        :param preferred: name of column to use when it exists
+        :return: (column, kind) where kind is timestamp or sequence, None if table has no such column
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""SELECT COLUMN_NAME, DATA_TYPE, EXTRA
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+                ORDER BY ORDINAL_POSITION""", (self.database_name, table))
+        columns = cursor.fetchall()
+        for column, data_type, extra in columns:
+            if column == preferred:
+                return column, 'timestamp' if data_type.lower() in TIMESTAMP_TYPES else 'sequence'
+        for column, data_type, extra in columns:
+            if 'auto_increment' in extra.lower():
+                return column, 'sequence'
+        return None
+
+    def get_watermark(self, table: str, column: str):
+        """
+        Returns current maximum value of watermark column
+        :param table: table name
+        :param column: watermark column
+        :return: maximum value or None if table is empty
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(f'SELECT MAX(`{column}`) FROM `{table}`')
+        return cursor.fetchone()[0]
+
+    def get_primary_key(self, table: str) -> list:
+        """
+        Returns primary key columns of table
+        :param table: table name
+        :return: column names in key order, empty if table has no primary key
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""SELECT COLUMN_NAME
+                FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY ORDINAL_POSITION""", (self.database_name, table))
+        return [row[0] for row in cursor.fetchall()]
+
+    def table_cursor(self, table: str, paged: bool):
+        """
+        Creates unbuffered cursor which streams rows from the server instead of loading them into memory,
+        pages are read by the same cursor one after another
+        :param table: dumped table
+        :param paged: whether rows are read page by page
+        :return: cursor
+        """
+        return self.connection.cursor(pymysql.cursors.SSCursor)
+
+    def get_key_range(self, table: str) -> dict | None:
+        """
+        Finds single integer primary key column of table and its current minimum and maximum value
+        :param table: table name
+        :return: {'column', 'min', 'max'}, None if table has no such key or is empty
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""SELECT k.COLUMN_NAME, c.DATA_TYPE
+                FROM information_schema.KEY_COLUMN_USAGE k
+                JOIN information_schema.COLUMNS c ON c.TABLE_SCHEMA = k.TABLE_SCHEMA
+                    AND c.TABLE_NAME = k.TABLE_NAME AND c.COLUMN_NAME = k.COLUMN_NAME
+                WHERE k.TABLE_SCHEMA = %s AND k.TABLE_NAME = %s AND k.CONSTRAINT_NAME = 'PRIMARY'""",
+                       (self.database_name, table))
+        columns = cursor.fetchall()
+        if len(columns) != 1 or columns[0][1].lower() not in INTEGER_TYPES:
+            return None
+        column = columns[0][0]
+        cursor.execute(f'SELECT MIN(`{column}`), MAX(`{column}`) FROM `{table}`')
+        minimum, maximum = cursor.fetchone()
+        if minimum is None:
+            return None
+        return {'column': column, 'min': int(minimum), 'max': int(maximum)}
+
+    def keyset_condition(self, key_columns: list, after_key: tuple) -> tuple[str, tuple]:
+        """
+        Builds condition selecting rows after primary key of the last row of previous page, mysql optimizer
+        does not reliably turn row value comparison into index range, so composite key comparison is expanded
+        into column comparisons (a > x OR (a = x AND b > y)) with leading column bounded on its own
+        :param key_columns: quoted primary key columns in key order
+        :param after_key: key values of the last row
+        :return: condition and its parameters
+        """
+        if len(key_columns) == 1:
+            return super().keyset_condition(key_columns, after_key)
+        alternatives = []
+        params = [after_key[0]]
+        for index, column in enumerate(key_columns):
+            comparisons = [f'{equal} = %s' for equal in key_columns[:index]] + [f'{column} > %s']
+            alternatives.append(f'({" AND ".join(comparisons)})')
+            params.extend(after_key[:index + 1])
+        return f'{key_columns[0]} >= %s AND ({" OR ".join(alternatives)})', tuple(params)
+
+    def get_max_statement_size(self) -> int:
+        """
+        Returns server max_allowed_packet lowered by a safety margin, value is cached per connection
+        :return: maximum size of one sql statement in bytes
+        """
+        if self.max_allowed_packet is None:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT @@max_allowed_packet')
+            self.max_allowed_packet = int(cursor.fetchone()[0])
+            logger.debug(f'Server max_allowed_packet is {self.max_allowed_packet}')
+        return self.max_allowed_packet - PACKET_MARGIN
+
+    def batch_formatter(self, description: list) -> Callable[[list], list]:
+        """
+        Chooses sql value formatter of every column by its type code once, numbers are printed,
+        strings are quoted by the connection (respecting server sql mode), bytes are written as hex literals
+        :param description: cursor description
+        :return: function formatting list of rows into list of comma separated sql values
+        """
+        quote = self.connection.literal
+
+        def quote_or_hex(value) -> str:
+            if type(value) is str:
+                return quote(value)
+            return f'/*!{mysql_version} 0x{value.hex()}*/' if value else "''"
+
+        formatters = []
+        for column in description:
+            type_code = column[1] if len(column) > 1 else None
+            if type_code in NUMERIC_FIELDS:
+                formatters.append(str)
+            elif type_code in STRING_FIELDS:
+                formatters.append(quote_or_hex)
+            else:
+                # Text, dates, times and other types are converted by pymysql encoders
+                formatters.append(quote)
+
+        def format_batch(rows: list) -> list:
+            columns = []
+            for formatter, values in zip(formatters, zip(*rows)):
+                if None in values:
+                    columns.append(['NULL' if value is None else formatter(value) for value in values])
                 else:
-                    formatted_data += f'{value}'
-                formatted_data += ','
-            formatted_data = formatted_data[:-1]
-            result += f'({formatted_data}),\n'
+                    columns.append(map(formatter, values))
+            return [','.join(row) for row in zip(*columns)]
 
-        if result.endswith(',\n'):
-            result = result[:-2] + ';\nCOMMIT;\n'
-        return result
+        return format_batch
+
+    def get_table_data_bulk(self, sink: BinaryIO, custom_table: str = None, data_format: str = 'tsv',
+                            key_range: dict = None) -> int:
+        """
+        Writes mysql one table data into sink as escaped tab separated lines (like mysqldump --tab),
+        first line holds column names, or in typed columnar format
+        :param sink: binary file-like object the data is written to
+        :param custom_table: if class param is not set
+        :param data_format: tsv or columnar
+        :param key_range: primary key range returned by split of get_key_range, only its rows are written
+        :return: number of written rows
+        """
+        if data_format not in ('tsv', 'columnar'):
+            return super().get_table_data_bulk(sink=sink, custom_table=custom_table, data_format=data_format,
+                                               key_range=key_range)
+
+        if custom_table is not None:
+            table = custom_table
+        else:
+            table = self.table_name
+
+        logger.info(f'Getting data from table: {table}')
+
+        cursor, batches = self.select_table(table, key_range=key_range)
+        column_names = [desc[0] for desc in cursor.description]
+        if data_format == 'columnar':
+            rows_count = write_columnar(sink=sink, columns=column_names, batches=batches)
+            cursor.close()
+            return rows_count
+
+        sink.write('\t'.join(column_names).encode('utf-8') + b'\n')
+
+        rows_count = 0
+        for rows in batches:
+            sink.write(b''.join([b'\t'.join([format_tsv_value(value) for value in row]) + b'\n' for row in rows]))
+            rows_count += len(rows)
+        cursor.close()
+
+        return rows_count
+
+    def get_table_checksum(self, table: str) -> str | None:
+        """
+        Returns live checksum of table contents computed by the server, the table is read
+        on the server side without sending rows to client
+        :param table: table name
+        :return: checksum or None if server can not compute it
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(f'CHECKSUM TABLE `{table}`')
+        row = cursor.fetchone()
+        if row is None or row[1] is None:
+            return None
+        return str(row[1])
+
+    def get_foreign_keys(self) -> list:
+        """
+        Returns foreign key dependencies between tables of the database
+        :return: list of (table, referenced table) pairs
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""SELECT TABLE_NAME, REFERENCED_TABLE_NAME
+                FROM information_schema.REFERENTIAL_CONSTRAINTS
+                WHERE CONSTRAINT_SCHEMA = %s""", (self.database_name,))
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+    def get_table_estimates(self) -> dict:
+        """
+        Returns estimated rows and data size of tables kept in information_schema statistics,
+        InnoDB row counts are approximate
+        :return: {table: {'rows': estimated rows, 'bytes': estimated size}}
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH
+                FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'""", (self.database_name,))
+        return {row[0]: {'rows': int(row[1] or 0), 'bytes': int(row[2] or 0)} for row in cursor.fetchall()}
 
     def get_grants(self) -> str:
         """
@@ -212,21 +492,103 @@ USE {self.database_name};"""
                 result += f"\n{grant[0]};"
         return result
 
-    def restore_database_sql(self, sql: str) -> bool:
+    def restore_database_sql(self, sql: str | Iterable[str], on_commit: Callable[[int], None] = None) -> bool:
         """
-        Executes sql script
-        :param sql: sql code which needs to be executed
+        Executes sql script in batches of statements, statements which fail are logged and skipped
+        :param sql: sql code or iterator of statements which needs to be executed
+        :param on_commit: called after every commit with number of statements of sql executed or failed so far
         :return: True if success
         """
-        cursor = self.connection.cursor()
-        sql = self.turn_off_checks_sql + self.turn_off_checks_tables_sql + f'USE {self.database_name};' + sql + self.turn_on_checks_sql
+        if isinstance(sql, str):
+            sql = split_sql(sql, dialect='mysql')
+        prefix = list(split_sql(self.turn_off_checks_sql + self.turn_off_checks_tables_sql +
+                                f'USE {self.database_name};', dialect='mysql'))
+        statements = itertools.chain(prefix, sql, split_sql(self.turn_on_checks_sql, dialect='mysql'))
+        if on_commit is not None:
+            # Statements switching checks off are not counted as statements of sql
+            reported = on_commit
+            on_commit = lambda processed: reported(max(processed - len(prefix), 0))
 
         logger.debug('Executing sql script...')
-        structure = list(filter(None, sql.split(';')))
-        for element in structure:
-            try:
-                cursor.execute(f'{element};')
-            except Exception as e:
-                logger.debug(e)
+        StatementExecutor(db=self, statements_per_batch=self.statements_per_batch,
+                          statements_per_commit=self.statements_per_commit, on_commit=on_commit).run(statements)
 
         return True
+
+    def execute_batch(self, statements: list) -> None:
+        """
+        Sends statements as one multi statement query and reads all results
+        :param statements: list of sql statements
+        """
+        cursor = self.connection.cursor()
+        # New line keeps trailing line comment from swallowing the delimiter
+        cursor.execute('\n;\n'.join(statements))
+        while cursor.nextset():
+            pass
+        cursor.close()
+
+    def restore_table_data_bulk(self, source: BinaryIO, table: str, data_format: str = 'tsv') -> bool:
+        """
+        Loads mysql one table data from tab separated file with LOAD DATA LOCAL INFILE,
+        columnar data is inserted row group by row group as parameters of multi-row INSERT
+        :param source: binary file object produced by get_table_data_bulk, tsv must be a file on disk
+        :param table: table the data is loaded into
+        :param data_format: tsv or columnar
+        :return: True if success
+        """
+        if data_format not in ('tsv', 'columnar'):
+            return super().restore_table_data_bulk(source=source, table=table, data_format=data_format)
+
+        if data_format == 'columnar':
+            columns, row_groups = read_columnar(source)
+        else:
+            columns = source.readline().decode('utf-8').rstrip('\n').split('\t')
+        column_list = ', '.join([f'`{column}`' for column in columns])
+        cursor = self.connection.cursor()
+        logger.debug(f'Loading data into table: {table}')
+        cursor.execute('SET FOREIGN_KEY_CHECKS=0')
+        cursor.execute('SET UNIQUE_CHECKS=0')
+        if data_format == 'columnar':
+            # executemany sends typed values as multi-row INSERT statements
+            statement = f"INSERT INTO `{table}` ({column_list}) VALUES ({', '.join(['%s'] * len(columns))})"
+            for rows in row_groups:
+                cursor.executemany(statement, rows)
+        else:
+            cursor.execute(f"""LOAD DATA LOCAL INFILE %s INTO TABLE `{table}` CHARACTER SET utf8mb4
+FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' IGNORE 1 LINES
+({column_list})""", (source.name,))
+        cursor.execute('SET UNIQUE_CHECKS=1')
+        cursor.execute('SET FOREIGN_KEY_CHECKS=1')
+        self.connection.commit()
+
+        return True
+
+    def export_snapshot(self) -> str | None:
+        """
+        Blocks writes with global read lock so transactions started by other connections
+        see the same point in time, lock must be released with release_snapshot.
+        The lock blocks DDL too, so table structure read before the lock is released matches the snapshot
+        :return: None, mysql snapshot has no identifier
+        """
+        logger.debug('Locking tables for consistent snapshot')
+        cursor = self.connection.cursor()
+        cursor.execute('FLUSH TABLES WITH READ LOCK')
+        return None
+
+    def start_snapshot(self, snapshot: str | None = None) -> None:
+        """
+        Starts consistent snapshot transaction, must be called while export_snapshot lock is held
+        :param snapshot: unused, mysql snapshots are coordinated by the global read lock
+        """
+        cursor = self.connection.cursor()
+        cursor.execute('SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY')
+
+    def release_snapshot(self) -> None:
+        """
+        Releases global read lock taken by export_snapshot and ends snapshot transaction
+        """
+        logger.debug('Unlocking tables')
+        cursor = self.connection.cursor()
+        cursor.execute('UNLOCK TABLES')
+        self.connection.commit()
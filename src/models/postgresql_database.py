@@ -1,11 +1,25 @@
+import json
 import logging
-import datetime
+import re
+import threading
+from typing import TextIO, BinaryIO, Callable, Iterable
 
 import psycopg2
+import psycopg2.extras
 
+from src.columnar import read_columnar, write_columnar
+from src.executor import StatementExecutor
 from src.models.database import database
+from src.sql_splitter import split_sql
 
 logger = logging.getLogger(__name__)
+# json and jsonb columns are fetched as python objects which need json adapter
+JSON_TYPES = (114, 3802)
+FETCH_BATCH_SIZE = 1000
+COPY_BUFFER_SIZE = 1024 * 1024
+TIMESTAMP_TYPES = ('timestamp without time zone', 'timestamp with time zone', 'date')
+# Primary key types tables can be split into ranges by
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
 
 
 def parse_connection_string(connection_string: str) -> dict:
@@ -24,12 +38,21 @@ def parse_connection_string(connection_string: str) -> dict:
 
 
 class postgresql(database):
+    data_formats = ['sql', 'copy', 'copy-binary', 'columnar']
+
     def __init__(self, database_name: str, connection_string: str, is_restore: bool = False,
-                 table_name: str = None) -> None:
+                 table_name: str = None, batch_size: int = FETCH_BATCH_SIZE, rows_per_statement: int = None,
+                 bytes_per_statement: int = None, statements_per_batch: int = None,
+                 statements_per_commit: int = None) -> None:
         self.database_name = database_name
         self.connection_string = connection_string
         self.table_name = table_name
         self.is_restore = is_restore
+        self.batch_size = batch_size
+        self.rows_per_statement = rows_per_statement
+        self.bytes_per_statement = bytes_per_statement
+        self.statements_per_batch = statements_per_batch or self.statements_per_batch
+        self.statements_per_commit = statements_per_commit or self.statements_per_commit
         connection_params = parse_connection_string(connection_string)
         try:
             self.connection = psycopg2.connect(
@@ -80,13 +103,15 @@ class postgresql(database):
                 """)
         return [row[0] for row in cursor.fetchall()]
 
-    def get_database_structure(self) -> str:
+    def get_database_structure(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
         """
-        Creates a string sql code for mysql database schema creation with all tables
-        :return: sql code represented as string
+        Writes sql code for postgresql database schema creation with all tables into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
         """
+        on_section = on_section or (lambda table: None)
 
-        create_database_script = """SET statement_timeout = 0;
+        sink.write("""SET statement_timeout = 0;
 SET lock_timeout = 0;
 SET client_encoding = 'UTF8';
 SET standard_conforming_strings = on;
@@ -97,31 +122,33 @@ SET client_min_messages = warning;
 
 SET default_tablespace = '';
 
-SET default_with_oids = false;\n\n"""
+SET default_with_oids = false;\n\n""")
         tables = self.get_all_tables()
         for table in tables:
-            create_database_script += f'DROP TABLE IF EXISTS {table};\n'
+            sink.write(f'DROP TABLE IF EXISTS {table};\n')
 
-        create_database_script += '\n\n'
+        sink.write('\n\n')
         for table in tables:
-            create_database_script += self.get_table(custom_table=table) + '\n\n'
-
-        return create_database_script
+            on_section(table)
+            sink.write(self.get_table(custom_table=table) + '\n\n')
+        on_section(None)
 
-    def get_database_data(self) -> str:
+    def get_database_data(self, sink: TextIO, on_section: Callable[[str | None], None] = None) -> None:
         """
-        Creates a string sql code for mysql database data insertion for all tables
-        :return: sql code represented as string
+        Writes sql code for postgresql database data insertion for all tables into sink
+        :param sink: file-like object the sql code is written to
+        :param on_section: called with table name before sql code of every table and with None after the last one
         """
+        on_section = on_section or (lambda table: None)
         logger.info('Getting database data...')
 
         tables = self.get_all_tables()
-        result = ''
 
         for table in tables:
-            result += self.get_table_data(custom_table=table) + '\n\n'
-
-        return result
+            on_section(table)
+            self.get_table_data(sink=sink, custom_table=table)
+            sink.write('\n\n')
+        on_section(None)
 
     def get_table(self, custom_table: str = None) -> str:
         """
@@ -192,51 +219,287 @@ SET default_with_oids = false;\n\n"""
 
         return create_table_script
 
-    def get_table_data(self, custom_table: str = None) -> str:
+    def get_table_data(self, sink: TextIO, custom_table: str = None, since: dict = None, upsert: bool = False,
+                       key_range: dict = None) -> int:
         """
-        Creates a string sql code for mysql one table data insertion
+        Writes sql code for postgresql one table data insertion into sink batch by batch
+        :param sink: file-like object the sql code is written to
         :param custom_table: if class param is not set
-        :return: a sql code represented as string
+        :param since: watermark of previous backup, only rows changed after it are written
+        :param upsert: write statements updating rows which already exist
+        :param key_range: primary key range returned by split of get_key_range, only its rows are written
+        :return: number of written rows
+        """
+        if custom_table is not None:
+            table = custom_table
+        else:
+            table = self.table_name
+
+        statement_end = ';\n'
+        if upsert:
+            statement_end = self.get_upsert_clause(table) + statement_end
+
+        cursor, batches = self.select_table(table, since=since, key_range=key_range)
+        columns = ', '.join([desc[0] for desc in cursor.description])
+
+        rows_count = self.write_insert_statements(sink=sink, batches=batches,
+                                                  format_batch=self.batch_formatter(cursor.description),
+                                                  statement_start=f'INSERT INTO {table} ({columns}) VALUES ',
+                                                  statement_end=statement_end)
+        cursor.close()
+        return rows_count
+
+    def get_upsert_clause(self, table: str) -> str:
+        """
+        Creates ON CONFLICT clause updating rows with the same primary key
+        :param table: table name
+        :return: sql code appended to INSERT statement, empty if table has no primary key
         """
-        import re
         cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT
+                        a.attname,
+                        i.indisprimary
+                    FROM pg_catalog.pg_attribute a
+                    LEFT JOIN pg_catalog.pg_index i
+                        ON i.indrelid = a.attrelid AND i.indisprimary AND a.attnum = ANY(i.indkey)
+                    WHERE a.attrelid = %s::regclass
+                      AND a.attnum > 0
+                      AND NOT a.attisdropped
+                    ORDER BY a.attnum;
+                """, (table,))
+        columns = cursor.fetchall()
+        primary_key = [column for column, is_primary in columns if is_primary]
+        if not primary_key:
+            return ''
+        updates = ', '.join([f'{column} = EXCLUDED.{column}' for column, is_primary in columns if not is_primary])
+        if not updates:
+            return f' ON CONFLICT ({", ".join(primary_key)}) DO NOTHING'
+        return f' ON CONFLICT ({", ".join(primary_key)}) DO UPDATE SET {updates}'
+
+    def get_watermark_column(self, table: str, preferred: str = 'last_update') -> tuple | None:
+        """
+        Chooses column tracking changed rows, preferred column if table has it, serial or identity column otherwise
+        :param table: table name
+        :param preferred: name of column to use when it exists
+        :return: (column, kind) where kind is timestamp or sequence, None if table has no such column
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT
+                        column_name,
+                        data_type,
+                        column_default,
+                        is_identity
+                    FROM information_schema.columns
+                    WHERE table_schema = 'public'
+                      AND table_name = %s
+                    ORDER BY ordinal_position;
+                """, (table,))
+        columns = cursor.fetchall()
+        for column, data_type, column_default, is_identity in columns:
+            if column == preferred:
+                return column, 'timestamp' if data_type in TIMESTAMP_TYPES else 'sequence'
+        for column, data_type, column_default, is_identity in columns:
+            if is_identity == 'YES' or (column_default or '').startswith('nextval('):
+                return column, 'sequence'
+        return None
+
+    def get_primary_key(self, table: str) -> list:
+        """
+        Returns primary key columns of table
+        :param table: table name
+        :return: column names in key order, empty if table has no primary key
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT a.attname
+                    FROM pg_catalog.pg_index i
+                    JOIN pg_catalog.pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = %s::regclass
+                      AND i.indisprimary
+                    ORDER BY array_position(i.indkey::smallint[], a.attnum);
+                """, (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def table_cursor(self, table: str, paged: bool):
+        """
+        Creates cursor reading dumped rows, whole table is read by named cursor declared on the server side
+        and fetched batch by batch, named cursor runs only one query so pages are read by client cursor
+        holding at most one page
+        :param table: dumped table
+        :param paged: whether rows are read page by page
+        :return: cursor
+        """
+        if paged:
+            return self.connection.cursor()
+        cursor = self.connection.cursor(name=f'{table}_export')
+        cursor.itersize = self.batch_size
+        return cursor
+
+    def get_key_range(self, table: str) -> dict | None:
+        """
+        Finds single integer primary key column of table and its current minimum and maximum value
+        :param table: table name
+        :return: {'column', 'min', 'max'}, None if table has no such key or is empty
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT a.attname, pg_catalog.format_type(a.atttypid, a.atttypmod)
+                    FROM pg_catalog.pg_index i
+                    JOIN pg_catalog.pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = %s::regclass
+                      AND i.indisprimary;
+                """, (table,))
+        columns = cursor.fetchall()
+        if len(columns) != 1 or columns[0][1] not in INTEGER_TYPES:
+            return None
+        column = columns[0][0]
+        cursor.execute(f'SELECT MIN({column}), MAX({column}) FROM {table}')
+        minimum, maximum = cursor.fetchone()
+        if minimum is None:
+            return None
+        return {'column': column, 'min': int(minimum), 'max': int(maximum)}
+
+    def get_watermark(self, table: str, column: str):
+        """
+        Returns current maximum value of watermark column
+        :param table: table name
+        :param column: watermark column
+        :return: maximum value or None if table is empty
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(f'SELECT MAX({column}) FROM {table}')
+        return cursor.fetchone()[0]
+
+    def batch_formatter(self, description: list) -> Callable[[list], list]:
+        """
+        Creates formatter quoting whole rows with psycopg2 mogrify, which adapts every value in C
+        using connection settings, json columns are wrapped into json adapter chosen once per column
+        :param description: cursor description
+        :return: function formatting list of rows into list of comma separated sql values
+        """
+        encoding = psycopg2.extensions.encodings.get(self.connection.encoding, 'utf-8')
+        template = ','.join(['%s'] * len(description))
+        json_columns = {index for index, column in enumerate(description)
+                        if len(column) > 1 and column[1] in JSON_TYPES}
+        # Batches may be formatted on several threads, cursors are not shared between threads
+        cursors = threading.local()
+
+        def format_batch(rows: list) -> list:
+            if not hasattr(cursors, 'mogrify'):
+                cursors.mogrify = self.connection.cursor().mogrify
+            mogrify = cursors.mogrify
+            if json_columns:
+                rows = [tuple(psycopg2.extras.Json(value) if index in json_columns and value is not None else value
+                              for index, value in enumerate(row)) for row in rows]
+            return [mogrify(template, row).decode(encoding) for row in rows]
+
+        return format_batch
+
+    def get_table_data_bulk(self, sink: BinaryIO, custom_table: str = None, data_format: str = 'copy',
+                            key_range: dict = None) -> int:
+        """
+        Streams postgresql one table data into sink with COPY TO STDOUT or in typed columnar format
+        :param sink: binary file-like object the data is written to
+        :param custom_table: if class param is not set
+        :param data_format: copy for text COPY format, copy-binary for binary COPY format, columnar
+        :param key_range: primary key range returned by split of get_key_range, only its rows are written
+        :return: number of written rows
+        """
+        if data_format not in ('copy', 'copy-binary', 'columnar'):
+            return super().get_table_data_bulk(sink=sink, custom_table=custom_table, data_format=data_format,
+                                               key_range=key_range)
 
         if custom_table is not None:
             table = custom_table
         else:
             table = self.table_name
 
-        cursor.execute(f"SELECT * FROM {table}")
-        rows = cursor.fetchall()
-
-        date_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}$')
-        insert_statement = f'INSERT INTO {table} ({', '.join([desc[0] for desc in cursor.description])}) VALUES '
-        result = ''
-        for row in rows:
-            values = ''
-            for value in row:
-                if isinstance(value, str):
-                    value = value.replace("'", "''")
-                    values += f"'{value}'"
-                elif value is None:
-                    values += "NULL"
-                elif date_pattern.match(str(value)):
-                    values += f"\'{value}\'"
-                elif isinstance(value, memoryview):
-                    values += f"'\\x{value.tobytes().hex()}'"
-                else:
-                    values += str(value)
-
-                values += ','
-            result += f'({values[:-1]}),\n'
-        if result.endswith(',\n'):
-            result = result[:-2] + ';\n'
-
-        if result == '':
-            return ''
-        result = insert_statement + result
+        if data_format == 'columnar':
+            logger.info(f'Getting data from table: {table}')
+            cursor, batches = self.select_table(table, key_range=key_range)
+            json_columns = {index for index, column in enumerate(cursor.description)
+                            if len(column) > 1 and column[1] in JSON_TYPES}
+            if json_columns:
+                # json arrays are fetched as lists like postgresql arrays, json is written as its text
+                batches = ([tuple(json.dumps(value) if index in json_columns and value is not None else value
+                                  for index, value in enumerate(row)) for row in rows] for rows in batches)
+            rows_count = write_columnar(sink=sink, columns=[desc[0] for desc in cursor.description],
+                                        batches=batches)
+            cursor.close()
+            return rows_count
+
+        logger.info(f'Copying data from table: {table}')
+        cursor = self.connection.cursor()
+        copy_format = 'binary' if data_format == 'copy-binary' else 'text'
+        source = table
+        if key_range:
+            # COPY takes no parameters, range bounds are inlined by the driver
+            where, params = self.row_filter(key_range=key_range)
+            source = '(' + cursor.mogrify(f'SELECT * FROM {table}{where}', params).decode() + ')'
+        cursor.copy_expert(f'COPY {source} TO STDOUT WITH (FORMAT {copy_format})', sink, size=COPY_BUFFER_SIZE)
+        return cursor.rowcount
+
+    def get_table_checksum(self, table: str) -> str | None:
+        """
+        Returns table file node and its insert, update and delete counters with time of database
+        statistics reset, the value changes whenever rows are modified or table is truncated
+        :param table: table name
+        :return: checksum or None if table has no statistics
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT
+                        c.relfilenode,
+                        s.n_tup_ins,
+                        s.n_tup_upd,
+                        s.n_tup_del,
+                        d.stats_reset
+                    FROM pg_catalog.pg_stat_user_tables s
+                    JOIN pg_catalog.pg_class c ON c.oid = s.relid
+                    JOIN pg_catalog.pg_stat_database d ON d.datname = current_database()
+                    WHERE s.schemaname = 'public'
+                      AND s.relname = %s;
+                """, (table,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return ':'.join([str(value) for value in row])
+
+    def get_foreign_keys(self) -> list:
+        """
+        Returns foreign key dependencies between tables of the database
+        :return: list of (table, referenced table) pairs
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT
+                        child.relname,
+                        parent.relname
+                    FROM pg_catalog.pg_constraint con
+                    JOIN pg_catalog.pg_class child ON child.oid = con.conrelid
+                    JOIN pg_catalog.pg_class parent ON parent.oid = con.confrelid
+                    JOIN pg_catalog.pg_namespace ns ON ns.oid = con.connamespace
+                    WHERE con.contype = 'f'
+                      AND ns.nspname = 'public';
+                """)
+        return [(row[0], row[1]) for row in cursor.fetchall()]
 
-        return result
+    def get_table_estimates(self) -> dict:
+        """
+        Returns estimated rows from planner statistics (0 for never analyzed tables) and size of tables
+        :return: {table: {'rows': estimated rows, 'bytes': estimated size}}
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+                    SELECT c.relname, c.reltuples, pg_catalog.pg_table_size(c.oid)
+                    FROM pg_catalog.pg_class c
+                    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = 'public'
+                      AND c.relkind IN ('r', 'p');
+                """)
+        return {row[0]: {'rows': max(int(row[1] or 0), 0), 'bytes': int(row[2] or 0)} for row in cursor.fetchall()}
 
     def get_grants(self) -> str:
         """
@@ -282,22 +545,90 @@ SET default_with_oids = false;\n\n"""
 
         return grant_statements
 
-    def restore_database_sql(self, sql: str) -> bool:
+    def restore_database_sql(self, sql: str | Iterable[str], on_commit: Callable[[int], None] = None) -> bool:
         """
-        Executes sql script
-        :param sql: sql code which needs to be executed
+        Executes sql script in batches of statements, statements which fail are logged and skipped
+        :param sql: sql code or iterator of statements which needs to be executed
+        :param on_commit: called after every commit with number of statements of sql executed or failed so far
         :return: True if success
         """
+        if isinstance(sql, str):
+            sql = split_sql(sql, dialect='postgresql')
 
-        cursor = self.connection.cursor()
         logger.debug('Executing sql script...')
-        structure = filter(None, sql.split(';'))
-        for element in structure:
-            try:
-                cursor.execute(element)
-            except Exception as e:
-                logger.warning(e)
+        StatementExecutor(db=self, statements_per_batch=self.statements_per_batch,
+                          statements_per_commit=self.statements_per_commit, on_commit=on_commit).run(sql)
+
+        return True
+
+    def execute_batch(self, statements: list) -> None:
+        """
+        Sends statements as one simple query, postgresql runs them one after another
+        :param statements: list of sql statements
+        """
+        cursor = self.connection.cursor()
+        # New line keeps trailing line comment from swallowing the delimiter
+        cursor.execute('\n;\n'.join(statements))
+        cursor.close()
 
+    def restore_table_data_bulk(self, source: BinaryIO, table: str, data_format: str = 'copy') -> bool:
+        """
+        Loads postgresql one table data from source with COPY FROM STDIN, columnar data is inserted
+        row group by row group as parameters of multi-row INSERT
+        :param source: binary file-like object produced by get_table_data_bulk
+        :param table: table the data is loaded into
+        :param data_format: copy for text COPY format, copy-binary for binary COPY format, columnar
+        :return: True if success
+        """
+        if data_format not in ('copy', 'copy-binary', 'columnar'):
+            return super().restore_table_data_bulk(source=source, table=table, data_format=data_format)
+
+        if data_format == 'columnar':
+            columns, row_groups = read_columnar(source)
+            logger.debug(f'Inserting data into table: {table}')
+            cursor = self.connection.cursor()
+            statement = f'INSERT INTO {table} ({", ".join(columns)}) VALUES %s'
+            for rows in row_groups:
+                psycopg2.extras.execute_values(cursor, statement, rows, page_size=self.batch_size)
+            self.connection.commit()
+            return True
+
+        logger.debug(f'Copying data into table: {table}')
+        cursor = self.connection.cursor()
+        copy_format = 'binary' if data_format == 'copy-binary' else 'text'
+        cursor.copy_expert(f'COPY {table} FROM STDIN WITH (FORMAT {copy_format})', source, size=COPY_BUFFER_SIZE)
         self.connection.commit()
 
         return True
+
+    def export_snapshot(self) -> str:
+        """
+        Starts repeatable read transaction and exports its snapshot,
+        transaction is kept open until release_snapshot
+        :return: snapshot identifier
+        """
+        self.connection.rollback()
+        self.connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT pg_export_snapshot()')
+        snapshot = cursor.fetchone()[0]
+        logger.debug(f'Exported snapshot {snapshot}')
+        return snapshot
+
+    def start_snapshot(self, snapshot: str) -> None:
+        """
+        Starts repeatable read transaction which sees the same data as exporting one
+        :param snapshot: identifier returned by export_snapshot
+        """
+        self.connection.rollback()
+        self.connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = self.connection.cursor()
+        cursor.execute('SET TRANSACTION SNAPSHOT %s', (snapshot,))
+
+    def release_snapshot(self) -> None:
+        """
+        Ends snapshot transaction, when called on exporting connection
+        connections which already joined the snapshot keep it
+        """
+        self.connection.commit()
+        self.connection.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
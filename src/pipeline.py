@@ -0,0 +1,160 @@
+import io
+import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Seconds a blocked stage waits before checking whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+DONE = object()
+
+
+def put_until_stopped(items: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Puts item into bounded queue, waits while queue is full unless consumer stopped
+    :param items: queue
+    :param item: item to put
+    :param stop: event set when consumer stopped reading
+    :return: False if consumer stopped before item was put
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable: Iterable, depth: int, name: str = 'fetch') -> Iterator:
+    """
+    Iterates iterable on background thread keeping up to depth items ready, so fetching
+    next rows from the server overlaps with processing of previous ones, errors of the
+    iterable are raised in consumer
+    :param iterable: iterable read by background thread (cursor batches)
+    :param depth: number of items read ahead
+    :param name: thread name
+    :return: iterator of the same items
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put_until_stopped(items, (item, None), stop):
+                    return
+            put_until_stopped(items, (DONE, None), stop)
+        except BaseException as e:
+            put_until_stopped(items, (DONE, e), stop)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def ordered_map(function: Callable, iterable: Iterable, executor: Executor, max_pending: int) -> Iterator:
+    """
+    Applies function to items on executor threads, results are yielded in order of items
+    and at most max_pending items are processed ahead of the consumer
+    :param function: function applied to every item
+    :param iterable: items
+    :param executor: executor running function
+    :param max_pending: number of items processed at once before consumer waits for the oldest one
+    :return: iterator of results
+    """
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            while len(pending) > max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class BackgroundWriter(io.RawIOBase):
+    def __init__(self, raw: BinaryIO, max_bytes: int, name: str = 'write') -> None:
+        """
+        Binary file-like object handing written data to a writer thread, writer blocks while max_bytes
+        of data wait for the writer thread or are being written (larger write waits until nothing is pending),
+        so memory held by the queue does not grow with size of writes, errors of sink are raised on next
+        write or close
+        :param raw: binary file object written by writer thread, closed together with writer
+        :param max_bytes: number of bytes handed to writer thread and not written yet
+        :param name: thread name
+        """
+        super().__init__()
+        self.raw = raw
+        self.max_bytes = max_bytes
+        self.items = deque()
+        self.pending_bytes = 0
+        self.condition = threading.Condition()
+        self.error = None
+        self.thread = threading.Thread(target=self.consume, name=name, daemon=True)
+        self.thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def consume(self) -> None:
+        while True:
+            with self.condition:
+                while not self.items:
+                    self.condition.wait()
+                data = self.items.popleft()
+            if data is DONE:
+                return
+            if self.error is None:
+                try:
+                    self.raw.write(data)
+                except BaseException as e:
+                    self.error = e
+            with self.condition:
+                self.pending_bytes -= len(data)
+                self.condition.notify_all()
+
+    def put(self, data) -> None:
+        with self.condition:
+            self.items.append(data)
+            self.condition.notify_all()
+
+    def write(self, data) -> int:
+        if self.error is not None:
+            raise self.error
+        # Caller may reuse its buffer once write returns
+        data = bytes(data)
+        with self.condition:
+            while self.pending_bytes and self.pending_bytes + len(data) > self.max_bytes:
+                self.condition.wait()
+            self.pending_bytes += len(data)
+        self.put(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self.put(DONE)
+                self.thread.join()
+            finally:
+                self.raw.close()
+            super().close()
+            if self.error is not None:
+                raise self.error
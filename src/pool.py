@@ -0,0 +1,93 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from src.models.database import database
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    def __init__(self, connect: Callable[[], database], max_size: int = 1) -> None:
+        """
+        Keeps database objects opened during one backup or restore run so they are reused
+        :param connect: function opening new database object
+        :param max_size: maximum number of connections open at the same time
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get(self) -> database:
+        """
+        Takes idle connection or opens new one, blocks while max_size connections are in use
+        :return: database object
+        """
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            db = self.connect()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.connections.append(db)
+        logger.debug(f'Opened connection {len(self.connections)} of {self.max_size}')
+        return db
+
+    def put(self, db: database) -> None:
+        """
+        Returns connection taken with get back to pool
+        :param db: database object
+        """
+        self.idle.put(db)
+        self.slots.release()
+
+    def discard(self, db: database) -> None:
+        """
+        Closes connection taken with get instead of returning it, used when it is left in unknown state
+        :param db: database object
+        """
+        with self.lock:
+            self.connections.remove(db)
+        try:
+            db.connection.close()
+        except Exception as e:
+            logger.debug(e)
+        self.slots.release()
+
+    @contextmanager
+    def acquire(self) -> Iterator[database]:
+        """
+        Context manager taking connection from pool for the duration of the block
+        :return: database object
+        """
+        db = self.get()
+        try:
+            yield db
+        except Exception:
+            self.discard(db)
+            raise
+        self.put(db)
+
+    def close(self) -> None:
+        """
+        Closes all connections opened by the pool
+        """
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for db in connections:
+            try:
+                db.connection.close()
+            except Exception as e:
+                logger.debug(e)
+        self.idle = queue.LifoQueue()
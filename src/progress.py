@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Iterator, TextIO
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress lines of tables being dumped
+REPORT_INTERVAL = 5.0
+METRICS_PREFIX = 'backdb_backup'
+
+
+def format_duration(seconds: float | None) -> str:
+    """
+    Formats duration as H:MM:SS
+    :param seconds: duration in seconds
+    :return: formatted duration, unknown when duration can not be estimated
+    """
+    if seconds is None:
+        return 'unknown'
+    return str(timedelta(seconds=round(seconds)))
+
+
+def format_size(size: int) -> str:
+    """
+    Formats number of bytes for humans
+    :param size: number of bytes
+    :return: size in B, KiB, MiB or GiB
+    """
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+class Progress:
+    def __init__(self, estimates: dict = None, interval: float = REPORT_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic, stream: TextIO = None) -> None:
+        """
+        Tracks rows and bytes of dumped tables against server estimates, reports progress with
+        rows/s and ETA and collects per-table and per-phase metrics of the run,
+        rows may be reported from several dumping threads
+        :param estimates: {table: {'rows': estimated rows, 'bytes': estimated size}} read from server statistics
+        :param interval: seconds between progress lines
+        :param clock: monotonic time source
+        :param stream: text stream progress lines are written into, stderr by default so progress
+            is shown without verbose logging
+        """
+        self.estimates = estimates or {}
+        self.interval = interval
+        self.clock = clock
+        self.stream = stream if stream is not None else sys.stderr
+        self.started = clock()
+        self.last_report = self.started
+        self.tables = {}
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def table_stats(self, table: str) -> dict:
+        """
+        Returns stats of table, table starts once its first rows are reported
+        :param table: table name
+        :return: {'rows', 'bytes', 'started', 'seconds'}
+        """
+        if table not in self.tables:
+            self.tables[table] = {'rows': 0, 'bytes': None, 'started': self.clock(), 'seconds': None}
+        return self.tables[table]
+
+    def advance(self, table: str, rows: int) -> None:
+        """
+        Counts fetched rows of table and reports progress once report interval passes
+        :param table: table name
+        :param rows: number of rows fetched since last call
+        """
+        with self.lock:
+            stats = self.table_stats(table)
+            stats['rows'] += rows
+            now = self.clock()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            estimated = self.estimates.get(table, {}).get('rows')
+            done = f'{stats["rows"]}/{estimated} rows ({min(stats["rows"] / estimated, 1):.0%})' \
+                if estimated else f'{stats["rows"]} rows'
+            self.report(f'{table}: {done}, {self.rate(stats, now):.0f} rows/s, ETA {format_duration(self.eta(now))}')
+
+    def finish_table(self, table: str, rows: int = None, size: int = None) -> None:
+        """
+        Marks table as dumped and reports its throughput, table dumped in parts is finished by every part
+        :param table: table name
+        :param rows: number of written rows, rows reported by advance are kept if not set
+        :param size: number of bytes written for the table or its part
+        """
+        with self.lock:
+            stats = self.table_stats(table)
+            now = self.clock()
+            if rows is not None:
+                stats['rows'] = rows
+            if size is not None:
+                stats['bytes'] = (stats['bytes'] or 0) + size
+            stats['seconds'] = now - stats['started']
+            written = f', {format_size(stats["bytes"])}' if stats['bytes'] is not None else ''
+            self.report(f'{table}: {stats["rows"]} rows{written} in {format_duration(stats["seconds"])} '
+                        f'({self.rate(stats, now):.0f} rows/s), ETA {format_duration(self.eta(now))}')
+
+    def report(self, line: str) -> None:
+        """
+        Writes progress line into stream, default logging level hides info messages
+        :param line: progress line
+        """
+        print(line, file=self.stream, flush=True)
+
+    @staticmethod
+    def rate(stats: dict, now: float) -> float:
+        """
+        Returns rows per second of table
+        :param stats: table stats
+        :param now: current time
+        :return: rows per second
+        """
+        seconds = stats['seconds'] if stats['seconds'] is not None else now - stats['started']
+        return stats['rows'] / seconds if seconds > 0 else 0.0
+
+    def eta(self, now: float) -> float | None:
+        """
+        Estimates seconds left from rows still expected by server estimates and rows/s of the run so far
+        :param now: current time
+        :return: seconds or None while nothing is dumped or nothing is estimated
+        """
+        if not self.tables or not self.estimates:
+            return None
+        remaining = 0
+        for table, estimate in self.estimates.items():
+            stats = self.tables.get(table)
+            if stats is None:
+                remaining += estimate['rows'] or 0
+            elif stats['seconds'] is None:
+                remaining += max((estimate['rows'] or 0) - stats['rows'], 0)
+        first_started = min(stats['started'] for stats in self.tables.values())
+        dumped = sum(stats['rows'] for stats in self.tables.values())
+        if not dumped or now <= first_started:
+            return None
+        return remaining / (dumped / (now - first_started))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measures time spent in phase of the run
+        :param name: phase name
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self.clock() - start
+
+    def metrics(self) -> dict:
+        """
+        Collects metrics of the run
+        :return: {'seconds', 'rows', 'bytes', 'phases': {phase: seconds}, 'tables': {table: {'rows', 'bytes',
+            'seconds', 'rows_per_second', 'estimated_rows', 'estimated_bytes'}}}
+        """
+        now = self.clock()
+        with self.lock:
+            tables = {}
+            for table, stats in sorted(self.tables.items()):
+                estimate = self.estimates.get(table, {})
+                tables[table] = {
+                    'rows': stats['rows'],
+                    'bytes': stats['bytes'],
+                    'seconds': round(stats['seconds'] if stats['seconds'] is not None else now - stats['started'], 3),
+                    'rows_per_second': round(self.rate(stats, now), 1),
+                    'estimated_rows': estimate.get('rows'),
+                    'estimated_bytes': estimate.get('bytes'),
+                }
+        return {
+            'seconds': round(now - self.started, 3),
+            'rows': sum(stats['rows'] for stats in tables.values()),
+            'bytes': sum(stats['bytes'] or 0 for stats in tables.values()),
+            'phases': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            'tables': tables,
+        }
+
+
+def escape_label(value: str) -> str:
+    """
+    Escapes Prometheus label value
+    :param value: label value
+    :return: escaped value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_metrics(metrics: dict, labels: dict) -> str:
+    """
+    Formats run metrics in Prometheus text exposition format for node exporter textfile collector
+    :param metrics: metrics returned by Progress.metrics extended with 'finished' unix timestamp
+    :param labels: labels of every sample (database, db_type)
+    :return: text of metrics file
+    """
+    families = [
+        ('duration_seconds', 'Duration of backup run', [({}, metrics['seconds'])]),
+        ('rows', 'Rows written by backup run', [({}, metrics['rows'])]),
+        ('bytes', 'Bytes written by backup run', [({}, metrics['bytes'])]),
+        ('finished_timestamp_seconds', 'Unix time backup run finished', [({}, metrics['finished'])]),
+        ('phase_duration_seconds', 'Duration of backup run phase',
+         [({'phase': phase}, seconds) for phase, seconds in metrics['phases'].items()]),
+        ('table_rows', 'Rows written for table',
+         [({'table': table}, stats['rows']) for table, stats in metrics['tables'].items()]),
+        ('table_bytes', 'Bytes written for table',
+         [({'table': table}, stats['bytes']) for table, stats in metrics['tables'].items()
+          if stats['bytes'] is not None]),
+        ('table_duration_seconds', 'Time spent dumping table',
+         [({'table': table}, stats['seconds']) for table, stats in metrics['tables'].items()]),
+        ('table_rows_per_second', 'Dump throughput of table',
+         [({'table': table}, stats['rows_per_second']) for table, stats in metrics['tables'].items()]),
+    ]
+    lines = []
+    for name, description, samples in families:
+        lines.append(f'# HELP {METRICS_PREFIX}_{name} {description}')
+        lines.append(f'# TYPE {METRICS_PREFIX}_{name} gauge')
+        for sample_labels, value in samples:
+            label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in {**labels, **sample_labels}.items())
+            lines.append(f'{METRICS_PREFIX}_{name}{{{label_text}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(folder: str, name: str, metrics: dict, labels: dict) -> None:
+    """
+    Writes run metrics as {name}.json and {name}.prom, files are replaced atomically
+    so collectors never read half written file
+    :param folder: folder the files are written to
+    :param name: file name without extension
+    :param metrics: metrics returned by Progress.metrics extended with 'finished' unix timestamp
+    :param labels: Prometheus labels of every sample
+    """
+    os.makedirs(folder, exist_ok=True)
+    for extension, text in (('json', json.dumps(metrics, indent=2) + '\n'),
+                            ('prom', prometheus_metrics(metrics, labels))):
+        path = os.path.join(folder, f'{name}.{extension}')
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(text)
+        os.replace(f'{path}.tmp', path)
+    logger.info(f'Wrote metrics of the run into {folder}')
@@ -0,0 +1,70 @@
+import logging
+import shutil
+
+from src.checkpoint import BACKUP_CHECKPOINT, read_journal
+from src.chunk_store import CHUNKS_FOLDER, ChunkStore
+from src.manifest import read_manifest, list_versions
+
+logger = logging.getLogger(__name__)
+
+
+class Prune:
+    def __init__(self, database_name: str, db_type: str, file: str = None, keep: int = None) -> None:
+        """
+        Removes old backup versions and chunks no remaining version references
+        :param database_name: database name
+        :param db_type: mysql or postgresql
+        :param file: folder holding backup versions
+        :param keep: number of newest versions to keep, all versions are kept by default
+        """
+        self.database_name = database_name
+        self.db_type = db_type
+        self.file = file
+        if self.file is None:
+            self.file = f'backup/{database_name}-{db_type}'
+        self.keep = keep
+
+    def prune(self) -> str:
+        """
+        Removes versions older than the kept ones unless a kept version depends on them,
+        then collects garbage in chunk store keeping chunks of versions and of interrupted backups
+        :return: Notification string
+        """
+        removed = []
+        if self.keep is not None:
+            versions = list_versions(self.file)
+            kept = self.dependencies(versions=versions[len(versions) - self.keep:] if self.keep > 0 else [])
+            for version in versions:
+                if version not in kept:
+                    logger.info(f'Removing version {version}')
+                    shutil.rmtree(f'{self.file}/{version}')
+                    removed.append(version)
+
+        referenced = set()
+        for version in list_versions(self.file):
+            manifest = read_manifest(f'{self.file}/{version}') or {}
+            for hashes in manifest.get('chunks', {}).values():
+                referenced.update(hashes)
+            # Interrupted backup has no manifest yet, chunks of its completed files are kept for resume
+            for record in read_journal(f'{self.file}/{version}/{BACKUP_CHECKPOINT}'):
+                referenced.update(record.get('chunks', []))
+        removed_chunks = ChunkStore(f'{self.file}/{CHUNKS_FOLDER}').collect_garbage(referenced=referenced)
+
+        return f'Removed {len(removed)} versions and {removed_chunks} chunks of {self.database_name}'
+
+    def dependencies(self, versions: list) -> set:
+        """
+        Adds versions the given ones are restored from, bases of incremental versions
+        and successors of reverse delta versions
+        :param versions: versions to keep
+        :return: versions with their dependencies
+        """
+        kept = set(versions)
+        pending = list(versions)
+        while pending:
+            manifest = read_manifest(f'{self.file}/{pending.pop()}') or {}
+            for dependency in (manifest.get('base'), manifest.get('successor')):
+                if dependency and dependency not in kept:
+                    kept.add(dependency)
+                    pending.append(dependency)
+        return kept
@@ -1,16 +1,53 @@
 import os
 import logging
+import shutil
+import tempfile
+from typing import Callable, Iterable, Iterator
 
+from src.checkpoint import BACKUP_CHECKPOINT, Checkpoint, restore_checkpoint
+from src.compression import compression_of
+from src.manifest import list_versions, read_manifest, version_paths, open_version_file
+from src.models.database import DATA_EXTENSIONS, statement_pattern
 from src.models import mysql_database as mysql
 from src.models import postgresql_database as postgresql
+from src.pool import ConnectionPool
+from src.scheduler import RestoreScheduler
+from src.sql_splitter import split_statements
 
 logger = logging.getLogger(__name__)
 
+# Statements changing session state are executed again when statements of interrupted run are skipped
+SESSION_STATEMENT = statement_pattern(r'SET|USE')
+
+
+class ResumedStatements:
+    def __init__(self, statements: Iterable[str], applied: int = 0) -> None:
+        """
+        Iterates statements of file skipping the ones committed by interrupted run, statements
+        changing session state among them are executed again and counted in replayed
+        :param statements: statements of file
+        :param applied: number of statements committed by interrupted run
+        """
+        self.statements = statements
+        self.applied = applied
+        self.replayed = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for index, statement in enumerate(self.statements):
+            if index >= self.applied:
+                yield statement
+            elif SESSION_STATEMENT.match(statement):
+                self.replayed += 1
+                yield statement
+            # Statement is released before the next one is read
+            del statement
+
 
 class Restore:
     def __init__(self, database_name: str, connection_string: str, db_type: str, file: str = None,
                  backup_version: str = None, restore_type: str = None,
-                 table_name: str = None) -> None:
+                 table_name: str = None, jobs: int = 1, statements_per_batch: int = None,
+                 statements_per_commit: int = None, resume: bool = False) -> None:
         self.db_type = db_type
         self.database_name = database_name
         self.file = file
@@ -20,111 +57,292 @@ class Restore:
         self.restore_type = restore_type
         self.table_name = table_name
         self.connection_string = connection_string
+        self.jobs = jobs
+        self.statements_per_batch = statements_per_batch
+        self.statements_per_commit = statements_per_commit
         self.backup_version = backup_version
         if self.backup_version is None:
-            filenames = os.listdir(self.file)
-            self.backup_version = max(filenames)
+            # Versions whose backup was interrupted are not complete
+            versions = [version for version in list_versions(self.file)
+                        if not os.path.isfile(f'{self.file}/{version}/{BACKUP_CHECKPOINT}')]
+            # Versions named by timestamp are preferred over folders named otherwise
+            versions = [version for version in versions if version.isdigit()] or versions
+            if not versions:
+                raise ValueError(f'No complete backup version in {self.file}')
+            self.backup_version = versions[-1]
+        # Files and statements applied by interrupted restore are skipped when it is resumed
+        self.resume = resume
+        self.checkpoint = None
+        self.restored = set()
+        self.applied = {}
+        # Files of a run are restored over the same connections, one per parallel job
+        self.pool = ConnectionPool(connect=self.connect, max_size=max(jobs, 1))
         logger.info(f'Database server is {self.db_type}')
 
 
-    def restore_sql(self, sql: str) -> str:
-        db = None
+    def restore_sql(self, sql: str | Iterable[str], on_commit: Callable[[int], None] = None) -> bool:
+        """
+        Executes sql code or iterator of statements
+        :param sql: sql code or statements
+        :param on_commit: called after every commit with number of committed statements
+        :return: True if success
+        """
+        with self.pool.acquire() as db:
+            return db.restore_database_sql(sql=sql, on_commit=on_commit)
+
+    def restore_bulk(self, path: str, data_format: str) -> bool:
+        """
+        Loads table data file produced in bulk load format
+        :param path: path to data file named {table}.DML.{extension}
+        :param data_format: data format of the file
+        :return: True if success
+        """
+        table = os.path.basename(path).split('.')[0]
+        with self.pool.acquire() as db, open_version_file(path) as f:
+            if data_format == 'tsv' and (not os.path.isfile(path) or compression_of(path)):
+                # LOAD DATA LOCAL INFILE reads file by name, chunked or compressed file is put together first
+                with tempfile.NamedTemporaryFile(suffix='.tsv') as temp:
+                    shutil.copyfileobj(f, temp)
+                    temp.seek(0)
+                    return db.restore_table_data_bulk(source=temp, table=table, data_format=data_format)
+            return db.restore_table_data_bulk(source=f, table=table, data_format=data_format)
+
+    def restore_file(self, path: str, byte_range: list = None):
+        """
+        Restores one backup file choosing loader by file extension
+        :param path: path to backup file
+        :param byte_range: [start, end) offsets of table section to restore instead of the whole sql file
+        """
+        key = os.path.relpath(path, self.file) + (f':{byte_range[0]}-{byte_range[1]}' if byte_range else '')
+        if key in self.restored:
+            logger.info(f'{key} was restored by interrupted run')
+            return True
+
+        name = path.rsplit('.', 1)[0] if compression_of(path) else path
+        extension = name.rsplit('.', 1)[-1]
+        bulk_format = next((data_format for data_format, data_extension in DATA_EXTENSIONS.items()
+                            if data_format != 'sql' and extension == data_extension), None)
+        if bulk_format is not None:
+            result = self.restore_bulk(path=path, data_format=bulk_format)
+        else:
+            applied = self.applied.get(key, 0)
+            if applied:
+                logger.info(f'Skipping {applied} statements of {key} committed by interrupted run')
+            with open_version_file(path, byte_range=byte_range) as f:
+                statements = ResumedStatements(statements=split_statements(f, dialect=self.db_type), applied=applied)
+
+                def on_commit(committed: int) -> None:
+                    # Session statements executed again are not statements of the file past applied ones
+                    committed = applied + max(committed - statements.replayed, 0)
+                    self.record_checkpoint({'file': key, 'statements': committed})
+
+                result = self.restore_sql(sql=statements, on_commit=on_commit)
+        self.record_checkpoint({'file': key, 'done': True})
+        return result
+
+    def record_checkpoint(self, record: dict) -> None:
+        """
+        Records progress of restored file in checkpoint journal of the run
+        :param record: {'file': path relative to backup folder with byte range, 'statements' or 'done'}
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.record(record)
+
+    def read_checkpoint(self) -> None:
+        """
+        Opens checkpoint journal of restore in restored version folder, with resume files restored and
+        statements committed by interrupted run are read from it
+        """
+        self.checkpoint = Checkpoint(f'{self.file}/{self.backup_version}/{restore_checkpoint(self.database_name)}',
+                                     resume=self.resume)
+        for record in self.checkpoint.records:
+            if record.get('done'):
+                self.restored.add(record['file'])
+            else:
+                self.applied[record['file']] = record['statements']
+        if self.checkpoint.records:
+            logger.info(f'{len(self.restored)} files were restored by interrupted run')
+
+    def connect(self):
+        """
+        Opens new connection to database
+        :return: database object
+        """
         if self.db_type == 'mysql':
-            db = mysql.mysql(connection_string=self.connection_string, database_name=self.database_name)
+            return mysql.mysql(connection_string=self.connection_string, database_name=self.database_name,
+                               statements_per_batch=self.statements_per_batch,
+                               statements_per_commit=self.statements_per_commit)
         elif self.db_type == 'postgresql':
-            db = postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name)
-        return db.restore_database_sql(sql=sql)
+            return postgresql.postgresql(connection_string=self.connection_string, database_name=self.database_name,
+                                         statements_per_batch=self.statements_per_batch,
+                                         statements_per_commit=self.statements_per_commit)
+
+    def restore_data_files(self, entries: list, foreign_keys: list = None) -> None:
+        """
+        Restores table data files, with more than one job tables are loaded concurrently
+        in order allowed by foreign keys of restored structure, larger tables first
+        :param entries: manifest entries of data files or table sections planned by plan_files
+        :param foreign_keys: (table, referenced table) pairs saved in manifest, read from database if not set
+        """
+        if self.jobs <= 1:
+            for entry in entries:
+                self.restore_file(path=entry['path'], byte_range=entry.get('range'))
+            return
+
+        table_entries = {}
+        sizes = {}
+        for entry in entries:
+            table_entries.setdefault(entry['table'], []).append(entry)
+            sizes[entry['table']] = sizes.get(entry['table'], 0) + (entry.get('bytes') or 0)
+
+        if foreign_keys is None:
+            with self.pool.acquire() as db:
+                foreign_keys = db.get_foreign_keys()
+
+        scheduler = RestoreScheduler(tables=list(table_entries), dependencies=foreign_keys, jobs=self.jobs, sizes=sizes)
+        scheduler.run(lambda table: [self.restore_file(path=entry['path'], byte_range=entry.get('range'))
+                                     for entry in table_entries[table]])
 
     def restore_database(self):
         """
-        Delegates restoration tasks to another methods
+        Restores backup version and closes connections opened for it
         """
-        version_folder = f'{self.file}/{self.backup_version}'
-        logger.debug(f'Backups folder is: {version_folder}')
-        files = []
-        if self.table_name:
-            logger.info('Table is set, searching folder for table backup.')
-            for file in os.listdir(version_folder):
-                if self.table_name in file:
-                    files.append(self.table_name)
+        if os.path.isfile(f'{self.file}/{self.backup_version}/{BACKUP_CHECKPOINT}'):
+            raise ValueError(f'Backup of version {self.backup_version} was interrupted, complete it with backup --resume')
+        self.read_checkpoint()
+        try:
+            chain = self.backup_chain()
+            if len(chain) == 1 or self.restore_type == 'structure':
+                result = self.restore_version()
+            else:
+                result = self.restore_chain(chain=chain)
+            self.checkpoint.remove()
+            return result
+        finally:
+            self.checkpoint.close()
+            self.pool.close()
+
+    def backup_chain(self) -> list:
+        """
+        Follows incremental backup versions down to the full version they are based on
+        :return: versions from full version to restored one
+        """
+        chain = [self.backup_version]
+        manifest = read_manifest(f'{self.file}/{self.backup_version}')
+        while manifest and manifest.get('base'):
+            base = manifest['base']
+            if not os.path.isdir(f'{self.file}/{base}'):
+                raise FileNotFoundError(f'Version {base} which {chain[0]} is based on does not exist')
+            chain.insert(0, base)
+            manifest = read_manifest(f'{self.file}/{base}')
+        return chain
+
+    def restore_chain(self, chain: list) -> str:
+        """
+        Restores full version and replays data of incremental versions based on it in order,
+        incremental data files update rows which already exist
+        :param chain: versions from full version to restored one
+        :return: Notification string
+        """
+        result = self.restore_version(backup_version=chain[0])
+        known_files = {entry['file'] for entry in self.plan_files(backup_version=chain[0])[0]}
+        for version in chain[1:]:
+            logger.info(f'Applying incremental version {version}')
+            entries, _ = self.plan_files(backup_version=version)
+            # Tables created after the full version
+            for entry in entries:
+                if entry['kind'] == 'ddl' and entry['file'] not in known_files:
+                    self.restore_file(path=entry['path'])
+            known_files.update(entry['file'] for entry in entries)
+            self.restore_version(backup_version=version, restore_type='data')
+        return result
+
+    def plan_files(self, backup_version: str) -> tuple[list, dict]:
+        """
+        Lists files of backup version from its manifest, files of versions written without manifest
+        are recognized by name, with table set only files of that table and its sections inside
+        files of several tables are listed
+        :param backup_version: version name
+        :return: manifest entries extended with file path ordered so referenced tables come first, and manifest
+        """
+        paths = version_paths(folder=self.file, version=backup_version)
+        manifest = read_manifest(f'{self.file}/{backup_version}') or {}
+        if 'files' in manifest:
+            entries = [dict(entry, path=paths[entry['file']]) for entry in manifest['files'].values()]
         else:
-            logger.info('Table is not set, selecting all files in directory.')
-            files = os.listdir(version_folder)
-        logger.debug(f'Found files in {version_folder}: {files}')
+            logger.debug(f'Version {backup_version} has no file index, recognizing files by name')
+            entries = [self.recognize_file(name=name, path=path) for name, path in paths.items()]
+
+        if self.table_name:
+            selected = []
+            for entry in entries:
+                if entry['table'] == self.table_name:
+                    selected.append(entry)
+                for kind, byte_range in entry.get('sections', {}).get(self.table_name, {}).items():
+                    selected.append(dict(entry, table=self.table_name, kind=kind, range=byte_range,
+                                         bytes=byte_range[1] - byte_range[0]))
+            entries = selected
+        order = manifest.get('tables', {}).get('order', [])
+        positions = {table: position for position, table in enumerate(order)}
+        # Parts of table dumped by primary key ranges are restored one after another as data of the table
+        entries.sort(key=lambda entry: (positions.get(entry['table'], len(order)), entry.get('part') or 0))
+        return entries, manifest
+
+    @staticmethod
+    def recognize_file(name: str, path: str) -> dict:
+        """
+        Creates manifest entry of file from its name
+        :param name: file name
+        :param path: file path
+        :return: manifest entry
+        """
+        kind = 'other'
+        for code in ('DDL', 'DML', 'DCL'):
+            if code in name:
+                kind = code.lower()
+                break
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        return {'file': name, 'path': path, 'table': name.split('.')[0], 'kind': kind, 'bytes': size}
+
+    def restore_version(self, backup_version: str = None, restore_type: str = None):
+        """
+        Delegates restoration tasks to another methods
+        :param backup_version: version to restore, restored version of the run by default
+        :param restore_type: structure or data, restore type of the run by default
+        """
+        restore_type = restore_type or self.restore_type
+        backup_version = backup_version or self.backup_version
+        logger.debug(f'Backups folder is: {self.file}/{backup_version}')
+        entries, manifest = self.plan_files(backup_version=backup_version)
+        logger.debug(f'Planned files of {backup_version}: {[entry["file"] for entry in entries]}')
         sql_types = {
             "ddl": [],
             "dml": [],
             "dcl": []
         }
+        for entry in entries:
+            if entry['kind'] in sql_types:
+                sql_types[entry['kind']].append(entry)
+            elif entry['kind'] != {'structure': 'data', 'data': 'structure'}.get(restore_type):
+                # Files holding several tables are restored as they are
+                logger.debug(f'Processing {entry["file"]}')
+                self.restore_file(path=entry['path'])
 
-        if self.restore_type:
-            match self.restore_type:
-                case 'structure':
-                    for file in files:
-                        logger.debug(f'Processing {file}')
-                        if "DDL" in file:
-                            sql_types["ddl"].append(file)
-                        elif "DML" in file:
-                            continue
-                        elif "DCL" in file:
-                            continue
-                        else:
-                            with open(version_folder + '/' + file, 'r') as f:
-                                sql = f.read()
-                            self.restore_sql(sql=sql)
-                        for sql_file in sql_types["ddl"]:
-                            with open(version_folder + '/' + sql_file, 'r') as f:
-                                sql = f.read()
-                            self.restore_sql(sql=sql)
-                    return f"Restored {self.database_name} database structure"
-                case 'data':
-                    for file in files:
-                        logger.debug(f'Processing {file}')
-                        if "DDL" in file:
-                            continue
-                        elif "DML" in file:
-                            sql_types["dml"].append(file)
-                        elif "DCL" in file:
-                            continue
-                        else:
-                            with open(version_folder + '/' + file, 'r') as f:
-                                sql = f.read()
-                            self.restore_sql(sql=sql)
-                        for sql_file in sql_types["dml"]:
-                            with open(version_folder + '/' + sql_file, 'r') as f:
-                                sql = f.read()
-                                self.restore_sql(sql=sql)
-                    return f"Restored {self.database_name} database data"
+        if restore_type != 'data':
+            for entry in sql_types["ddl"]:
+                self.restore_file(path=entry['path'], byte_range=entry.get('range'))
 
-        else:
-            for file in files:
-                logger.debug(f'Processing {file}')
-                if "DDL" in file:
-                    sql_types["ddl"].append(file)
-                elif "DML" in file:
-                    sql_types["dml"].append(file)
-                elif "DCL" in file:
-                    sql_types["dcl"].append(file)
-                else:
-                    with open(version_folder + '/' + file, 'r') as f:
-                        sql = f.read()
-                    self.restore_sql(sql=sql)
-
-            for sql_file in sql_types["ddl"]:
-                with open(version_folder + '/' + sql_file, 'r') as f:
-                    sql = f.read()
-                self.restore_sql(sql=sql)
-
-            for sql_file in sql_types["dml"]:
-                with open(version_folder + '/' + sql_file, 'r') as f:
-                    sql = f.read()
-                self.restore_sql(sql=sql)
-
-            for sql_file in sql_types["dcl"]:
-                with open(version_folder + '/' + sql_file, 'r') as f:
-                    sql = f.read()
-                self.restore_sql(sql=sql)
-
-            return f"Restored {self.database_name} database"
+        if restore_type != 'structure':
+            self.restore_data_files(entries=sql_types["dml"],
+                                    foreign_keys=manifest.get('tables', {}).get('foreign_keys'))
 
+        if restore_type is None:
+            for entry in sql_types["dcl"]:
+                self.restore_file(path=entry['path'])
 
+        match restore_type:
+            case 'structure':
+                return f"Restored {self.database_name} database structure"
+            case 'data':
+                return f"Restored {self.database_name} database data"
+        return f"Restored {self.database_name} database"
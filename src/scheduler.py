@@ -0,0 +1,95 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+
+import networkx as nx
+
+logger = logging.getLogger(__name__)
+
+
+def dependency_graph(tables: list, dependencies: list) -> nx.DiGraph:
+    """
+    Builds graph of tables with edges from referenced tables to tables referencing them,
+    tables referencing each other in a cycle collapse into one node
+    :param tables: tables
+    :param dependencies: list of (table, referenced table) pairs
+    :return: condensed graph which nodes have members attribute
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(tables)
+    for table, referenced_table in dependencies:
+        if table in graph and referenced_table in graph and table != referenced_table:
+            graph.add_edge(referenced_table, table)
+    return nx.condensation(graph)
+
+
+def dependency_order(tables: list, dependencies: list) -> list:
+    """
+    Orders tables so every table comes after tables it references
+    :param tables: tables
+    :param dependencies: list of (table, referenced table) pairs
+    :return: ordered tables
+    """
+    graph = dependency_graph(tables=tables, dependencies=dependencies)
+    nodes = nx.lexicographical_topological_sort(graph, key=lambda node: min(graph.nodes[node]['members']))
+    return [table for node in nodes for table in sorted(graph.nodes[node]['members'])]
+
+
+class RestoreScheduler:
+    def __init__(self, tables: list, dependencies: list, jobs: int = 1, sizes: dict = None) -> None:
+        """
+        Builds load order graph of tables from foreign keys
+        :param tables: tables which data is restored
+        :param dependencies: list of (table, referenced table) pairs
+        :param jobs: number of tables loaded concurrently
+        :param sizes: data size of tables, larger tables which are ready are started first
+        """
+        self.jobs = jobs
+        self.sizes = sizes or {}
+        # Tables referencing each other in a cycle collapse into one node and are loaded one after another
+        self.graph = dependency_graph(tables=tables, dependencies=dependencies)
+
+    def by_size(self, nodes: list) -> list:
+        """
+        Sorts graph nodes from the largest data size
+        :param nodes: nodes of condensed graph
+        :return: sorted nodes
+        """
+        return sorted(nodes, key=lambda node: -sum(self.sizes.get(table, 0)
+                                                   for table in self.graph.nodes[node]['members']))
+
+    def run(self, load: Callable[[str], None]) -> None:
+        """
+        Loads every table as soon as all tables it references are loaded
+        :param load: function loading data of one table, called from worker threads
+        """
+        pending = {node: self.graph.in_degree(node) for node in self.graph}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            running = {}
+            ready = [node for node, dependencies_count in pending.items() if dependencies_count == 0]
+            for node in self.by_size(ready):
+                running[executor.submit(self.load_group, load, node)] = node
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    future.result()
+                    ready = []
+                    for successor in self.graph.successors(node):
+                        pending[successor] -= 1
+                        if pending[successor] == 0:
+                            ready.append(successor)
+                    for successor in self.by_size(ready):
+                        running[executor.submit(self.load_group, load, successor)] = successor
+
+    def load_group(self, load: Callable[[str], None], node: int) -> None:
+        """
+        Loads all tables of one graph node
+        :param load: function loading data of one table
+        :param node: node of condensed graph
+        """
+        for table in sorted(self.graph.nodes[node]['members']):
+            logger.info(f'Restoring data of {table}')
+            load(table)
@@ -0,0 +1,303 @@
+import io
+import logging
+import mmap
+import os
+import re
+from typing import BinaryIO, Iterator
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Files bigger than this are scanned through mmap instead of being read chunk by chunk
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# Longest multi byte token searched for besides delimiter (postgresql dollar quote tag)
+TOKEN_OVERLAP = 64
+
+DELIMITER_COMMAND = re.compile(rb'\s*delimiter[ \t]+(\S+)[ \t]*(\r?\n)?', re.IGNORECASE)
+DOLLAR_TAG = re.compile(rb'\$([A-Za-z_][A-Za-z_0-9]*)?\$')
+NEW_LINE = re.compile(rb'\n')
+BLOCK_COMMENT_END = re.compile(rb'\*/')
+BLOCK_COMMENT_BOUNDARY = re.compile(rb'/\*|\*/')
+WHITESPACE = b' \t\r\n\f\v'
+
+
+class StatementSplitter:
+    def __init__(self, dialect: str = 'mysql', chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Splits sql script into statements without loading it into memory, understands quoted strings
+        and identifiers, backslash escapes, comments, postgresql dollar quoting and mysql DELIMITER command.
+        Bytes of a statement are released once it is decoded, so memory is bounded by one chunk
+        and the statement being handed out
+        :param dialect: mysql or postgresql
+        :param chunk_size: number of bytes read from file at once
+        """
+        self.dialect = dialect
+        self.chunk_size = chunk_size
+        self.quote_patterns = {
+            (quote, escapes): re.compile(b'[\\\\' + quote + b']' if escapes else re.escape(quote))
+            for quote in (b"'", b'"', b'`') for escapes in (True, False)
+        }
+        self.set_delimiter(b';')
+
+    def set_delimiter(self, delimiter: bytes) -> None:
+        """
+        Changes statement delimiter
+        :param delimiter: new delimiter
+        """
+        self.delimiter = delimiter
+        specials = b"'\"`#/-" if self.dialect == 'mysql' else b"'\"/$-"
+        # Delimiter is tried first so delimiters starting with a special character (// or --) are recognized
+        self.code_pattern = re.compile(re.escape(delimiter) + b'|[' + re.escape(specials) + b']')
+
+    def split(self, source) -> Iterator[str]:
+        """
+        Yields statements of sql script one by one
+        :param source: bytes-like object (bytes, mmap) or binary file object read in chunks
+        :return: iterator of statements without trailing delimiter
+        """
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.buffer, self.source, self.eof = source, None, True
+        else:
+            self.buffer, self.source, self.eof = bytearray(), source, False
+        self.start = self.pos = 0
+        self.has_code = False
+
+        while True:
+            match = self.search(self.code_pattern)
+            if match and match.group() != self.delimiter \
+                    and match.start() + len(self.delimiter) > len(self.buffer) and self.refill():
+                # Special character may be the beginning of delimiter cut by chunk boundary
+                continue
+            end = match.start() if match else len(self.buffer)
+            if not self.has_code and self.buffer[self.pos:end].strip():
+                if self.read_delimiter_command():
+                    continue
+                self.has_code = True
+            if match is None:
+                break
+
+            token = match.group()
+            self.pos = match.end()
+            if token == self.delimiter:
+                # Match refers to the buffer, it would keep released buffer alive while statement is executed
+                match = None
+                if self.has_code:
+                    yield self.take_statement(end=end)
+                self.start = self.pos
+                self.has_code = False
+            elif token in (b"'", b'"', b'`'):
+                self.has_code = True
+                self.skip_quoted(token, escapes=self.has_escapes(token, match.start()))
+            elif token == b'-':
+                following = self.peek(2)
+                if following[:1] == b'-' and (self.dialect != 'mysql' or following[1:] in (b'', b' ', b'\t',
+                                                                                          b'\r', b'\n')):
+                    self.skip_until(NEW_LINE)
+                else:
+                    self.has_code = True
+            elif token == b'#':
+                self.skip_until(NEW_LINE)
+            elif token == b'/':
+                following = self.peek(2)
+                if following[:1] == b'*':
+                    # mysql /*! ... */ comments are executed by the server
+                    if following[1:] == b'!':
+                        self.has_code = True
+                    self.pos += 1
+                    self.skip_block_comment()
+                else:
+                    self.has_code = True
+            elif token == b'$':
+                self.has_code = True
+                self.pos -= 1
+                self.peek(64)
+                tag = DOLLAR_TAG.match(self.buffer, self.pos)
+                self.pos += 1
+                if tag:
+                    self.pos = tag.end()
+                    self.skip_until(re.compile(re.escape(tag.group())))
+
+        if self.has_code:
+            yield self.statement(end=len(self.buffer))
+
+    def take_statement(self, end: int) -> str:
+        """
+        Decodes statement ending at end and releases its bytes, buffer grown by a statement bigger than
+        a chunk is replaced by its unread tail, so the statement is not kept twice while it is executed
+        :param end: end offset of statement in buffer
+        :return: statement text
+        """
+        text = self.statement(end=end)
+        if self.source is not None and self.pos > self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.start = self.pos
+        return text
+
+    def statement(self, end: int) -> str:
+        """
+        Decodes statement from start to end
+        :param end: end offset of statement in buffer
+        :return: statement text
+        """
+        start = self.start
+        while start < end and self.buffer[start] in WHITESPACE:
+            start += 1
+        while end > start and self.buffer[end - 1] in WHITESPACE:
+            end -= 1
+        # Decoding through memoryview does not copy statement bytes out of the buffer first
+        with memoryview(self.buffer) as view, view[start:end] as statement:
+            return str(statement, 'utf-8')
+
+    def has_escapes(self, quote: bytes, offset: int) -> bool:
+        """
+        Checks if backslash escapes characters inside quoted string starting at offset
+        :param quote: opening quote
+        :param offset: offset of opening quote in buffer
+        :return: True if backslash is an escape character
+        """
+        if self.dialect == 'mysql':
+            return quote != b'`'
+        # postgresql only escapes in E'...' strings
+        return quote == b"'" and offset > self.start and self.buffer[offset - 1:offset] in (b'E', b'e')
+
+    def refill(self) -> bool:
+        """
+        Drops bytes of already yielded statements and reads next chunk from source
+        :return: False when source is exhausted
+        """
+        if self.eof:
+            return False
+        chunk = self.source.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        shift = self.start
+        del self.buffer[:shift]
+        self.buffer += chunk
+        self.start = 0
+        self.pos -= shift
+        return True
+
+    def search(self, pattern: re.Pattern):
+        """
+        Searches pattern from current position reading more chunks while nothing is found
+        :param pattern: compiled pattern
+        :return: match or None if source ended
+        """
+        scan_from = self.pos
+        while True:
+            match = pattern.search(self.buffer, scan_from)
+            if match:
+                return match
+            # Rescan a tail which may hold the beginning of a multi byte token
+            scan_from = max(self.pos, len(self.buffer) - len(self.delimiter) - TOKEN_OVERLAP) - self.start
+            if not self.refill():
+                return None
+
+    def peek(self, size: int) -> bytes:
+        """
+        Returns up to size bytes from current position reading more chunks if needed
+        :param size: number of bytes
+        :return: bytes after current position
+        """
+        while len(self.buffer) < self.pos + size and self.refill():
+            pass
+        return bytes(self.buffer[self.pos:self.pos + size])
+
+    def skip_until(self, pattern: re.Pattern) -> None:
+        """
+        Moves current position after the next match of pattern or to the end of script
+        :param pattern: compiled pattern
+        """
+        match = self.search(pattern)
+        self.pos = match.end() if match else len(self.buffer)
+
+    def skip_block_comment(self) -> None:
+        """
+        Moves current position after the end of block comment, postgresql block comments nest
+        so the comment ends once every nested comment is closed
+        """
+        if self.dialect == 'mysql':
+            self.skip_until(BLOCK_COMMENT_END)
+            return
+        depth = 1
+        while depth:
+            match = self.search(BLOCK_COMMENT_BOUNDARY)
+            if match is None:
+                self.pos = len(self.buffer)
+                return
+            self.pos = match.end()
+            depth += 1 if match.group() == b'/*' else -1
+
+    def skip_quoted(self, quote: bytes, escapes: bool) -> None:
+        """
+        Moves current position after closing quote, doubled quotes are part of the string
+        :param quote: opening quote
+        :param escapes: True if backslash escapes next character
+        """
+        pattern = self.quote_patterns[(quote, escapes)]
+        while True:
+            match = self.search(pattern)
+            if match is None:
+                logger.warning('Unterminated quoted string in sql script')
+                self.pos = len(self.buffer)
+                return
+            self.pos = match.end()
+            if match.group() == b'\\':
+                self.peek(1)
+                self.pos += 1
+            elif self.peek(1) == quote:
+                self.pos += 1
+            else:
+                return
+
+    def read_delimiter_command(self) -> bool:
+        """
+        Handles mysql client DELIMITER command at current position, the command is not sent to server
+        :return: True if command was found
+        """
+        if self.dialect != 'mysql':
+            return False
+        while True:
+            match = DELIMITER_COMMAND.match(self.buffer, self.pos)
+            if match is None:
+                return False
+            if match.group(2) or not self.refill():
+                break
+        self.set_delimiter(match.group(1))
+        logger.debug(f'Statement delimiter is {match.group(1)}')
+        self.start = self.pos = match.end()
+        return True
+
+
+def split_statements(source: BinaryIO, dialect: str = 'mysql') -> Iterator[str]:
+    """
+    Yields statements of sql file, files bigger than MMAP_THRESHOLD are scanned through mmap
+    :param source: binary file object
+    :param dialect: mysql or postgresql
+    :return: iterator of statements
+    """
+    splitter = StatementSplitter(dialect=dialect)
+    size = 0
+    if isinstance(source, io.IOBase):
+        try:
+            size = os.fstat(source.fileno()).st_size
+        except (OSError, ValueError):
+            pass
+
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from splitter.split(data)
+    else:
+        yield from splitter.split(source)
+
+
+def split_sql(sql: str, dialect: str = 'mysql') -> Iterator[str]:
+    """
+    Yields statements of sql code held in memory
+    :param sql: sql code
+    :param dialect: mysql or postgresql
+    :return: iterator of statements
+    """
+    return StatementSplitter(dialect=dialect).split(sql.encode('utf-8'))
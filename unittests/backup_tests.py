@@ -1,11 +1,34 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
 from datetime import datetime
 from src.backup import Backup
 
+# Backups of the tests are taken at fixed time so name of version folder is known
+NOW = datetime(2024, 6, 1, 12, 0)
+VERSION = str(int(NOW.timestamp()))
+
+
+def freeze_time(test: unittest.TestCase) -> None:
+    clock = patch('src.backup.datetime', wraps=datetime)
+    clock.start().now.return_value = NOW
+    test.addCleanup(clock.stop)
+
+
 class TestBackup(unittest.TestCase):
 
+    def setUp(self):
+        # Files of these backups are mocked, checkpoint journal is not written either
+        checkpoint = patch('src.backup.Checkpoint')
+        checkpoint.start().return_value.records = []
+        self.addCleanup(checkpoint.stop)
+        freeze_time(self)
+
     @patch('os.makedirs')
     def test_backup_init_without_directory(self, mock_makedirs):
         backup = Backup(db_type="postgresql", database_name="test_db", connection_string="test_conn")
@@ -20,7 +43,7 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db's structure!")
-                mock_file.assert_called_once_with(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/test_db-structure.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/test_db-structure.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_database_structure_postgresql(self, mock_makedirs):
@@ -31,7 +54,7 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db's structure!")
-                mock_file.assert_called_once_with(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/test_db-structure.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/test_db-structure.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_database_data_mysql(self, mock_makedirs):
@@ -42,7 +65,7 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db's data!")
-                mock_file.assert_called_once_with(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/test_db-data.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/test_db-data.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_database_data_postgresql(self, mock_makedirs):
@@ -53,7 +76,7 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db's data!")
-                mock_file.assert_called_once_with(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/test_db-data.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/test_db-data.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_table_structure_mysql(self, mock_makedirs):
@@ -64,7 +87,7 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_table's structure from test_db!")
-                mock_file.assert_called_once_with(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/test_table.DDL.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/test_table.DDL.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_table_structure_postgresql(self, mock_makedirs):
@@ -75,43 +98,582 @@ class TestBackup(unittest.TestCase):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_table's structure from test_db!")
-                mock_file.assert_called_once_with(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/test_table.DDL.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/test_table.DDL.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_separate_mysql(self, mock_makedirs):
         mock_makedirs.return_value = None
 
         backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", is_save_multiple=True)
-        mock_sql_dict = {
-            "ddl": {"table1": "CREATE TABLE table1;"},
-            "dml": {"table1": "INSERT INTO table1 VALUES (1);"},
-            "dcl": {"test_db": "GRANT ALL PRIVILEGES;"}
-        }
-        with patch.object(backup, 'backup_separate', return_value=mock_sql_dict):
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["table1"]
+        mock_db.get_table.return_value = "CREATE TABLE table1;"
+        mock_db.get_grants.return_value = "GRANT ALL PRIVILEGES;"
+        mock_db.get_table_data.return_value = 1
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db!")
-                mock_file.assert_any_call(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/table1.DDL.sql', 'w')
-                mock_file.assert_any_call(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/table1.DML.sql', 'w')
-                mock_file.assert_any_call(f'backup/test_db-mysql/{int(datetime.now().timestamp())}/test_db.DCL.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/table1.DDL.sql', 'wb')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/table1.DML.sql', 'wb')
+                mock_file.assert_any_call(f'backup/test_db-mysql/{VERSION}/test_db.DCL.sql', 'wb')
 
     @patch('os.makedirs')
     def test_backup_separate_postgresql(self, mock_makedirs):
         mock_makedirs.return_value = None
 
         backup = Backup(db_type="postgresql", database_name="test_db", connection_string="test_conn", is_save_multiple=True)
-        mock_sql_dict = {
-            "ddl": {"table1": "CREATE TABLE table1;"},
-            "dml": {"table1": "INSERT INTO table1 VALUES (1);"},
-            "dcl": {"test_db": "GRANT ALL PRIVILEGES;"}
-        }
-        with patch.object(backup, 'backup_separate', return_value=mock_sql_dict):
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["table1"]
+        mock_db.get_table.return_value = "CREATE TABLE table1;"
+        mock_db.get_grants.return_value = "GRANT ALL PRIVILEGES;"
+        mock_db.get_table_data.return_value = 1
+        mock_db.get_table_data_bulk.return_value = 1
+        with patch('src.backup.postgresql.postgresql', return_value=mock_db):
+            with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
+                result = backup.backup_database()
+                self.assertEqual(result, "Successfully backed up test_db!")
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/table1.DDL.sql', 'wb')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/table1.DML.sql', 'wb')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/test_db.DCL.sql', 'wb')
+
+
+    def test_backup_full_single_file_streams_into_one_sink(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn")
+        with patch.object(backup, 'backup_structure',
+                          side_effect=lambda sink, on_section: sink.write("CREATE TABLE test;")), \
+                patch.object(backup, 'backup_data',
+                             side_effect=lambda sink, on_section: sink.write("INSERT INTO test VALUES (1);")):
+            result = backup.backup_database()
+        self.assertEqual(result, "Successfully backed up test_db!")
+        version = f'backup/test_db-mysql/{VERSION}'
+        self.assertEqual(sorted(os.listdir(version)), ['manifest.json', 'test_db.sql'])
+        with open(f'{version}/test_db.sql') as f:
+            self.assertEqual(f.read(), "CREATE TABLE test;\n\n\n-- DATA --\nINSERT INTO test VALUES (1);")
+
+
+    @patch('os.makedirs')
+    def test_backup_separate_copy_format_postgresql(self, mock_makedirs):
+        mock_makedirs.return_value = None
+
+        backup = Backup(db_type="postgresql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, data_format="copy")
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["table1"]
+        mock_db.get_table.return_value = "CREATE TABLE table1;"
+        mock_db.get_grants.return_value = "GRANT ALL PRIVILEGES;"
+        mock_db.get_table_data.return_value = 1
+        mock_db.get_table_data_bulk.return_value = 1
+        with patch('src.backup.postgresql.postgresql', return_value=mock_db):
             with patch('builtins.open', unittest.mock.mock_open()) as mock_file:
                 result = backup.backup_database()
                 self.assertEqual(result, "Successfully backed up test_db!")
-                mock_file.assert_any_call(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/table1.DDL.sql', 'w')
-                mock_file.assert_any_call(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/table1.DML.sql', 'w')
-                mock_file.assert_any_call(f'backup/test_db-postgresql/{int(datetime.now().timestamp())}/test_db.DCL.sql', 'w')
+                mock_file.assert_any_call(f'backup/test_db-postgresql/{VERSION}/table1.DML.copy', 'wb')
+                mock_db.get_table_data_bulk.assert_called_once()
+                self.assertEqual(mock_db.get_table_data_bulk.call_args.kwargs['custom_table'], "table1")
+                self.assertEqual(mock_db.get_table_data_bulk.call_args.kwargs['data_format'], "copy")
+
+    @patch('os.makedirs')
+    def test_backup_copy_format_mysql_not_supported(self, mock_makedirs):
+        with self.assertRaises(ValueError):
+            Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", data_format="copy")
+
+
+    @patch('os.makedirs')
+    def test_backup_separate_parallel_jobs_share_snapshot(self, mock_makedirs):
+        mock_makedirs.return_value = None
+
+        backup = Backup(db_type="postgresql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, jobs=2)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["table1", "table2", "table3"]
+        mock_db.get_table.return_value = "CREATE TABLE table;"
+        mock_db.get_grants.return_value = "GRANT ALL PRIVILEGES;"
+        mock_db.export_snapshot.return_value = "00000003-0000001B-1"
+        workers = [MagicMock(), MagicMock()]
+        for worker in workers:
+            worker.get_table_data.return_value = 1
+        with patch('src.backup.postgresql.postgresql', side_effect=[mock_db] + workers) as mock_postgresql:
+            with patch('builtins.open', unittest.mock.mock_open()):
+                result = backup.backup_database()
+
+        self.assertEqual(result, "Successfully backed up test_db!")
+        self.assertEqual(mock_postgresql.call_count, 3)
+        mock_db.release_snapshot.assert_called_once()
+        mock_db.connection.close.assert_called_once()
+        for worker in workers:
+            worker.start_snapshot.assert_called_once_with(snapshot="00000003-0000001B-1")
+            worker.release_snapshot.assert_called_once()
+            worker.connection.close.assert_called_once()
+        dumped = [call.kwargs['custom_table'] for worker in workers for call in worker.get_table_data.call_args_list]
+        self.assertEqual(sorted(dumped), ["table1", "table2", "table3"])
+        mock_db.get_table_data.assert_not_called()
+
+    @patch('os.makedirs')
+    def test_backup_separate_parallel_jobs_read_structure_in_snapshot(self, mock_makedirs):
+        mock_makedirs.return_value = None
+
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, jobs=2)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["table1", "table2"]
+        mock_db.get_table.return_value = "CREATE TABLE table;"
+        mock_db.get_grants.return_value = "GRANT ALL PRIVILEGES;"
+        mock_db.export_snapshot.return_value = None
+        workers = [MagicMock(), MagicMock()]
+        for worker in workers:
+            worker.get_table_data.return_value = 1
+        with patch('src.backup.mysql.mysql', side_effect=[mock_db] + workers):
+            with patch('builtins.open', unittest.mock.mock_open()):
+                backup.backup_database()
+
+        calls = [name for name, _, _ in mock_db.mock_calls
+                 if name in ('export_snapshot', 'get_table', 'release_snapshot')]
+        self.assertEqual(calls, ['export_snapshot', 'get_table', 'get_table', 'release_snapshot'])
+
+
+    @patch('os.makedirs')
+    def test_backup_full_reuses_one_connection(self, mock_makedirs):
+        mock_makedirs.return_value = None
+
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn")
+        mock_db = MagicMock()
+        with patch('src.backup.mysql.mysql', return_value=mock_db) as mock_mysql:
+            with patch('builtins.open', unittest.mock.mock_open()):
+                backup.backup_database()
+
+        mock_mysql.assert_called_once()
+        mock_db.get_database_structure.assert_called_once()
+        mock_db.get_database_data.assert_called_once()
+        mock_db.connection.close.assert_called_once()
+
+
+class TestIncrementalBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+        self.mock_db = MagicMock()
+        self.mock_db.get_all_tables.return_value = ["actor"]
+        self.mock_db.get_table.return_value = "CREATE TABLE actor;"
+        self.mock_db.get_grants.return_value = ""
+        self.mock_db.get_watermark_column.return_value = ("last_update", "timestamp")
+        self.mock_db.get_watermark.return_value = datetime(2024, 5, 1, 12, 0)
+        self.mock_db.get_table_data.return_value = 1
+
+    def backup(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", incremental=True)
+        with patch('src.backup.mysql.mysql', return_value=self.mock_db):
+            result = backup.backup_database()
+        version = f'backup/test_db-mysql/{VERSION}'
+        with open(f'{version}/manifest.json') as f:
+            return result, json.load(f)
+
+    def test_first_incremental_backup_is_full(self):
+        result, manifest = self.backup()
+
+        self.assertEqual(result, "Successfully backed up test_db!")
+        self.assertEqual(manifest['type'], 'full')
+        self.assertIsNone(manifest['base'])
+        self.assertEqual(manifest['watermarks']['actor'],
+                         {'column': 'last_update', 'kind': 'timestamp', 'value': '2024-05-01 12:00:00'})
+        self.mock_db.get_table_data.assert_called_once()
+        self.assertIsNone(self.mock_db.get_table_data.call_args.kwargs['since'])
+        self.assertTrue(self.mock_db.get_table_data.call_args.kwargs['upsert'])
+
+    def test_incremental_backup_dumps_changes_since_previous_version(self):
+        previous = {'column': 'last_update', 'kind': 'timestamp', 'value': '2024-04-01 00:00:00'}
+        os.makedirs('backup/test_db-mysql/1690000000')
+        with open('backup/test_db-mysql/1690000000/manifest.json', 'w') as f:
+            json.dump({'type': 'full', 'base': None, 'table': None, 'op_type': None,
+                       'watermarks': {'actor': previous}}, f)
+
+        result, manifest = self.backup()
+
+        self.assertEqual(result, "Successfully backed up changes of test_db since version 1690000000!")
+        self.assertEqual(manifest['type'], 'incremental')
+        self.assertEqual(manifest['base'], '1690000000')
+        self.assertEqual(self.mock_db.get_table_data.call_args.kwargs['since'], previous)
+
+    def test_incremental_backup_needs_sql_format(self):
+        with self.assertRaises(ValueError):
+            Backup(db_type="postgresql", database_name="test_db", connection_string="test_conn",
+                   incremental=True, data_format="copy")
+
+
+class TestDecrementalBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_previous_version_becomes_reverse_delta(self):
+        previous = 'backup/test_db-mysql/1690000000'
+        os.makedirs(previous)
+        for name, content in [('actor.DDL.sql', 'CREATE TABLE actor;'), ('actor.DML.sql', 'INSERT 1;'),
+                              ('test_db.DCL.sql', 'GRANT ALL;')]:
+            with open(f'{previous}/{name}', 'w') as f:
+                f.write(content)
+        with open(f'{previous}/manifest.json', 'w') as f:
+            json.dump({'type': 'full', 'decremental': True}, f)
+
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", decremental=True)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["actor"]
+        mock_db.get_table.return_value = "CREATE TABLE actor;"
+        mock_db.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT 2;')
+        mock_db.get_grants.return_value = "GRANT ALL;"
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            result = backup.backup_database()
+
+        self.assertEqual(result, "Successfully backed up test_db!")
+        self.assertEqual(sorted(os.listdir(previous)), ['actor.DML.sql', 'manifest.json'])
+        with open(f'{previous}/manifest.json') as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['type'], 'reverse-delta')
+        self.assertEqual(manifest['successor'], VERSION)
+        self.assertEqual(manifest['same_as'], ['actor.DDL.sql', 'test_db.DCL.sql'])
+
+    def test_decremental_backup_covers_whole_database(self):
+        with self.assertRaises(ValueError):
+            Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                   decremental=True, table_name="actor")
+
+
+class TestChunkedBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_version_folder_holds_only_manifest(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, chunked=True)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["actor"]
+        mock_db.get_table.return_value = "CREATE TABLE actor;"
+        mock_db.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT INTO actor VALUES (1);')
+        mock_db.get_grants.return_value = ""
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        version = f'backup/test_db-mysql/{VERSION}'
+        self.assertEqual(os.listdir(version), ['manifest.json'])
+        with open(f'{version}/manifest.json') as f:
+            chunks = json.load(f)['chunks']
+        self.assertEqual(sorted(chunks), ['actor.DDL.sql', 'actor.DML.sql', 'test_db.DCL.sql'])
+        self.assertEqual(chunks['test_db.DCL.sql'], [])
+        digest = chunks['actor.DML.sql'][0]
+        with open(f'backup/test_db-mysql/chunks/{digest[:2]}/{digest}') as f:
+            self.assertEqual(f.read(), 'INSERT INTO actor VALUES (1);')
+
+
+class TestCompressedBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_files_get_compression_suffix(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, compression='gzip', compress_threads=2)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["actor"]
+        mock_db.get_table.return_value = "CREATE TABLE actor;"
+        mock_db.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT INTO actor VALUES (1);')
+        mock_db.get_grants.return_value = ""
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        version = f'backup/test_db-mysql/{VERSION}'
+        self.assertEqual(sorted(os.listdir(version)),
+                         ['actor.DDL.sql.gz', 'actor.DML.sql.gz', 'manifest.json', 'test_db.DCL.sql.gz'])
+        with gzip.open(f'{version}/actor.DML.sql.gz', 'rt') as f:
+            self.assertEqual(f.read(), 'INSERT INTO actor VALUES (1);')
+
+    def test_unavailable_compression_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", compression='bzip2')
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_manifest_indexes_files_and_table_order(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["film_actor", "film"]
+        mock_db.get_table.return_value = "CREATE TABLE t;"
+        mock_db.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT INTO t VALUES (1);') and 1
+        mock_db.get_grants.return_value = ""
+        mock_db.get_foreign_keys.return_value = [("film_actor", "film"), ("film", "language")]
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        with open(f'backup/test_db-mysql/{VERSION}/manifest.json') as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['tables'], {'order': ['film', 'film_actor'],
+                                              'foreign_keys': [['film_actor', 'film']]})
+        self.assertEqual(sorted(manifest['files']),
+                         ['film.DDL.sql', 'film.DML.sql', 'film_actor.DDL.sql', 'film_actor.DML.sql',
+                          'test_db.DCL.sql'])
+        self.assertEqual(manifest['files']['film.DML.sql'], {
+            'file': 'film.DML.sql', 'table': 'film', 'kind': 'dml', 'format': 'sql', 'rows': 1, 'bytes': 25,
+            'sha256': hashlib.sha256(b'INSERT INTO t VALUES (1);').hexdigest()})
+        self.assertEqual(manifest['files']['test_db.DCL.sql']['table'], None)
+
+
+class TestSingleFileSections(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def write_sections(self, statements):
+        def write(sink, on_section):
+            sink.write('USE test_db;\n')
+            for table, statement in statements.items():
+                on_section(table)
+                sink.write(statement)
+            on_section(None)
+            sink.write('GRANT ALL;\n')
+        return write
+
+    def test_table_sections_are_recorded(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        compression='gzip')
+        mock_db = MagicMock()
+        mock_db.get_database_structure.side_effect = self.write_sections({'actor': 'CREATE TABLE actor;\n',
+                                                                          'film': 'CREATE TABLE film;\n'})
+        mock_db.get_database_data.side_effect = self.write_sections({'actor': 'INSERT INTO actor VALUES (1);\n'})
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        with open(f'backup/test_db-mysql/{VERSION}/manifest.json') as f:
+            entry = json.load(f)['files']['test_db.sql']
+        with gzip.open(f'backup/test_db-mysql/{VERSION}/test_db.sql.gz') as f:
+            contents = f.read()
+        ranges = entry['sections']['actor']
+        self.assertEqual(contents[ranges['ddl'][0]:ranges['ddl'][1]], b'CREATE TABLE actor;\n')
+        self.assertEqual(contents[ranges['dml'][0]:ranges['dml'][1]], b'INSERT INTO actor VALUES (1);\n')
+        self.assertEqual(list(entry['sections']['film']), ['ddl'])
+        self.assertEqual(len(entry['blocks']), 1)
+
+
+class TestBackupMetrics(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_table_metrics_are_saved_in_manifest_and_metrics_files(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, metrics_into='metrics')
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["actor"]
+        mock_db.get_table.return_value = "CREATE TABLE actor;"
+        mock_db.get_grants.return_value = ""
+        mock_db.get_table_estimates.return_value = {'actor': {'rows': 2, 'bytes': 16384}}
+
+        def get_table_data(sink, custom_table, key_range):
+            mock_db.on_rows(custom_table, 2)
+            sink.write('INSERT INTO actor VALUES (1),(2);')
+            return 2
+
+        mock_db.get_table_data.side_effect = get_table_data
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        with open(f'backup/test_db-mysql/{VERSION}/manifest.json') as f:
+            metrics = json.load(f)['metrics']
+        self.assertEqual(metrics['rows'], 2)
+        self.assertEqual(metrics['tables']['actor']['bytes'], 33)
+        self.assertEqual(metrics['tables']['actor']['estimated_rows'], 2)
+        self.assertEqual(sorted(metrics['phases']), ['dump', 'estimate', 'order'])
+        with open('metrics/test_db-mysql.json') as f:
+            self.assertEqual(json.load(f)['tables'], metrics['tables'])
+        with open('metrics/test_db-mysql.prom') as f:
+            self.assertIn('backdb_backup_table_rows{database="test_db",db_type="mysql",table="actor"} 2\n', f.read())
+
+
+class TestSplitTables(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_key_ranges_cover_whole_table(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", split_rows=100)
+        backup.progress.estimates = {'payment': {'rows': 250, 'bytes': 0}, 'actor': {'rows': 100, 'bytes': 0}}
+        mock_db = MagicMock()
+        mock_db.get_key_range.return_value = {'column': 'payment_id', 'min': 1, 'max': 300}
+
+        self.assertEqual(backup.split_table(db=mock_db, table='payment'), [
+            {'column': 'payment_id', 'start': None, 'end': 101},
+            {'column': 'payment_id', 'start': 101, 'end': 201},
+            {'column': 'payment_id', 'start': 201, 'end': None},
+        ])
+        self.assertEqual(backup.split_table(db=mock_db, table='actor'), [None])
+        mock_db.get_key_range.return_value = None
+        self.assertEqual(backup.split_table(db=mock_db, table='payment'), [None])
+
+    def test_parts_are_dumped_concurrently_into_numbered_files(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, jobs=2, split_rows=100)
+        workers = [MagicMock(), MagicMock()]
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["payment"]
+        mock_db.get_table.return_value = "CREATE TABLE payment;"
+        mock_db.get_grants.return_value = ""
+        mock_db.get_table_estimates.return_value = {'payment': {'rows': 200, 'bytes': 0}}
+        mock_db.get_key_range.return_value = {'column': 'payment_id', 'min': 1, 'max': 200}
+        for worker in workers:
+            worker.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT;') and 1
+        with patch('src.backup.mysql.mysql', side_effect=[mock_db] + workers):
+            backup.backup_database()
+
+        files = backup.files
+        self.assertEqual(files['payment.DML.0001.sql']['key_range'],
+                         {'column': 'payment_id', 'start': None, 'end': 101})
+        self.assertEqual(files['payment.DML.0002.sql']['part'], 2)
+        ranges = [call.kwargs['key_range'] for worker in workers for call in worker.get_table_data.call_args_list]
+        self.assertEqual(sorted(key_range['end'] or 0 for key_range in ranges), [0, 101])
+        self.assertTrue(os.path.isfile(f'backup/test_db-mysql/{VERSION}/payment.DML.0002.sql'))
+
+    def test_split_tables_can_not_be_backed_up_incrementally(self):
+        with self.assertRaises(ValueError):
+            Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", incremental=True,
+                   split_rows=100)
+
+
+class TestResumeBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def connected(self, dump):
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ['actor', 'film']
+        mock_db.get_table.return_value = 'CREATE TABLE t;'
+        mock_db.get_grants.return_value = ''
+        mock_db.get_table_estimates.return_value = {}
+        mock_db.get_table_data.side_effect = dump
+        return mock_db
+
+    def dump(self, sink, custom_table, key_range):
+        if custom_table == 'film':
+            raise ConnectionError('server has gone away')
+        sink.write(f'INSERT INTO {custom_table};')
+        return 1
+
+    def test_resumed_backup_keeps_completed_data_files(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", is_save_multiple=True)
+        with patch('src.backup.mysql.mysql', return_value=self.connected(self.dump)):
+            with self.assertRaises(ConnectionError):
+                backup.backup_database()
+        version = os.listdir('backup/test_db-mysql')[0]
+        self.assertTrue(os.path.isfile(f'backup/test_db-mysql/{version}/backup.checkpoint.jsonl'))
+
+        resumed = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                         is_save_multiple=True, resume=True)
+        mock_db = self.connected(lambda sink, custom_table, key_range: sink.write('INSERT INTO film;') and 1)
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            resumed.backup_database()
+
+        self.assertEqual([call.kwargs['custom_table'] for call in mock_db.get_table_data.call_args_list], ['film'])
+        self.assertEqual(os.listdir('backup/test_db-mysql'), [version])
+        with open(f'backup/test_db-mysql/{version}/manifest.json') as f:
+            files = json.load(f)['files']
+        self.assertEqual(files['actor.DML.sql']['rows'], 1)
+        self.assertEqual(files['film.DML.sql']['rows'], 1)
+        self.assertFalse(os.path.exists(f'backup/test_db-mysql/{version}/backup.checkpoint.jsonl'))
+
+    def test_backup_is_resumed_only_with_the_same_options(self):
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", is_save_multiple=True)
+        with patch('src.backup.mysql.mysql', return_value=self.connected(self.dump)):
+            with self.assertRaises(ConnectionError):
+                backup.backup_database()
+
+        resumed = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                         is_save_multiple=True, compression='gzip', resume=True)
+        with self.assertRaises(ValueError):
+            resumed.backup_database()
+
+
+class TestSkipUnchangedBackup(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+        freeze_time(self)
+
+    def test_unchanged_table_file_is_linked_from_previous_version(self):
+        previous = 'backup/test_db-mysql/1690000000'
+        os.makedirs(previous)
+        with open(f'{previous}/actor.DML.sql', 'w') as f:
+            f.write('INSERT INTO actor VALUES (1);')
+        with open(f'{previous}/manifest.json', 'w') as f:
+            json.dump({'data_format': 'sql', 'checksums': {'actor': '42', 'film': '6'}}, f)
+
+        backup = Backup(db_type="mysql", database_name="test_db", connection_string="test_conn",
+                        is_save_multiple=True, skip_unchanged=True)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ["actor", "film"]
+        mock_db.get_table.return_value = "CREATE TABLE t;"
+        mock_db.get_grants.return_value = ""
+        mock_db.get_table_checksum.side_effect = lambda table: {'actor': '42', 'film': '7'}[table]
+        mock_db.get_table_data.return_value = 1
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            backup.backup_database()
+
+        version = f'backup/test_db-mysql/{VERSION}'
+        self.assertTrue(os.path.samefile(f'{version}/actor.DML.sql', f'{previous}/actor.DML.sql'))
+        self.assertEqual([call.kwargs['custom_table'] for call in mock_db.get_table_data.call_args_list], ['film'])
+        with open(f'{version}/manifest.json') as f:
+            self.assertEqual(json.load(f)['checksums'], {'actor': '42', 'film': '7'})
+
+    def test_skip_unchanged_needs_per_table_files(self):
+        with self.assertRaises(ValueError):
+            Backup(db_type="mysql", database_name="test_db", connection_string="test_conn", skip_unchanged=True)
 
 
 if __name__ == '__main__':
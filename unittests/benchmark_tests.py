@@ -0,0 +1,47 @@
+import unittest
+
+from benchmarks.fake_database import COLUMNS, generate_rows
+from benchmarks.suite import BENCHMARKS, compare, run_benchmarks
+
+
+class TestFakeDatabase(unittest.TestCase):
+
+    def test_generated_rows_match_columns_and_have_nulls(self):
+        rows = list(generate_rows(rows=100))
+
+        self.assertEqual(len(rows), 100)
+        self.assertTrue(all(len(row) == len(COLUMNS) for row in rows))
+        for index in range(2, len(COLUMNS)):
+            self.assertIn(None, [row[index] for row in rows])
+        self.assertEqual(rows, list(generate_rows(rows=100)))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_every_benchmark_processes_generated_rows(self):
+        results = run_benchmarks(rows=200, repeat=1)
+
+        self.assertEqual(list(results), list(BENCHMARKS))
+        for name, result in results.items():
+            with self.subTest(benchmark=name):
+                self.assertEqual(result['rows'], 200)
+                self.assertGreater(result['bytes'], 200 * 50)
+                self.assertGreater(result['rows_per_second'], 0)
+                self.assertGreater(result['peak_memory_mb'], 0)
+
+    def test_compare_reports_regressions_against_baseline(self):
+        baseline = {'rows': 1000, 'rows_per_second': 1000, 'megabytes_per_second': 10.0, 'peak_memory_mb': 10.0}
+        results = {
+            'same': dict(baseline),
+            'slower': dict(baseline, rows_per_second=700, megabytes_per_second=7.0),
+            'bigger': dict(baseline, peak_memory_mb=20.0),
+            'other_rows': dict(baseline, rows=10, rows_per_second=1),
+            'new': dict(baseline),
+        }
+        baselines = {name: baseline for name in ('same', 'slower', 'bigger', 'other_rows')}
+
+        self.assertEqual(compare(results, baselines, tolerance=0.2), [
+            'slower rows_per_second dropped from 1000 to 700',
+            'slower megabytes_per_second dropped from 10.0 to 7.0',
+            'bigger peak_memory_mb grew from 10.0 to 20.0',
+        ])
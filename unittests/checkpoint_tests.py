@@ -0,0 +1,66 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.checkpoint import Checkpoint, read_journal
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'backup.checkpoint.jsonl')
+
+    def test_records_are_read_by_resumed_run(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.record({'file': 'actor.DML.sql', 'watermark': datetime.datetime(2006, 2, 15, 4, 34, 33)})
+        checkpoint.record({'file': 'film.DML.sql'})
+        checkpoint.close()
+
+        self.assertEqual(Checkpoint(self.path, resume=True).records, [
+            {'file': 'actor.DML.sql', 'watermark': '2006-02-15 04:34:33'},
+            {'file': 'film.DML.sql'},
+        ])
+
+    def test_incomplete_record_is_cut_off(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.record({'file': 'actor.DML.sql'})
+        checkpoint.close()
+        with open(self.path, 'a') as f:
+            f.write('{"file": "fil')
+
+        resumed = Checkpoint(self.path, resume=True)
+        resumed.record({'file': 'film.DML.sql'})
+        resumed.close()
+        self.assertEqual(Checkpoint(self.path, resume=True).records,
+                         [{'file': 'actor.DML.sql'}, {'file': 'film.DML.sql'}])
+
+    def test_journal_is_read_without_changing_it(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.record({'file': 'actor.DML.sql', 'chunks': ['aa01']})
+        checkpoint.close()
+        with open(self.path, 'a') as f:
+            f.write('{"file": "fil')
+        size = os.path.getsize(self.path)
+
+        self.assertEqual(read_journal(self.path), [{'file': 'actor.DML.sql', 'chunks': ['aa01']}])
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(read_journal(os.path.join(os.path.dirname(self.path), 'missing.jsonl')), [])
+
+    def test_new_run_discards_records_and_completed_run_removes_journal(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.record({'file': 'actor.DML.sql'})
+        checkpoint.close()
+
+        checkpoint = Checkpoint(self.path)
+        self.assertEqual(checkpoint.records, [])
+        self.assertFalse(os.path.exists(self.path))
+        checkpoint.record({'file': 'film.DML.sql'})
+        checkpoint.remove()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src import chunk_store
+from src.chunk_store import ChunkStore, ChunkWriter, ChunkReader
+
+
+def write(store, data):
+    hashes = []
+    with io.BufferedWriter(ChunkWriter(store=store, on_close=hashes.extend)) as f:
+        for offset in range(0, len(data), 10000):
+            f.write(data[offset:offset + 10000])
+    return hashes
+
+
+@patch.multiple(chunk_store, MIN_CHUNK=4096, MAX_CHUNK=16384, BOUNDARY_MASK=0x1F)
+class TestChunkStore(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.store = ChunkStore(folder.name)
+        self.lines = [f"({i},'name {i}'),\n".encode() for i in range(20000)]
+
+    def test_written_file_is_read_back(self):
+        data = b''.join(self.lines)
+        hashes = write(self.store, data)
+
+        self.assertGreater(len(hashes), 1)
+        self.assertEqual(io.BufferedReader(ChunkReader(store=self.store, hashes=hashes)).read(), data)
+
+    def test_inserted_line_only_changes_chunk_around_it(self):
+        write(self.store, b''.join(self.lines))
+        stored = self.store.stored
+
+        hashes = write(self.store, b''.join(self.lines[:10000] + [b"(0,'inserted'),\n"] + self.lines[10000:]))
+
+        self.assertEqual(self.store.stored - stored, 1)
+        self.assertEqual(self.store.reused, len(hashes) - 1)
+
+    def test_data_without_new_lines_is_cut_at_max_size(self):
+        hashes = write(self.store, b'x' * 40000)
+
+        self.assertEqual(len(hashes), 3)
+
+    def test_compressed_chunks_are_read_back(self):
+        store = ChunkStore(self.store.folder, compression='gzip')
+        data = b''.join(self.lines)
+        hashes = write(store, data)
+
+        self.assertTrue(os.path.exists(store.path(hashes[0], 'gzip')))
+        self.assertEqual(io.BufferedReader(ChunkReader(store=self.store, hashes=hashes)).read(), data)
+
+    def test_garbage_collection_keeps_referenced_and_recent_chunks(self):
+        kept = write(self.store, b''.join(self.lines[:1000]))
+        removed = write(self.store, b''.join(self.lines[1000:2000]))
+        for digest in kept + removed:
+            os.utime(self.store.path(digest), (0, 0))
+        recent = write(self.store, b''.join(self.lines[2000:3000]))
+
+        self.assertEqual(self.store.collect_garbage(referenced=set(kept)), len(removed))
+        for digest in kept + recent:
+            self.assertTrue(os.path.exists(self.store.path(digest)))
+
+
+if __name__ == '__main__':
+    unittest.main()
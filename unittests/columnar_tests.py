@@ -0,0 +1,56 @@
+import datetime
+import decimal
+import io
+import unittest
+
+from src.columnar import read_columnar, write_columnar
+
+
+class TestColumnar(unittest.TestCase):
+
+    def round_trip(self, columns, batches):
+        sink = io.BytesIO()
+        rows_count = write_columnar(sink=sink, columns=columns, batches=batches)
+        sink.seek(0)
+        read_columns, row_groups = read_columnar(sink)
+        return rows_count, read_columns, list(row_groups)
+
+    def test_typed_values_are_read_back(self):
+        rows = [(1, 'actor', b'\x00\xff', 1.5, decimal.Decimal('9.99'), datetime.datetime(2006, 2, 15, 4, 34, 33),
+                 datetime.date(2006, 2, 15), datetime.timedelta(hours=2), True)]
+        columns = ['id', 'name', 'picture', 'rate', 'price', 'last_update', 'created', 'duration', 'active']
+
+        rows_count, read_columns, row_groups = self.round_trip(columns, [rows])
+
+        self.assertEqual(rows_count, 1)
+        self.assertEqual(read_columns, columns)
+        self.assertEqual(row_groups, [rows])
+
+    def test_nulls_and_row_groups_are_kept(self):
+        batches = [[(1, None), (None, 'a')], [(None, None)]]
+
+        rows_count, _, row_groups = self.round_trip(['id', 'name'], batches)
+
+        self.assertEqual(rows_count, 3)
+        self.assertEqual(row_groups, batches)
+
+    def test_integers_wider_than_64_bits_are_kept_as_text(self):
+        _, _, row_groups = self.round_trip(['id'], [[(2 ** 64 - 1,), (1,)]])
+
+        self.assertEqual(row_groups, [[('18446744073709551615',), ('1',)]])
+
+    def test_arrays_are_read_back_as_array_literals(self):
+        rows = [(1, [1, 2], ['a "b"', None], [[1, 2], [3, 4]]), (2, None, [], [datetime.date(2006, 2, 15)])]
+
+        _, _, row_groups = self.round_trip(['id', 'scores', 'tags', 'matrix'], [rows])
+
+        self.assertEqual(row_groups, [[(1, '{"1","2"}', '{"a \\"b\\"",NULL}', '{{"1","2"},{"3","4"}}'),
+                                       (2, None, '{}', '{"2006-02-15"}')]])
+
+    def test_other_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            read_columnar(io.BytesIO(b'INSERT INTO actor VALUES (1);'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import gzip
+import io
+import lzma
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.compression import ParallelCompressor, compression_of, open_decompressed
+
+
+def compress(path, data, compression, executor=None):
+    with io.BufferedWriter(ParallelCompressor(sink=open(path, 'wb'), compression=compression, executor=executor,
+                                              max_pending=2, block_size=1000)) as f:
+        for offset in range(0, len(data), 300):
+            f.write(data[offset:offset + 300])
+
+
+class TestParallelCompressor(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.data = b''.join(f"INSERT INTO actor VALUES ({i},'name {i}');\n".encode() for i in range(2000))
+
+    def test_blocks_compressed_on_threads_form_valid_file(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            compress(f'{self.folder}/actor.sql.gz', self.data, 'gzip', executor=executor)
+            compress(f'{self.folder}/actor.sql.xz', self.data, 'lzma', executor=executor)
+
+        with gzip.open(f'{self.folder}/actor.sql.gz') as f:
+            self.assertEqual(f.read(), self.data)
+        with lzma.open(f'{self.folder}/actor.sql.xz') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_compressed_file_is_read_by_suffix(self):
+        path = f'{self.folder}/actor.DML.sql.gz'
+        compress(path, self.data, 'gzip')
+
+        with open_decompressed(path, compression_of(path)) as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_empty_file_is_valid(self):
+        path = f'{self.folder}/empty.sql.xz'
+        compress(path, b'', 'lzma')
+
+        self.assertGreater(os.path.getsize(path), 0)
+        with open_decompressed(path, 'lzma') as f:
+            self.assertEqual(f.read(), b'')
+
+    def test_uncompressed_file_has_no_compression(self):
+        self.assertIsNone(compression_of('backup/actor.DML.sql'))
+        self.assertEqual(compression_of('backup/actor.DML.tsv.zst'), 'zstd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+import datetime
+import io
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, call
+
+import pymysql
+from psycopg2.extensions import adapt
+from pymysql.constants import FIELD_TYPE
+
+from src.columnar import read_columnar
+from src.models.mysql_database import mysql
+from src.models.postgresql_database import postgresql
+
+
+def connected(engine, description, batches, **attributes):
+    """
+    Creates database object without connecting, its cursor returns given batches
+    """
+    db = engine.__new__(engine)
+    db.database_name = 'test_db'
+    db.table_name = None
+    db.batch_size = 2
+    db.rows_per_statement = None
+    db.bytes_per_statement = None
+    db.max_allowed_packet = None
+    for name, value in attributes.items():
+        setattr(db, name, value)
+    cursor = MagicMock()
+    cursor.description = [column if isinstance(column, tuple) else (column,) for column in description]
+    # Values are quoted by the driver converters the real connection would use
+    cursor.mogrify.side_effect = lambda template, row: (
+        template % tuple(adapt(value).getquoted().decode() for value in row)).encode()
+    cursor.fetchmany.side_effect = batches + [[]]
+    cursor.fetchone.return_value = (64 * 1024 * 1024,)
+    db.connection = MagicMock()
+    db.connection.cursor.return_value = cursor
+    db.connection.literal.side_effect = lambda value: pymysql.converters.escape_item(value, 'utf8mb4')
+    return db
+
+
+class TestInsertStatements(unittest.TestCase):
+
+    def test_mysql_single_statement(self):
+        db = connected(mysql, ['id', 'name'], [[(1, 'a'), (2, None)], [(3, 'c')]])
+        sink = io.StringIO()
+
+        self.assertEqual(db.get_table_data(sink=sink, custom_table='test'), 3)
+        self.assertEqual(sink.getvalue(), "SET AUTOCOMMIT=0;\nINSERT INTO `test` (id, name) VALUES (1,'a'),\n"
+                                          "(2,NULL),\n(3,'c');\nCOMMIT;\n")
+
+    def test_mysql_rows_per_statement(self):
+        db = connected(mysql, ['id'], [[(1,), (2,)], [(3,)]], rows_per_statement=2)
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='test')
+        self.assertEqual(sink.getvalue(), "SET AUTOCOMMIT=0;\nINSERT INTO `test` (id) VALUES (1),\n(2);\nCOMMIT;\n"
+                                          "INSERT INTO `test` (id) VALUES (3);\nCOMMIT;\n")
+
+    def test_mysql_statements_fit_max_allowed_packet(self):
+        db = connected(mysql, ['name'], [[('x' * 100,)] * 10])
+        db.connection.cursor.return_value.fetchone.return_value = (1024 + 400,)
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='test')
+        statements = [statement for statement in sink.getvalue().split('\nCOMMIT;\n') if statement]
+        self.assertEqual(len(statements), 4)
+        for statement in statements:
+            self.assertLessEqual(len(statement.encode('utf-8')), 400)
+
+    def test_default_statement_size_is_capped_below_max_allowed_packet(self):
+        db = connected(mysql, ['name'], [[('x' * 1024 * 1024,)] * 6])
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='test')
+        statements = [statement for statement in sink.getvalue().split('\nCOMMIT;\n') if statement]
+        self.assertEqual(len(statements), 2)
+        for statement in statements:
+            self.assertLessEqual(len(statement.encode('utf-8')), 4 * 1024 * 1024)
+
+    def test_postgresql_bytes_per_statement(self):
+        db = connected(postgresql, ['id'], [[(1,), (2,), (3,)]], bytes_per_statement=42)
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='test')
+        self.assertEqual(sink.getvalue(), "INSERT INTO test (id) VALUES (1),\n(2);\n"
+                                          "INSERT INTO test (id) VALUES (3);\n")
+
+    def test_empty_table_writes_nothing(self):
+        db = connected(postgresql, ['id'], [])
+        sink = io.StringIO()
+
+        self.assertEqual(db.get_table_data(sink=sink, custom_table='test'), 0)
+        self.assertEqual(sink.getvalue(), '')
+    def test_mysql_values_are_formatted_by_column_type(self):
+        description = [('id', FIELD_TYPE.LONG), ('name', FIELD_TYPE.VAR_STRING), ('picture', FIELD_TYPE.BLOB),
+                       ('last_update', FIELD_TYPE.DATETIME)]
+        db = connected(mysql, description, [[(1, "O'Neil\\", b'\x01\xff', datetime.datetime(2006, 2, 15, 4, 34, 33)),
+                                              (2, None, b'', None)]])
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='actor')
+        self.assertEqual(sink.getvalue(), "SET AUTOCOMMIT=0;\nINSERT INTO `actor` (id, name, picture, last_update) "
+                                          "VALUES (1,'O\\'Neil\\\\',/*!80003 0x01ff*/,'2006-02-15 04:34:33'),\n"
+                                          "(2,NULL,'',NULL);\nCOMMIT;\n")
+
+    def test_postgresql_dates_are_quoted(self):
+        db = connected(postgresql, ['id', 'created'], [[(1, datetime.date(2006, 2, 15))]])
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='actor')
+        self.assertEqual(sink.getvalue(), "INSERT INTO actor (id, created) VALUES (1,'2006-02-15'::date);\n")
+
+    def test_pipelined_dump_writes_the_same_statements(self):
+        batches = [[(index, f'name {index}') for index in range(start, start + 2)] for start in range(0, 20, 2)]
+        expected = io.StringIO()
+        connected(mysql, ['id', 'name'], list(batches), rows_per_statement=3).get_table_data(
+            sink=expected, custom_table='test')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            db = connected(mysql, ['id', 'name'], list(batches), rows_per_statement=3, pipeline_depth=2,
+                           format_executor=executor)
+            sink = io.StringIO()
+            self.assertEqual(db.get_table_data(sink=sink, custom_table='test'), 20)
+        self.assertEqual(sink.getvalue(), expected.getvalue())
+
+    def test_fetched_rows_are_reported_to_progress(self):
+        for engine in (mysql, postgresql):
+            with self.subTest(engine=engine.__name__):
+                on_rows = MagicMock()
+                db = connected(engine, ['id'], [[(1,), (2,)], [(3,)]], on_rows=on_rows)
+
+                db.get_table_data(sink=io.StringIO(), custom_table='test')
+                self.assertEqual(on_rows.call_args_list, [unittest.mock.call('test', 2), unittest.mock.call('test', 1)])
+
+
+class TestIncrementalData(unittest.TestCase):
+
+    def test_mysql_rows_changed_since_watermark_are_upserted(self):
+        db = connected(mysql, ['id', 'last_update'], [[(1, '2024-05-01 12:00:00')]])
+        sink = io.StringIO()
+        since = {'column': 'last_update', 'kind': 'timestamp', 'value': '2024-04-01 00:00:00'}
+
+        db.get_table_data(sink=sink, custom_table='actor', since=since, upsert=True)
+        db.connection.cursor.return_value.execute.assert_called_with(
+            'SELECT * FROM `actor` WHERE `last_update` >= %s', ('2024-04-01 00:00:00',))
+        self.assertEqual(sink.getvalue(), "SET AUTOCOMMIT=0;\nINSERT INTO `actor` (id, last_update) VALUES "
+                                          "(1,'2024-05-01 12:00:00') ON DUPLICATE KEY UPDATE `id`=VALUES(`id`), "
+                                          "`last_update`=VALUES(`last_update`);\nCOMMIT;\n")
+
+    def test_postgresql_upsert_updates_non_key_columns(self):
+        db = connected(postgresql, ['id', 'name'], [[(1, 'a')]])
+        db.connection.cursor.return_value.fetchall.return_value = [('id', True), ('name', None)]
+        sink = io.StringIO()
+
+        db.get_table_data(sink=sink, custom_table='actor', since={'column': 'id', 'kind': 'sequence', 'value': 0},
+                          upsert=True)
+        db.connection.cursor.return_value.execute.assert_called_with('SELECT * FROM actor WHERE id > %s', (0,))
+        self.assertEqual(sink.getvalue(), "INSERT INTO actor (id, name) VALUES (1,'a') "
+                                          "ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name;\n")
+
+    def test_watermark_column_falls_back_to_auto_increment(self):
+        db = connected(mysql, [], [])
+        db.connection.cursor.return_value.fetchall.return_value = [('id', 'int', 'auto_increment'),
+                                                                   ('name', 'varchar', '')]
+
+        self.assertEqual(db.get_watermark_column(table='actor'), ('id', 'sequence'))
+
+
+class TestKeyRanges(unittest.TestCase):
+
+    def test_mysql_part_selects_rows_of_key_range(self):
+        db = connected(mysql, ['id'], [[(101,)]])
+
+        db.get_table_data(sink=io.StringIO(), custom_table='payment',
+                          key_range={'column': 'payment_id', 'start': 101, 'end': 201})
+        db.connection.cursor.return_value.execute.assert_called_with(
+            'SELECT * FROM `payment` WHERE `payment_id` >= %s AND `payment_id` < %s', (101, 201))
+
+    def test_postgresql_open_range_selects_rows_after_start(self):
+        db = connected(postgresql, ['id'], [[(201,)]])
+
+        db.get_table_data(sink=io.StringIO(), custom_table='payment',
+                          key_range={'column': 'payment_id', 'start': 201, 'end': None})
+        db.connection.cursor.return_value.execute.assert_called_with(
+            'SELECT * FROM payment WHERE payment_id >= %s', (201,))
+
+    def test_mysql_key_range_needs_single_integer_primary_key(self):
+        db = connected(mysql, [], [])
+        cursor = db.connection.cursor.return_value
+        cursor.fetchall.return_value = [('payment_id', 'smallint')]
+        cursor.fetchone.return_value = (1, 16049)
+        self.assertEqual(db.get_key_range('payment'), {'column': 'payment_id', 'min': 1, 'max': 16049})
+
+        cursor.fetchall.return_value = [('film_id', 'smallint'), ('actor_id', 'smallint')]
+        self.assertIsNone(db.get_key_range('film_actor'))
+
+class TestKeysetPages(unittest.TestCase):
+
+    def test_mysql_pages_continue_after_last_key(self):
+        db = connected(mysql, ['id', 'name'], [[(1, 'a'), (2, 'b')], [], [(3, 'c')]], page_size=2)
+        cursor = db.connection.cursor.return_value
+        cursor.fetchall.return_value = [('id',)]
+        sink = io.StringIO()
+
+        self.assertEqual(db.get_table_data(sink=sink, custom_table='test'), 3)
+        self.assertEqual(cursor.execute.call_args_list[-2:], [
+            call('SELECT * FROM `test` ORDER BY `id` LIMIT 2', None),
+            call('SELECT * FROM `test` WHERE `id` > %s ORDER BY `id` LIMIT 2', (2,)),
+        ])
+        self.assertIn("(1,'a'),\n(2,'b'),\n(3,'c');", sink.getvalue())
+
+    def test_postgresql_composite_key_pages_keep_filters(self):
+        db = connected(postgresql, ['film_id', 'actor_id'], [[(1, 5), (1, 9)], [], []], page_size=2)
+        cursor = db.connection.cursor.return_value
+        cursor.fetchall.return_value = [('film_id',), ('actor_id',)]
+
+        db.get_table_data(sink=io.StringIO(), custom_table='film_actor',
+                          key_range={'column': 'film_id', 'start': 1, 'end': None})
+        self.assertEqual(cursor.execute.call_args_list[-1], call(
+            'SELECT * FROM film_actor WHERE film_id >= %s AND (film_id, actor_id) > (%s, %s) '
+            'ORDER BY film_id, actor_id LIMIT 2', (1, 1, 9)))
+
+    def test_mysql_composite_key_comparison_is_expanded(self):
+        db = connected(mysql, ['film_id', 'actor_id'], [[(1, 5), (1, 9)], [], []], page_size=2)
+        cursor = db.connection.cursor.return_value
+        cursor.fetchall.return_value = [('film_id',), ('actor_id',)]
+
+        db.get_table_data(sink=io.StringIO(), custom_table='film_actor')
+        self.assertEqual(cursor.execute.call_args_list[-1], call(
+            'SELECT * FROM `film_actor` WHERE `film_id` >= %s AND ((`film_id` > %s) OR '
+            '(`film_id` = %s AND `actor_id` > %s)) ORDER BY `film_id`, `actor_id` LIMIT 2', (1, 1, 1, 9)))
+
+    def test_table_without_primary_key_is_read_with_one_query(self):
+        db = connected(mysql, ['id'], [[(1,)]], page_size=2)
+        cursor = db.connection.cursor.return_value
+        cursor.fetchall.return_value = []
+
+        db.get_table_data_bulk(sink=io.BytesIO(), custom_table='log', data_format='tsv')
+        cursor.execute.assert_called_with('SELECT * FROM `log`', None)
+
+class TestColumnarData(unittest.TestCase):
+
+    def test_mysql_columnar_data_is_inserted_with_parameters(self):
+        db = connected(mysql, ['id', 'name'], [[(1, 'a'), (2, "O'Neil")], [(3, None)]])
+        sink = io.BytesIO()
+
+        self.assertEqual(db.get_table_data_bulk(sink=sink, custom_table='actor', data_format='columnar'), 3)
+        sink.seek(0)
+        db.restore_table_data_bulk(source=sink, table='actor', data_format='columnar')
+
+        cursor = db.connection.cursor.return_value
+        self.assertEqual(cursor.executemany.call_args_list[0].args,
+                         ('INSERT INTO `actor` (`id`, `name`) VALUES (%s, %s)', [(1, 'a'), (2, "O'Neil")]))
+        self.assertEqual(cursor.executemany.call_args_list[1].args[1], [(3, None)])
+
+    def test_postgresql_json_arrays_are_not_written_as_arrays(self):
+        db = connected(postgresql, [('id', 23), ('tags', 1007), ('doc', 3802)], [[(1, [1, 2], [1, 2])]])
+        sink = io.BytesIO()
+
+        db.get_table_data_bulk(sink=sink, custom_table='film', data_format='columnar')
+        sink.seek(0)
+
+        self.assertEqual(list(read_columnar(sink)[1]), [[(1, '{"1","2"}', '[1, 2]')]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.executor import StatementExecutor, encoded_size
+from src.models.database import database
+from src.models.mysql_database import mysql
+
+
+class FakeDatabase:
+    """
+    Records round trips, a round trip fails when it holds a statement containing FAIL
+    """
+    unbatched_statement = database.unbatched_statement
+
+    def __init__(self):
+        self.round_trips = []
+        self.connection = MagicMock()
+
+    def get_max_statement_size(self):
+        return 1024
+
+    def execute_batch(self, statements):
+        self.round_trips.append(statements)
+        if any('FAIL' in statement for statement in statements):
+            raise RuntimeError('statement failed')
+
+
+class TestStatementExecutor(unittest.TestCase):
+
+    def test_statements_are_sent_in_batches(self):
+        db = FakeDatabase()
+        executor = StatementExecutor(db=db, statements_per_batch=2)
+
+        self.assertEqual(executor.run([f'INSERT INTO t VALUES ({i})' for i in range(3)]), 0)
+        self.assertEqual(db.round_trips, [
+            ['SAVEPOINT restore_batch', 'INSERT INTO t VALUES (0)', 'INSERT INTO t VALUES (1)',
+             'RELEASE SAVEPOINT restore_batch'],
+            ['SAVEPOINT restore_batch', 'INSERT INTO t VALUES (2)', 'RELEASE SAVEPOINT restore_batch'],
+        ])
+        db.connection.commit.assert_called_once()
+
+    def test_batch_fits_statement_size(self):
+        db = FakeDatabase()
+        StatementExecutor(db=db, statements_per_batch=100).run(['x' * 400, 'y' * 400, 'z' * 400])
+
+        self.assertEqual([len(trip) for trip in db.round_trips], [4, 3])
+
+    def test_large_statement_is_not_joined_into_batch(self):
+        db = FakeDatabase()
+        large = 'INSERT ' + 'x' * 2000
+        StatementExecutor(db=db).run(['INSERT 1', large, 'INSERT 2'])
+
+        self.assertEqual(len(db.round_trips), 2)
+        self.assertNotIn(large, [statement for trip in db.round_trips for statement in trip])
+        self.assertEqual([call.args[0] for call in db.connection.cursor.return_value.execute.call_args_list],
+                         ['SAVEPOINT restore_batch', large, 'RELEASE SAVEPOINT restore_batch'])
+
+    def test_failed_statement_is_isolated(self):
+        db = FakeDatabase()
+        executor = StatementExecutor(db=db)
+
+        self.assertEqual(executor.run(['INSERT 1', 'INSERT FAIL', 'INSERT 3']), 1)
+        self.assertEqual(executor.executed, 2)
+        self.assertEqual(db.round_trips[1], ['ROLLBACK TO SAVEPOINT restore_batch', 'RELEASE SAVEPOINT restore_batch'])
+        retried = [trip[1] for trip in db.round_trips[2:] if trip[0] == 'SAVEPOINT restore_batch']
+        self.assertEqual(retried, ['INSERT 1', 'INSERT FAIL', 'INSERT 3'])
+
+    def test_commit_interval(self):
+        db = FakeDatabase()
+        StatementExecutor(db=db, statements_per_batch=2, statements_per_commit=4).run(['INSERT'] * 9)
+
+        # two intermediate commits after 4 and 8 statements and the final one
+        self.assertEqual(db.connection.commit.call_count, 3)
+
+    def test_commits_report_processed_statements(self):
+        db = FakeDatabase()
+        committed = []
+        StatementExecutor(db=db, statements_per_batch=2, statements_per_commit=4,
+                          on_commit=committed.append).run(['INSERT 1', 'FAIL 2', 'INSERT 3', 'INSERT 4', 'INSERT 5'])
+
+        self.assertEqual(committed, [4, 5])
+
+    def test_transaction_control_is_not_batched(self):
+        db = FakeDatabase()
+        StatementExecutor(db=db).run(['INSERT 1', '-- end of table\nCOMMIT', 'INSERT 2'])
+
+        self.assertEqual(len(db.round_trips), 2)
+        db.connection.cursor.return_value.execute.assert_called_once_with('-- end of table\nCOMMIT')
+
+    def test_encoded_size_of_big_statement(self):
+        statement = "INSERT INTO t VALUES ('ü€😀')" * 10000
+
+        self.assertEqual(encoded_size(statement), len(statement.encode('utf-8')))
+        self.assertEqual(encoded_size('SELECT 1'), 8)
+
+    def test_mysql_implicit_commit_is_not_batched(self):
+        self.assertTrue(mysql.unbatched_statement.match('CREATE TABLE `t` (id INT)'))
+        self.assertTrue(mysql.unbatched_statement.match('/* structure */ drop table t'))
+        self.assertFalse(mysql.unbatched_statement.match('INSERT INTO `created` VALUES (1)'))
+        self.assertFalse(database.unbatched_statement.match('CREATE TABLE t (id INT)'))
+
+
+if __name__ == '__main__':
+    unittest.main()
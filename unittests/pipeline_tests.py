@@ -0,0 +1,99 @@
+import io
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.pipeline import BackgroundWriter, ordered_map, prefetch
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_items_are_read_on_background_thread_in_order(self):
+        threads = []
+
+        def items():
+            for item in range(10):
+                threads.append(threading.current_thread())
+                yield item
+
+        self.assertEqual(list(prefetch(items(), depth=2)), list(range(10)))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_error_of_iterable_is_raised_in_consumer(self):
+        def items():
+            yield 1
+            raise ValueError('connection lost')
+
+        iterator = prefetch(items(), depth=2)
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaisesRegex(ValueError, 'connection lost'):
+            next(iterator)
+
+    def test_stopped_consumer_stops_background_thread(self):
+        read = []
+
+        def items():
+            for item in range(1000):
+                read.append(item)
+                yield item
+
+        iterator = prefetch(items(), depth=2)
+        next(iterator)
+        iterator.close()
+        self.assertLess(len(read), 10)
+
+
+class TestOrderedMap(unittest.TestCase):
+
+    def test_results_keep_order_of_items(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(ordered_map(lambda item: item * 2, range(100), executor=executor, max_pending=8))
+        self.assertEqual(results, [item * 2 for item in range(100)])
+
+
+class TestBackgroundWriter(unittest.TestCase):
+
+    def test_writes_reach_sink_in_order(self):
+        sink = io.BytesIO()
+        sink.close = lambda: None
+        writer = io.BufferedWriter(BackgroundWriter(raw=sink, max_bytes=8), buffer_size=4)
+        for index in range(100):
+            writer.write(f'{index},'.encode())
+        writer.close()
+        self.assertEqual(sink.getvalue(), ''.join(f'{index},' for index in range(100)).encode())
+
+    def test_queued_bytes_are_bounded(self):
+        written = threading.Event()
+        pending = []
+
+        class Slow(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, data):
+                written.wait()
+                return len(data)
+
+        writer = BackgroundWriter(raw=Slow(), max_bytes=8)
+        writer.write(b'12345678')
+        blocked = threading.Thread(target=lambda: pending.append(writer.write(b'9')))
+        blocked.start()
+        blocked.join(timeout=0.2)
+        self.assertTrue(blocked.is_alive())
+        written.set()
+        blocked.join()
+        writer.close()
+        self.assertEqual(pending, [1])
+
+    def test_sink_error_is_raised_on_close(self):
+        class Broken(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, data):
+                raise OSError('disk full')
+
+        writer = BackgroundWriter(raw=Broken(), max_bytes=8)
+        writer.write(b'data')
+        with self.assertRaisesRegex(OSError, 'disk full'):
+            writer.close()
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.pool import ConnectionPool
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_connection_is_reused(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect=connect, max_size=2)
+
+        with pool.acquire() as first:
+            pass
+        with pool.acquire() as second:
+            pass
+
+        self.assertIs(first, second)
+        connect.assert_called_once()
+
+    def test_connections_are_opened_up_to_max_size(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect=connect, max_size=2)
+
+        first = pool.get()
+        second = pool.get()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(connect.call_count, 2)
+
+    def test_failed_connection_is_discarded(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect=connect, max_size=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.acquire() as broken:
+                raise RuntimeError('Lost connection')
+        with pool.acquire() as db:
+            pass
+
+        self.assertIsNot(broken, db)
+        broken.connection.close.assert_called_once()
+
+    def test_close_closes_all_connections(self):
+        pool = ConnectionPool(connect=lambda: MagicMock(), max_size=2)
+        first = pool.get()
+        second = pool.get()
+        pool.put(first)
+
+        pool.close()
+
+        first.connection.close.assert_called_once()
+        second.connection.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from src.progress import Progress, format_duration, format_size, prometheus_metrics, write_metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stream = io.StringIO()
+        self.progress = Progress(estimates={'actor': {'rows': 100, 'bytes': 5000},
+                                            'film': {'rows': 300, 'bytes': 9000}},
+                                 interval=5, clock=self.clock, stream=self.stream)
+
+    def test_eta_uses_rows_left_by_estimates_and_rate_so_far(self):
+        self.assertIsNone(self.progress.eta(self.clock()))
+
+        self.progress.advance('actor', 50)
+        self.clock.now += 10
+        # 50 rows in 10 seconds, 50 rows of actor and 300 rows of film are left
+        self.assertEqual(self.progress.eta(self.clock()), 70)
+
+        self.progress.finish_table('actor', rows=100, size=4000)
+        self.assertEqual(self.progress.eta(self.clock()), 30)
+
+    def test_progress_is_reported_once_per_interval(self):
+        self.progress.advance('actor', 10)
+        self.clock.now += 6
+        self.progress.advance('actor', 20)
+        self.clock.now += 1
+        self.progress.advance('actor', 20)
+        self.assertEqual(self.stream.getvalue(), 'actor: 30/100 rows (30%), 5 rows/s, ETA 0:01:14\n')
+
+    def test_metrics_hold_tables_and_phases(self):
+        with self.progress.phase('dump'):
+            self.progress.advance('actor', 100)
+            self.clock.now += 4
+            self.progress.finish_table('actor', size=2048)
+
+        self.assertEqual(self.progress.metrics(), {
+            'seconds': 4.0,
+            'rows': 100,
+            'bytes': 2048,
+            'phases': {'dump': 4.0},
+            'tables': {'actor': {'rows': 100, 'bytes': 2048, 'seconds': 4.0, 'rows_per_second': 25.0,
+                                 'estimated_rows': 100, 'estimated_bytes': 5000}},
+        })
+
+    def test_formatting(self):
+        self.assertEqual(format_duration(3725.4), '1:02:05')
+        self.assertEqual(format_duration(None), 'unknown')
+        self.assertEqual(format_size(512), '512 B')
+        self.assertEqual(format_size(3 * 1024 * 1024), '3.0 MiB')
+
+
+class TestMetricsFiles(unittest.TestCase):
+    metrics = {
+        'seconds': 4.0, 'rows': 100, 'bytes': 2048, 'finished': 1700000000, 'phases': {'dump': 3.5},
+        'tables': {'actor': {'rows': 100, 'bytes': 2048, 'seconds': 3.0, 'rows_per_second': 33.3,
+                             'estimated_rows': 90, 'estimated_bytes': 4096}},
+    }
+
+    def test_prometheus_text_format(self):
+        text = prometheus_metrics(self.metrics, labels={'database': 'sakila', 'db_type': 'mysql'})
+
+        self.assertIn('# TYPE backdb_backup_duration_seconds gauge\n'
+                      'backdb_backup_duration_seconds{database="sakila",db_type="mysql"} 4.0\n', text)
+        self.assertIn('backdb_backup_phase_duration_seconds{database="sakila",db_type="mysql",phase="dump"} 3.5\n',
+                      text)
+        self.assertIn('backdb_backup_table_bytes{database="sakila",db_type="mysql",table="actor"} 2048\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_metrics_files_are_written(self):
+        with tempfile.TemporaryDirectory() as folder:
+            write_metrics(folder=folder, name='sakila-mysql', metrics=self.metrics, labels={'database': 'sakila'})
+
+            self.assertEqual(sorted(os.listdir(folder)), ['sakila-mysql.json', 'sakila-mysql.prom'])
+            with open(os.path.join(folder, 'sakila-mysql.json')) as f:
+                self.assertEqual(json.load(f), self.metrics)
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.backup import Backup
+from src.prune import Prune
+
+
+class TestPrune(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def version(self, version, manifest, chunks=()):
+        os.makedirs(f'{self.folder}/{version}')
+        with open(f'{self.folder}/{version}/manifest.json', 'w') as f:
+            json.dump(dict(manifest, chunks={'actor.DML.sql': list(chunks)}), f)
+        for digest in chunks:
+            os.makedirs(f'{self.folder}/chunks/{digest[:2]}', exist_ok=True)
+            with open(f'{self.folder}/chunks/{digest[:2]}/{digest}', 'w') as f:
+                f.write(digest)
+            os.utime(f'{self.folder}/chunks/{digest[:2]}/{digest}', (0, 0))
+
+    def test_old_versions_and_their_chunks_are_removed(self):
+        self.version('1690000000', {'type': 'full'}, chunks=['aa01', 'bb01'])
+        self.version('1691000000', {'type': 'full'}, chunks=['aa01', 'cc01'])
+        self.version('1692000000', {'type': 'incremental', 'base': '1691000000'}, chunks=['dd01'])
+
+        result = Prune(database_name='test_db', db_type='mysql', file=self.folder, keep=1).prune()
+
+        self.assertEqual(result, 'Removed 1 versions and 1 chunks of test_db')
+        self.assertEqual(sorted(os.listdir(self.folder)), ['1691000000', '1692000000', 'chunks'])
+        self.assertFalse(os.path.exists(f'{self.folder}/chunks/bb/bb01'))
+        self.assertTrue(os.path.exists(f'{self.folder}/chunks/aa/aa01'))
+
+    def test_chunks_of_interrupted_backup_are_kept_for_resume(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.folder)
+        mock_db = MagicMock()
+        mock_db.get_all_tables.return_value = ['actor', 'film']
+        mock_db.get_table.return_value = 'CREATE TABLE t;'
+        mock_db.get_grants.return_value = ''
+        mock_db.get_table_estimates.return_value = {}
+
+        def dump(sink, custom_table, key_range):
+            if custom_table == 'film':
+                raise ConnectionError('server has gone away')
+            sink.write(f'INSERT INTO {custom_table};')
+            return 1
+
+        mock_db.get_table_data.side_effect = dump
+        backup = Backup(db_type='mysql', database_name='test_db', connection_string='test_conn',
+                        is_save_multiple=True, chunked=True)
+        with patch('src.backup.mysql.mysql', return_value=mock_db), self.assertRaises(ConnectionError):
+            backup.backup_database()
+        chunks = 'backup/test_db-mysql/chunks'
+        for prefix in os.listdir(chunks):
+            for name in os.listdir(f'{chunks}/{prefix}'):
+                os.utime(f'{chunks}/{prefix}/{name}', (0, 0))
+
+        Prune(database_name='test_db', db_type='mysql').prune()
+
+        mock_db.get_table_data.side_effect = lambda sink, custom_table, key_range: sink.write('INSERT INTO film;') and 1
+        resumed = Backup(db_type='mysql', database_name='test_db', connection_string='test_conn',
+                         is_save_multiple=True, chunked=True, resume=True)
+        with patch('src.backup.mysql.mysql', return_value=mock_db):
+            resumed.backup_database()
+        digest = resumed.chunk_files['actor.DML.sql'][0]
+        with open(f'{chunks}/{digest[:2]}/{digest}') as f:
+            self.assertEqual(f.read(), 'INSERT INTO actor;')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,23 @@
+import json
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 import os
+from src.compression import ParallelCompressor
 from src.restore import Restore  # Assuming your class is stored in restore.py
 
 
 class TestRestore(unittest.TestCase):
 
+    def setUp(self):
+        # Backup folders of these restores are mocked, checkpoint journal is not written either
+        checkpoint = patch('src.restore.Checkpoint')
+        checkpoint.start().return_value.records = []
+        self.addCleanup(checkpoint.stop)
+
+    @patch('os.path.isdir', return_value=True)
     @patch('os.listdir')
-    def test_restore_init_without_backup_version_mysql(self, mock_listdir):
+    def test_restore_init_without_backup_version_mysql(self, mock_listdir, mock_isdir):
         # Mocking os.listdir to return some backup versions for MySQL
         mock_listdir.return_value = ['backup_v1', 'backup_v2']
 
@@ -18,8 +28,9 @@ class TestRestore(unittest.TestCase):
         self.assertEqual(restore.backup_version, 'backup_v2')
         mock_listdir.assert_called_once_with(f'backup/test_db-mysql')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('os.listdir')
-    def test_restore_init_without_backup_version_postgresql(self, mock_listdir):
+    def test_restore_init_without_backup_version_postgresql(self, mock_listdir, mock_isdir):
         # Mocking os.listdir to return some backup versions for PostgreSQL
         mock_listdir.return_value = ['backup_v1', 'backup_v2']
 
@@ -41,10 +52,11 @@ class TestRestore(unittest.TestCase):
         # os.listdir should not be called when backup_version is provided
         mock_listdir.assert_not_called()
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_database_structure_mysql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_database_structure_mysql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files with timestamped versions for MySQL
         mock_listdir.side_effect = [
             ['1690000000', '1691000000'],  # First call simulates backup versions (timestamps)
@@ -55,21 +67,23 @@ class TestRestore(unittest.TestCase):
         restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql', restore_type='structure')
 
         # Simulate reading from the file
-        mock_file.return_value.read.return_value = 'CREATE TABLE test;'
+        mock_file.return_value.read.side_effect = [b'CREATE TABLE test;', b'']
 
         # Call restore_database and check behavior
         result = restore.restore_database()
 
         # Check if the correct SQL file was read and the SQL command was passed to restore_sql
-        mock_file.assert_called_with('backup/test_db-mysql/1691000000/test_db-structure.DDL.sql', 'r')
-        mock_restore_sql.assert_called_once_with(sql='CREATE TABLE test;')
+        mock_file.assert_called_with('backup/test_db-mysql/1691000000/test_db-structure.DDL.sql', 'rb')
+        mock_restore_sql.assert_called_once()
+        self.assertEqual(list(mock_restore_sql.call_args.kwargs['sql']), ['CREATE TABLE test'])
 
         self.assertEqual(result, 'Restored test_db database structure')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_database_structure_postgresql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_database_structure_postgresql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files with timestamped versions for PostgreSQL
         mock_listdir.side_effect = [
             ['1690000000', '1691000000'],  # First call simulates backup versions (timestamps)
@@ -80,21 +94,23 @@ class TestRestore(unittest.TestCase):
         restore = Restore(database_name='test_db', connection_string='test_connection', db_type='postgresql', restore_type='structure')
 
         # Simulate reading from the file
-        mock_file.return_value.read.return_value = 'CREATE TABLE test;'
+        mock_file.return_value.read.side_effect = [b'CREATE TABLE test;', b'']
 
         # Call restore_database and check behavior
         result = restore.restore_database()
 
         # Check if the correct SQL file was read and the SQL command was passed to restore_sql
-        mock_file.assert_called_with('backup/test_db-postgresql/1691000000/test_db-structure.DDL.sql', 'r')
-        mock_restore_sql.assert_called_once_with(sql='CREATE TABLE test;')
+        mock_file.assert_called_with('backup/test_db-postgresql/1691000000/test_db-structure.DDL.sql', 'rb')
+        mock_restore_sql.assert_called_once()
+        self.assertEqual(list(mock_restore_sql.call_args.kwargs['sql']), ['CREATE TABLE test'])
 
         self.assertEqual(result, 'Restored test_db database structure')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_database_data_mysql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_database_data_mysql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files with timestamped versions for MySQL
         mock_listdir.side_effect = [
             ['1690000000', '1691000000'],  # First call simulates backup versions (timestamps)
@@ -105,21 +121,23 @@ class TestRestore(unittest.TestCase):
         restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql', restore_type='data')
 
         # Simulate reading from the file
-        mock_file.return_value.read.return_value = 'INSERT INTO test VALUES (1);'
+        mock_file.return_value.read.side_effect = [b'INSERT INTO test VALUES (1);', b'']
 
         # Call restore_database and check behavior
         result = restore.restore_database()
 
         # Check if the correct SQL file was read and the SQL command was passed to restore_sql
-        mock_file.assert_called_with('backup/test_db-mysql/1691000000/test_db-data.DML.sql', 'r')
-        mock_restore_sql.assert_called_once_with(sql='INSERT INTO test VALUES (1);')
+        mock_file.assert_called_with('backup/test_db-mysql/1691000000/test_db-data.DML.sql', 'rb')
+        mock_restore_sql.assert_called_once()
+        self.assertEqual(list(mock_restore_sql.call_args.kwargs['sql']), ['INSERT INTO test VALUES (1)'])
 
         self.assertEqual(result, 'Restored test_db database data')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_database_data_postgresql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_database_data_postgresql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files with timestamped versions for PostgreSQL
         mock_listdir.side_effect = [
             ['1690000000', '1691000000'],  # First call simulates backup versions (timestamps)
@@ -130,21 +148,23 @@ class TestRestore(unittest.TestCase):
         restore = Restore(database_name='test_db', connection_string='test_connection', db_type='postgresql', restore_type='data')
 
         # Simulate reading from the file
-        mock_file.return_value.read.return_value = 'INSERT INTO test VALUES (1);'
+        mock_file.return_value.read.side_effect = [b'INSERT INTO test VALUES (1);', b'']
 
         # Call restore_database and check behavior
         result = restore.restore_database()
 
         # Check if the correct SQL file was read and the SQL command was passed to restore_sql
-        mock_file.assert_called_with('backup/test_db-postgresql/1691000000/test_db-data.DML.sql', 'r')
-        mock_restore_sql.assert_called_once_with(sql='INSERT INTO test VALUES (1);')
+        mock_file.assert_called_with('backup/test_db-postgresql/1691000000/test_db-data.DML.sql', 'rb')
+        mock_restore_sql.assert_called_once()
+        self.assertEqual(list(mock_restore_sql.call_args.kwargs['sql']), ['INSERT INTO test VALUES (1)'])
 
         self.assertEqual(result, 'Restored test_db database data')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_full_database_mysql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_full_database_mysql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files for MySQL
         mock_listdir.return_value = ['test_db-structure.DDL.sql', 'test_db-data.DML.sql', 'test_db-privileges.DCL.sql']
 
@@ -153,9 +173,9 @@ class TestRestore(unittest.TestCase):
 
         # Simulate reading from the files
         mock_file.return_value.read.side_effect = [
-            'CREATE TABLE test;',  # DDL
-            'INSERT INTO test VALUES (1);',  # DML
-            'GRANT ALL PRIVILEGES;'  # DCL
+            b'CREATE TABLE test;', b'',  # DDL
+            b'INSERT INTO test VALUES (1);', b'',  # DML
+            b'GRANT ALL PRIVILEGES;', b''  # DCL
         ]
 
         # Call restore_database and check behavior
@@ -166,16 +186,16 @@ class TestRestore(unittest.TestCase):
         self.assertEqual(mock_restore_sql.call_count, 3)
 
         # Ensure the SQL from all types were passed to restore_sql
-        mock_restore_sql.assert_any_call(sql='CREATE TABLE test;')
-        mock_restore_sql.assert_any_call(sql='INSERT INTO test VALUES (1);')
-        mock_restore_sql.assert_any_call(sql='GRANT ALL PRIVILEGES;')
+        statements = [list(call.kwargs['sql']) for call in mock_restore_sql.call_args_list]
+        self.assertEqual(statements, [['CREATE TABLE test'], ['INSERT INTO test VALUES (1)'], ['GRANT ALL PRIVILEGES']])
 
         self.assertEqual(result, 'Restored test_db database')
 
+    @patch('os.path.isdir', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.listdir')
     @patch.object(Restore, 'restore_sql')
-    def test_restore_full_database_postgresql(self, mock_restore_sql, mock_listdir, mock_file):
+    def test_restore_full_database_postgresql(self, mock_restore_sql, mock_listdir, mock_file, mock_isdir):
         # Mock os.listdir to simulate backup files for PostgreSQL
         mock_listdir.return_value = ['test_db-structure.DDL.sql', 'test_db-data.DML.sql', 'test_db-privileges.DCL.sql']
 
@@ -184,9 +204,9 @@ class TestRestore(unittest.TestCase):
 
         # Simulate reading from the files
         mock_file.return_value.read.side_effect = [
-            'CREATE TABLE test;',  # DDL
-            'INSERT INTO test VALUES (1);',  # DML
-            'GRANT ALL PRIVILEGES;'  # DCL
+            b'CREATE TABLE test;', b'',  # DDL
+            b'INSERT INTO test VALUES (1);', b'',  # DML
+            b'GRANT ALL PRIVILEGES;', b''  # DCL
         ]
 
         # Call restore_database and check behavior
@@ -197,12 +217,293 @@ class TestRestore(unittest.TestCase):
         self.assertEqual(mock_restore_sql.call_count, 3)
 
         # Ensure the SQL from all types were passed to restore_sql
-        mock_restore_sql.assert_any_call(sql='CREATE TABLE test;')
-        mock_restore_sql.assert_any_call(sql='INSERT INTO test VALUES (1);')
-        mock_restore_sql.assert_any_call(sql='GRANT ALL PRIVILEGES;')
+        statements = [list(call.kwargs['sql']) for call in mock_restore_sql.call_args_list]
+        self.assertEqual(statements, [['CREATE TABLE test'], ['INSERT INTO test VALUES (1)'], ['GRANT ALL PRIVILEGES']])
+
+        self.assertEqual(result, 'Restored test_db database')
+
+
+    @patch('os.path.isdir', return_value=True)
+    @patch('os.listdir')
+    @patch.object(Restore, 'restore_bulk')
+    @patch.object(Restore, 'restore_sql')
+    def test_restore_full_database_copy_format_postgresql(self, mock_restore_sql, mock_restore_bulk, mock_listdir, mock_isdir):
+        # Table data saved with --format copy lives in separate per-table files
+        mock_listdir.return_value = ['test.DDL.sql', 'test.DML.copy', 'test_db.DCL.sql']
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='postgresql')
+
+        with patch('builtins.open', mock_open(read_data=b'CREATE TABLE test;')):
+            result = restore.restore_database()
 
+        mock_restore_bulk.assert_called_once_with(path=f'backup/test_db-postgresql/{restore.backup_version}/test.DML.copy',
+                                                  data_format='copy')
+        self.assertEqual(mock_restore_sql.call_count, 2)
         self.assertEqual(result, 'Restored test_db database')
 
 
+    @patch.object(Restore, 'restore_bulk')
+    @patch.object(Restore, 'restore_sql')
+    def test_restore_file_tsv_format_mysql(self, mock_restore_sql, mock_restore_bulk):
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          backup_version='1691000000')
+
+        restore.restore_file(path='backup/test_db-mysql/1691000000/film.DML.tsv')
+
+        mock_restore_bulk.assert_called_once_with(path='backup/test_db-mysql/1691000000/film.DML.tsv', data_format='tsv')
+        mock_restore_sql.assert_not_called()
+
+    @patch.object(Restore, 'restore_bulk')
+    @patch.object(Restore, 'restore_sql')
+    def test_restore_file_compressed_tsv_format_mysql(self, mock_restore_sql, mock_restore_bulk):
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          backup_version='1691000000')
+
+        restore.restore_file(path='backup/test_db-mysql/1691000000/film.DML.tsv.gz')
+
+        mock_restore_bulk.assert_called_once_with(path='backup/test_db-mysql/1691000000/film.DML.tsv.gz',
+                                                  data_format='tsv')
+        mock_restore_sql.assert_not_called()
+
+    @patch.object(Restore, 'restore_file')
+    def test_restore_incremental_chain(self, mock_restore_file):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        versions = {
+            '1690000000': ({'type': 'full', 'base': None}, ['actor.DDL.sql', 'actor.DML.sql']),
+            '1691000000': ({'type': 'incremental', 'base': '1690000000'},
+                           ['actor.DDL.sql', 'actor.DML.sql', 'film.DDL.sql', 'film.DML.sql']),
+        }
+        for version, (manifest, files) in versions.items():
+            os.makedirs(f'{folder.name}/{version}')
+            with open(f'{folder.name}/{version}/manifest.json', 'w') as f:
+                json.dump(manifest, f)
+            for file in files:
+                open(f'{folder.name}/{version}/{file}', 'w').close()
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name, backup_version='1691000000')
+        result = restore.restore_database()
+
+        restored = [call.kwargs['path'].replace(folder.name + '/', '') for call in mock_restore_file.call_args_list]
+        self.assertEqual(restored[:3], ['1690000000/actor.DDL.sql', '1690000000/actor.DML.sql',
+                                        '1691000000/film.DDL.sql'])
+        self.assertEqual(sorted(restored[3:]), ['1691000000/actor.DML.sql', '1691000000/film.DML.sql'])
+        self.assertEqual(result, 'Restored test_db database')
+
+    @patch.object(Restore, 'restore_file')
+    def test_restore_reverse_delta_reads_unchanged_files_from_successor(self, mock_restore_file):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        versions = {
+            '1690000000': ({'type': 'reverse-delta', 'successor': '1691000000', 'same_as': ['actor.DDL.sql']},
+                           ['actor.DML.sql']),
+            '1691000000': ({'type': 'full', 'decremental': True}, ['actor.DDL.sql', 'actor.DML.sql']),
+        }
+        for version, (manifest, files) in versions.items():
+            os.makedirs(f'{folder.name}/{version}')
+            with open(f'{folder.name}/{version}/manifest.json', 'w') as f:
+                json.dump(manifest, f)
+            for file in files:
+                open(f'{folder.name}/{version}/{file}', 'w').close()
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name, backup_version='1690000000')
+        restore.restore_database()
+
+        restored = [call.kwargs['path'].replace(folder.name + '/', '') for call in mock_restore_file.call_args_list]
+        self.assertEqual(restored, ['1691000000/actor.DDL.sql', '1690000000/actor.DML.sql'])
+
+    def test_restore_init_picks_newest_version_numerically(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        for version in ('999999999', '1000000000', 'old-copy', 'chunks'):
+            os.makedirs(f'{folder.name}/{version}')
+        open(f'{folder.name}/notes.txt', 'w').close()
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name)
+
+        self.assertEqual(restore.backup_version, '1000000000')
+
+    @patch.object(Restore, 'restore_file')
+    def test_restore_table_is_planned_from_manifest(self, mock_restore_file):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        version = f'{folder.name}/1690000000'
+        os.makedirs(version)
+        files = {}
+        for table in ('film', 'film_actor'):
+            for kind in ('DDL', 'DML'):
+                name = f'{table}.{kind}.sql'
+                files[name] = {'file': name, 'table': table, 'kind': kind.lower(), 'format': 'sql', 'bytes': 1}
+                open(f'{version}/{name}', 'w').close()
+        with open(f'{version}/manifest.json', 'w') as f:
+            json.dump({'tables': {'order': ['film', 'film_actor'], 'foreign_keys': [['film_actor', 'film']]},
+                       'files': files}, f)
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name, backup_version='1690000000', table_name='film')
+        restore.restore_database()
+
+        restored = [os.path.basename(call.kwargs['path']) for call in mock_restore_file.call_args_list]
+        self.assertEqual(restored, ['film.DDL.sql', 'film.DML.sql'])
+
+    @patch.object(Restore, 'restore_file')
+    def test_table_parts_are_restored_as_one_table(self, mock_restore_file):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        version = f'{folder.name}/1690000000'
+        os.makedirs(version)
+        files = {}
+        for table, part in (('payment', 2), ('actor', None), ('payment', 1)):
+            name = f'{table}.DML.{part:04d}.sql' if part else f'{table}.DML.sql'
+            files[name] = {'file': name, 'table': table, 'kind': 'dml', 'format': 'sql', 'bytes': 1}
+            if part:
+                files[name]['part'] = part
+            open(f'{version}/{name}', 'w').close()
+        with open(f'{version}/manifest.json', 'w') as f:
+            json.dump({'tables': {'order': ['actor', 'payment'], 'foreign_keys': []}, 'files': files}, f)
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name, backup_version='1690000000', restore_type='data', jobs=2)
+        with patch('src.restore.RestoreScheduler') as mock_scheduler:
+            restore.restore_database()
+            tables = mock_scheduler.call_args.kwargs['tables']
+            task = mock_scheduler.return_value.run.call_args.args[0]
+            task('payment')
+
+        self.assertEqual(sorted(tables), ['actor', 'payment'])
+        restored = [os.path.basename(call.kwargs['path']) for call in mock_restore_file.call_args_list]
+        self.assertEqual(restored, ['payment.DML.0001.sql', 'payment.DML.0002.sql'])
+
+    def write_single_file(self, version, compressed):
+        structure = 'CREATE TABLE actor;\nCREATE TABLE film;\n'
+        data = 'INSERT INTO actor VALUES (1);\nINSERT INTO film VALUES (2);\n'
+        contents = ('DROP SCHEMA test_db;\n' + structure + data).encode()
+        sections = {}
+        for table, statement, kind in (('actor', 'CREATE TABLE actor;\n', 'ddl'),
+                                       ('film', 'CREATE TABLE film;\n', 'ddl'),
+                                       ('actor', 'INSERT INTO actor VALUES (1);\n', 'dml'),
+                                       ('film', 'INSERT INTO film VALUES (2);\n', 'dml')):
+            start = contents.index(statement.encode())
+            sections.setdefault(table, {})[kind] = [start, start + len(statement)]
+        entry = {'file': 'test_db.sql', 'table': None, 'kind': 'full', 'format': 'sql', 'sections': sections}
+        if compressed:
+            entry['file'] = 'test_db.sql.gz'
+            with ParallelCompressor(sink=open(f'{version}/test_db.sql.gz', 'wb'), compression='gzip', block_size=16,
+                                    on_close=entry.update) as f:
+                f.write(contents)
+        else:
+            with open(f'{version}/test_db.sql', 'wb') as f:
+                f.write(contents)
+        with open(f'{version}/manifest.json', 'w') as f:
+            json.dump({'files': {'test_db.sql': entry}}, f)
+
+    def test_restore_table_reads_only_its_sections_of_single_file(self):
+        for compressed in (False, True):
+            with self.subTest(compressed=compressed), \
+                    patch.object(Restore, 'restore_sql', side_effect=lambda sql, on_commit: restored.extend(sql)):
+                restored = []
+                folder = tempfile.TemporaryDirectory()
+                self.addCleanup(folder.cleanup)
+                os.makedirs(f'{folder.name}/1690000000')
+                self.write_single_file(f'{folder.name}/1690000000', compressed=compressed)
+
+                restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                                  file=folder.name, backup_version='1690000000', table_name='actor')
+                restore.restore_database()
+
+                self.assertEqual(restored, ['CREATE TABLE actor', 'INSERT INTO actor VALUES (1)'])
+
+    @patch.object(Restore, 'restore_sql')
+    def test_restore_chunked_version(self, mock_restore_sql):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        os.makedirs(f'{folder.name}/1690000000')
+        os.makedirs(f'{folder.name}/chunks/ab')
+        with open(f'{folder.name}/chunks/ab/ab01', 'wb') as f:
+            f.write(b'INSERT INTO test VALUES (1);')
+        with open(f'{folder.name}/1690000000/manifest.json', 'w') as f:
+            json.dump({'chunks': {'test.DML.sql': ['ab01']}}, f)
+
+        statements = []
+        mock_restore_sql.side_effect = lambda sql, on_commit: statements.extend(sql)
+
+        restore = Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                          file=folder.name)
+        result = restore.restore_database()
+
+        self.assertEqual(restore.backup_version, '1690000000')
+        self.assertEqual(statements, ['INSERT INTO test VALUES (1)'])
+        self.assertEqual(result, 'Restored test_db database')
+
+
+class TestResumeRestore(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.version = f'{folder.name}/1690000000'
+        os.makedirs(self.version)
+        files = {
+            'actor.DML.sql': 'INSERT INTO actor VALUES (1);',
+            'film.DML.sql': 'SET AUTOCOMMIT=0;\nINSERT INTO film VALUES (1);\nCOMMIT;\nINSERT INTO film VALUES (2);\nCOMMIT;',
+        }
+        for name, sql in files.items():
+            with open(f'{self.version}/{name}', 'w') as f:
+                f.write(sql)
+        with open(f'{self.version}/manifest.json', 'w') as f:
+            json.dump({'tables': {'order': ['actor', 'film'], 'foreign_keys': []},
+                       'files': {name: {'file': name, 'table': name.split('.')[0], 'kind': 'dml', 'format': 'sql'}
+                                 for name in files}}, f)
+        self.journal = f'{self.version}/restore-test_db.checkpoint.jsonl'
+
+    def restore(self, **kwargs):
+        return Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                       file=self.folder, backup_version='1690000000', restore_type='data', **kwargs)
+
+    @patch.object(Restore, 'restore_sql')
+    def test_interrupted_restore_records_committed_statements(self, mock_restore_sql):
+        def fail_on_film(sql, on_commit):
+            if any('film' in statement for statement in sql):
+                on_commit(2)
+                raise ConnectionError('server has gone away')
+            return True
+        mock_restore_sql.side_effect = fail_on_film
+
+        with self.assertRaises(ConnectionError):
+            self.restore().restore_database()
+
+        with open(self.journal) as f:
+            self.assertEqual([json.loads(line) for line in f], [
+                {'file': '1690000000/actor.DML.sql', 'done': True},
+                {'file': '1690000000/film.DML.sql', 'statements': 2},
+            ])
+
+    @patch.object(Restore, 'restore_sql')
+    def test_resumed_restore_skips_applied_statements(self, mock_restore_sql):
+        with open(self.journal, 'w') as f:
+            f.write('{"file": "1690000000/actor.DML.sql", "done": true}\n'
+                    '{"file": "1690000000/film.DML.sql", "statements": 3}\n')
+        statements = []
+        mock_restore_sql.side_effect = lambda sql, on_commit: statements.extend(sql)
+
+        self.restore(resume=True).restore_database()
+
+        self.assertEqual(statements, ['SET AUTOCOMMIT=0', 'INSERT INTO film VALUES (2)', 'COMMIT'])
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_interrupted_backup_version_is_not_restored(self):
+        os.makedirs(f'{self.folder}/1700000000')
+        open(f'{self.folder}/1700000000/backup.checkpoint.jsonl', 'w').close()
+
+        self.assertEqual(Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                                 file=self.folder).backup_version, '1690000000')
+        with self.assertRaises(ValueError):
+            Restore(database_name='test_db', connection_string='test_connection', db_type='mysql',
+                    file=self.folder, backup_version='1700000000').restore_database()
+
 if __name__ == '__main__':
     unittest.main()
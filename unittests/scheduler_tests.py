@@ -0,0 +1,70 @@
+import threading
+import unittest
+
+from src.scheduler import RestoreScheduler, dependency_order
+
+
+class TestRestoreScheduler(unittest.TestCase):
+
+    def test_referenced_tables_are_loaded_first(self):
+        loaded = []
+        lock = threading.Lock()
+
+        def load(table):
+            with lock:
+                loaded.append(table)
+
+        dependencies = [('film', 'language'), ('film_actor', 'film'), ('film_actor', 'actor')]
+        scheduler = RestoreScheduler(tables=['film_actor', 'film', 'actor', 'language'],
+                                     dependencies=dependencies, jobs=4)
+        scheduler.run(load)
+
+        self.assertEqual(sorted(loaded), ['actor', 'film', 'film_actor', 'language'])
+        for table, referenced_table in dependencies:
+            self.assertLess(loaded.index(referenced_table), loaded.index(table))
+
+    def test_independent_tables_are_loaded_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        # Every load waits for the other two, so this only finishes if all three run at once
+        scheduler = RestoreScheduler(tables=['actor', 'category', 'language'], dependencies=[], jobs=3)
+        scheduler.run(lambda table: barrier.wait())
+
+    def test_cyclic_and_unknown_dependencies(self):
+        loaded = []
+        dependencies = [('staff', 'store'), ('store', 'staff'), ('store', 'address'), ('staff', 'staff')]
+
+        scheduler = RestoreScheduler(tables=['staff', 'store'], dependencies=dependencies, jobs=2)
+        scheduler.run(loaded.append)
+
+        self.assertEqual(loaded, ['staff', 'store'])
+
+    def test_larger_ready_tables_are_loaded_first(self):
+        loaded = []
+
+        scheduler = RestoreScheduler(tables=['actor', 'payment', 'rental'], dependencies=[], jobs=1,
+                                     sizes={'actor': 10, 'payment': 3000, 'rental': 2000})
+        scheduler.run(loaded.append)
+
+        self.assertEqual(loaded, ['payment', 'rental', 'actor'])
+
+    def test_load_error_is_raised(self):
+        def load(table):
+            raise RuntimeError(f'Failed to load {table}')
+
+        scheduler = RestoreScheduler(tables=['actor'], dependencies=[], jobs=2)
+        with self.assertRaises(RuntimeError):
+            scheduler.run(load)
+
+
+class TestDependencyOrder(unittest.TestCase):
+
+    def test_referenced_tables_come_first(self):
+        dependencies = [('film', 'language'), ('film_actor', 'film'), ('film_actor', 'actor')]
+
+        self.assertEqual(dependency_order(tables=['film_actor', 'film', 'actor', 'language'], dependencies=dependencies),
+                         ['actor', 'language', 'film', 'film_actor'])
+
+
+if __name__ == '__main__':
+    unittest.main()
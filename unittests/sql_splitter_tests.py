@@ -0,0 +1,78 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.sql_splitter import StatementSplitter, split_sql, split_statements
+
+
+class TestStatementSplitter(unittest.TestCase):
+
+    def assertSplits(self, sql, dialect, expected):
+        self.assertEqual(list(split_sql(sql, dialect=dialect)), expected)
+        # Every token has to survive being cut by a chunk boundary
+        for chunk_size in (1, 2, 3, 7):
+            splitter = StatementSplitter(dialect=dialect, chunk_size=chunk_size)
+            self.assertEqual(list(splitter.split(io.BytesIO(sql.encode('utf-8')))), expected)
+
+    def test_semicolons_in_strings_and_identifiers(self):
+        self.assertSplits("INSERT INTO `a;b` VALUES ('x;y', 'it''s; ok', \"q\\\";\");SELECT 1;", 'mysql',
+                          ["INSERT INTO `a;b` VALUES ('x;y', 'it''s; ok', \"q\\\";\")", "SELECT 1"])
+
+    def test_comments(self):
+        self.assertSplits("-- first;\nSELECT 1; # second;\n/* third; */SELECT 2-1;", 'mysql',
+                          ["-- first;\nSELECT 1", "# second;\n/* third; */SELECT 2-1"])
+
+    def test_mysql_executable_comment_is_kept(self):
+        self.assertSplits("INSERT INTO t VALUES (/*!80003 0x3b*/);/* only comment */;", 'mysql',
+                          ["INSERT INTO t VALUES (/*!80003 0x3b*/)"])
+
+    def test_mysql_delimiter_command(self):
+        self.assertSplits("DELIMITER ;;\nCREATE TRIGGER t BEFORE INSERT ON a FOR EACH ROW BEGIN SET @x = 1; END;;\n"
+                          "DELIMITER ;\nSELECT 1;", 'mysql',
+                          ["CREATE TRIGGER t BEFORE INSERT ON a FOR EACH ROW BEGIN SET @x = 1; END", "SELECT 1"])
+
+    def test_mysql_delimiter_starting_with_special_character(self):
+        for delimiter in ('//', '$$', '--'):
+            with self.subTest(delimiter=delimiter):
+                self.assertSplits(f"DELIMITER {delimiter}\nCREATE PROCEDURE p() BEGIN SELECT 4/2; END{delimiter}\n"
+                                  "DELIMITER ;\nSELECT 1;", 'mysql',
+                                  ["CREATE PROCEDURE p() BEGIN SELECT 4/2; END", "SELECT 1"])
+
+    def test_sakila_schema_procedures_are_split(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', 'test-dbs', 'sakila-schema.sql'), 'rb') as f:
+            statements = list(split_statements(f, dialect='mysql'))
+
+        procedure = next(statement for statement in statements if statement.startswith('CREATE PROCEDURE rewards_report'))
+        self.assertTrue(procedure.endswith('END'))
+        self.assertNotIn('DELIMITER', procedure)
+
+    def test_postgresql_dollar_quoting_and_escapes(self):
+        self.assertSplits("CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;"
+                          "SELECT $$a;b$$, 'c\\', E'd\\';e';", 'postgresql',
+                          ["CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql",
+                           "SELECT $$a;b$$, 'c\\', E'd\\';e'"])
+
+    def test_postgresql_block_comments_nest(self):
+        self.assertSplits("SELECT 1 /* nested /* c */ ; */; SELECT 2;", 'postgresql',
+                          ["SELECT 1 /* nested /* c */ ; */", "SELECT 2"])
+        self.assertSplits("SELECT 1 /* nested /* c */ ; */; SELECT 2;", 'mysql',
+                          ["SELECT 1 /* nested /* c */", "*/", "SELECT 2"])
+
+    def test_large_file_is_scanned_through_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write("SELECT 'ü;';\nSELECT 2".encode('utf-8'))
+            f.flush()
+            f.seek(0)
+            with patch('src.sql_splitter.MMAP_THRESHOLD', 1), patch('src.sql_splitter.mmap.mmap') as mock_mmap:
+                mock_mmap.return_value.__enter__.return_value = f.read()
+                f.seek(0)
+                statements = list(split_statements(f, dialect='mysql'))
+
+        mock_mmap.assert_called_once()
+        self.assertEqual(statements, ["SELECT 'ü;'", "SELECT 2"])
+
+
+if __name__ == '__main__':
+    unittest.main()